@@ -1,15 +1,12 @@
 import tkinter as tk
-from tkinter import ttk, Menu, messagebox, simpledialog
+from tkinter import ttk, Menu, messagebox, simpledialog, filedialog
 import pyaudio
 import numpy as np
 from scipy.fft import fft, ifft
-from scipy.signal import butter, lfilter
 import threading
 import time
 import matplotlib
-import crcmod
 import os
-from reedsolo import RSCodec
 import logging
 import random
 import string
@@ -20,6 +17,12 @@ import queue
 from sklearn.neural_network import MLPClassifier
 import pickle
 from collections import Counter
+from dipper.filters import StreamingBandpass
+from dipper.codec import decode_fec
+from dipper.modem import Modem
+from dipper.modes import ModemConfig
+from dipper.offline import decode_file
+from dipper.symbols import CHAR_SOUNDS, WORD_SOUNDS, V4_REVERSE_MAP
 
 # Setup logging
 logging.basicConfig(filename='dipper_receive_v1.log', level=logging.DEBUG, 
@@ -38,39 +41,11 @@ CHUNK = 2048
 SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "receive_settings_v1.txt")
 AI_MODEL_FILE = os.path.join(os.path.dirname(__file__), "dipper_ai_model.pkl")
 
-# Updated tones for 300-2700 Hz (2400 Hz bandwidth)
-CHAR_SOUNDS = {
-    "A": [(300, 300, "tone")], "B": [(600, 600, "trill")], "C": [(900, 300, "slide")],
-    "D": [(1200, 1200, "tone")], "E": [(1500, 1500, "tone")], "F": [(1800, 2100, "slide")],
-    "G": [(300, 300, "trill")], "H": [(2100, 2100, "tone")], "I": [(2400, 2400, "tone")],
-    "J": [(600, 900, "slide")], "K": [(900, 900, "tone")], "L": [(1200, 1200, "trill")],
-    "M": [(1500, 1800, "slide")], "N": [(1800, 1200, "slide")], "O": [(2100, 2100, "tone")],
-    "P": [(2400, 2400, "trill")], "Q": [(2700, 2700, "tone")], "R": [(300, 300, "trill")],
-    "S": [(600, 900, "slide")], "T": [(900, 1200, "slide")], "U": [(1200, 1200, "tone")],
-    "V": [(1500, 1500, "trill")], "W": [(1800, 2100, "slide")], "X": [(2100, 2100, "trill")],
-    "Y": [(2400, 1800, "slide")], "Z": [(2700, 2700, "trill")],
-    "0": [(300, 600, "slide")], "1": [(600, 900, "slide")], "2": [(900, 1200, "slide")],
-    "3": [(1200, 1500, "slide")], "4": [(1500, 1800, "slide")], "5": [(1800, 2100, "slide")],
-    "6": [(2100, 2400, "slide")], "7": [(2400, 2700, "slide")], "8": [(2700, 2400, "slide")],
-    "9": [(300, 600, "slide")], "!": [(600, 900, "slide")], "/": [(900, 1200, "slide")],
-    "-": [(1200, 1200, "trill")], ".": [(1500, 1500, "tone")], " ": [(300, 300, "tone")],
-    "@": [(1800, 2100, "slide")]
-}
-
-WORD_SOUNDS = {
-    "CQ": [(300, 600, "slide")], "DE": [(900, 1200, "slide")],
-}
-
 SYMBOL_MAP = {**{char: i for i, char in enumerate(CHAR_SOUNDS.keys())},
               **{word: i + len(CHAR_SOUNDS) for i, word in enumerate(WORD_SOUNDS.keys())},
               "Robust_Preamble": len(CHAR_SOUNDS) + len(WORD_SOUNDS),
               "Robust+_Preamble": len(CHAR_SOUNDS) + len(WORD_SOUNDS) + 1}
 REVERSE_MAP = {i: char_or_word for char_or_word, i in SYMBOL_MAP.items()}
-V4_SYMBOLS = {0: "A", 1: "B", 2: "C", 3: "D", 4: "E", 5: "F", 6: "G", 7: "H",
-              8: "I", 9: "K", 10: "L", 11: "M", 12: "N", 13: "O", 14: "P", 15: "Q"}
-V4_REVERSE_MAP = {v: k for k, v in V4_SYMBOLS.items()}
-crc16 = crcmod.mkCrcFun(0x11021, initCrc=0, xorOut=0xFFFF)
-RS_CODEC = RSCodec(8)
 
 # End of part 1
 class DipperReceiveV1:
@@ -93,6 +68,9 @@ class DipperReceiveV1:
         self.sensitivity = tk.DoubleVar(value=50.0)
         self.signal_strength = tk.DoubleVar(value=0.0)
         self.filter_var = tk.StringVar(value="none")
+        self.rx_bandpass = StreamingBandpass(SAMPLE_RATE)
+        self.training_bandpass = StreamingBandpass(SAMPLE_RATE)
+        self.modem = Modem(ModemConfig(sample_rate=SAMPLE_RATE))
         self.colormap = tk.StringVar(value="viridis")
         self.current_mode = tk.StringVar(value="normal")
         self.text_queue = queue.Queue()
@@ -164,6 +142,7 @@ class DipperReceiveV1:
         settings_menu.add_checkbutton(label="Enable AI Decoding", variable=self.ai_enabled)
         settings_menu.add_command(label="Train AI Model", command=self.train_ai_popup)
         settings_menu.add_command(label="Save Training Data", command=self.save_training_data)
+        settings_menu.add_command(label="Decode Recording...", command=self.decode_recording)
 
         learning_menu = Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Learning", menu=learning_menu)
@@ -348,24 +327,18 @@ class DipperReceiveV1:
         self.text_lines = []
         logging.info("Text field cleared")
 
-    def butter_bandpass(self, lowcut, highcut, fs, order=5):
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='band')
-        return b, a
-
-    def apply_filter(self, data):
+    def apply_filter(self, data, bandpass=None):
         filter_type = self.filter_var.get()
         if filter_type == "none":
             logging.debug("No filter applied")
             return data
-        elif filter_type == "300-2700":
-            b, a = self.butter_bandpass(300, 2700, SAMPLE_RATE)
-            filtered = lfilter(b, a, data)
-            logging.debug(f"Applied 300-2700 Hz filter, data max: {np.max(filtered)}")
-            return filtered
-        return data
+        try:
+            filtered = (bandpass or self.rx_bandpass).process(data, filter_type)
+        except ValueError as e:
+            logging.error(f"Filter error: {e}")
+            return data
+        logging.debug(f"Applied {filter_type} Hz filter, data max: {np.max(filtered)}")
+        return filtered
 
     def generate_sound(self, pattern, duration=0.05):
         audio = np.array([], dtype=np.float32)
@@ -495,7 +468,7 @@ class DipperReceiveV1:
                     data = np.nan_to_num(data, nan=0.0, posinf=1.0, neginf=-1.0)
                 data = np.clip(data, -1.0, 1.0) * (self.input_volume.get() / 5.0)
                 logging.debug(f"Raw audio data min: {np.min(data)}, max: {np.max(data)}")
-                filtered_data = self.apply_filter(data)
+                filtered_data = self.apply_filter(data, self.training_bandpass)
                 spectrum = np.abs(fft(filtered_data))[:CHUNK//2]
                 features = self.extract_features(spectrum[:100])
                 self.ai_training_data.append(features)
@@ -727,8 +700,7 @@ class DipperReceiveV1:
             logging.info(f"{mode} accuracy: {self.accuracy[mode]:.2f}%")
 
     def receive_loop(self):
-        buffer = []
-        preamble_detected = False
+        packet_receivers = {name: self.modem.receiver(name) for name in ("robust", "robust_plus")}
         duration_map = {"normal": 0.1, "robust": 0.05, "robust_plus": 0.01}
         while self.running:
             try:
@@ -762,47 +734,30 @@ class DipperReceiveV1:
                     self.spectrum_data.put(spectrum)
                 self.last_spectrum = spectrum
 
-                if not preamble_detected and len(buffer) == 0:
-                    if mode == "robust" and self.detect_v4_preamble(filtered_data[:int(SAMPLE_RATE * 0.4)]):
-                        preamble_detected = True
-                        logging.info("Robust preamble detected")
-                        continue
-                    elif mode == "robust_plus" and self.detect_robust_plus_preamble(filtered_data[:int(SAMPLE_RATE * 0.4)]):
-                        preamble_detected = True
-                        logging.info("Robust+ preamble detected")
-                        continue
+                if mode in packet_receivers:
+                    # Packets are cut out of the sample stream at the preamble's timing, not built from per-chunk symbols
+                    for event in packet_receivers[mode].push(filtered_data):
+                        if event.kind == "preamble":
+                            logging.info(f"{mode} preamble detected (offset {event.offset:.1f} Hz, SNR {event.snr:.1f} dB)")
+                        elif event.text and event.text.strip():
+                            self.text_queue.put(f"Decoded ({mode}): {event.text}")
+                            if self.learning_active and self.sent_text[mode] and self.decode_count < 1:
+                                self.decoded_text[mode].append(event.text[0])
+                                self.decode_count += 1
+                    continue
 
                 symbol = self.decode_audio(filtered_data)
                 if symbol is not None:
-                    if mode in ["robust", "robust_plus"]:
-                        buffer.append(symbol)
-                        expected_buffer_size = 31 if mode == "robust" else 30
-                        if len(buffer) >= expected_buffer_size:
-                            packet_id, decoded_text = (self.decode_v4_packet(buffer) if mode == "robust" 
-                                                      else self.decode_ofdm_packet(buffer))
-                            if decoded_text and decoded_text.strip():
-                                decoded_char = decoded_text[0] if mode == "robust" else decoded_text
-                                self.text_queue.put(f"Decoded ({mode}): {decoded_char}")
-                                if self.learning_active and self.sent_text[mode] and self.decode_count < 1:
-                                    self.decoded_text[mode].append(decoded_char)
-                                    if self.last_sent and self.last_sent[0]:  # Check if it’s not a preamble
-                                        sent_char, _ = self.last_sent
-                                        if decoded_char != sent_char:
-                                            self.correct_decode(filtered_data, SYMBOL_MAP[sent_char])
-                                        self.decode_count += 1
-                            buffer.clear()
-                            preamble_detected = False
-                    else:
-                        decoded_text = self.decode_fec([symbol])
-                        if decoded_text:
-                            self.text_queue.put(f"Decoded (Normal): {decoded_text}")
-                            if self.learning_active and self.sent_text["normal"] and self.decode_count < 1:
-                                self.decoded_text["normal"].append(decoded_text)
-                                if self.last_sent and self.last_sent[0]:
-                                    sent_char, _ = self.last_sent
-                                    if decoded_text != sent_char:
-                                        self.correct_decode(filtered_data, SYMBOL_MAP[sent_char])
-                                    self.decode_count += 1
+                    decoded_text = decode_fec([symbol], "normal")
+                    if decoded_text:
+                        self.text_queue.put(f"Decoded (Normal): {decoded_text}")
+                        if self.learning_active and self.sent_text["normal"] and self.decode_count < 1:
+                            self.decoded_text["normal"].append(decoded_text)
+                            if self.last_sent and self.last_sent[0]:
+                                sent_char, _ = self.last_sent
+                                if decoded_text != sent_char:
+                                    self.correct_decode(filtered_data, SYMBOL_MAP[sent_char])
+                                self.decode_count += 1
             except Exception as e:
                 logging.error(f"Receive error: {e}")
             time.sleep(0.1 if mode == "normal" else 0.025)
@@ -891,173 +846,27 @@ class DipperReceiveV1:
             logging.info(f"Training data saved for symbol: {symbol}")
             messagebox.showinfo("Training", f"Saved training data for {symbol}")
 
-    def encode_v4_packet(self, text, packet_id):
-        bits = [int(b) for char in text for b in bin(ord(char))[2:].zfill(8)]
-        encoded_bits = self.convolutional_encode(bits)
-        interleaved_bits = self.interleave(encoded_bits)
-        symbols = []
-        for i in range(0, len(interleaved_bits), 4):
-            chunk = interleaved_bits[i:i+4]
-            value = sum(b << (3-j) for j, b in enumerate(chunk[:4]))
-            symbols.append(V4_SYMBOLS.get(value, " "))
-        header = [V4_SYMBOLS[packet_id % 16]]
-        crc = crc16(text.encode('utf-8'))
-        crc_symbols = [V4_SYMBOLS[(crc >> 12) & 0xF], V4_SYMBOLS[(crc >> 8) & 0xF], 
-                      V4_SYMBOLS[(crc >> 4) & 0xF], V4_SYMBOLS[crc & 0xF]]
-        return header + symbols + crc_symbols
-
-    def encode_ofdm_packet(self, text, packet_id):
-        bits = [int(b) for char in text for b in bin(ord(char))[2:].zfill(8)]
-        encoded_bits = self.convolutional_encode(bits)
-        interleaved_bits = self.interleave(encoded_bits)
-        rs_encoded = RSCodec(16).encode(bytes(encoded_bits))
-        ofdm_symbols = []
-        tones = 16
-        symbol_rate = 41.6
-        freq_spacing = 150
-        for i in range(0, len(rs_encoded), int(symbol_rate)):
-            chunk = rs_encoded[i:i+int(symbol_rate)]
-            if chunk:
-                freq_idx = sum(chunk) % tones
-                freq = 300 + freq_idx * freq_spacing
-                duration = 0.01
-                ofdm_symbols.append((freq, duration))
-        crc = crc16(text.encode('utf-8'))
-        crc_bits = [int(b) for b in bin(crc)[2:].zfill(16)]
-        for i in range(0, len(crc_bits), int(symbol_rate)):
-            chunk = crc_bits[i:i+int(symbol_rate)]
-            if chunk:
-                freq_idx = sum(chunk) % tones
-                freq = 300 + freq_idx * freq_spacing
-                duration = 0.01
-                ofdm_symbols.append((freq, duration))
-        return ofdm_symbols
-
-    def generate_ofdm_sound(self, freq, duration):
-        t = np.linspace(0, duration, int(SAMPLE_RATE * duration), False)
-        signal = np.sin(2 * np.pi * freq * t)
-        return signal / np.max(np.abs(signal))
-
-    def convolutional_encode(self, bits):
-        encoded = []
-        state = 0
-        for bit in bits:
-            encoded.extend([(state ^ bit), bit])
-            state = bit
-        return encoded
-
-    def interleave(self, bits):
-        block_size = 16
-        padded = bits + [0] * (block_size - len(bits) % block_size) if len(bits) % block_size else bits
-        return [padded[i // 4 + (i % 4) * 4] for i in range(len(padded))]
-
-    def decode_fec(self, symbols):
-        return "".join(REVERSE_MAP.get(sym, " ") for sym in symbols).strip()
-
-    def decode_v4_packet(self, symbols):
-        if len(symbols) < 5:
-            return None, None
-        packet_id = V4_REVERSE_MAP.get(symbols[0], 0)
-        payload_symbols = symbols[1:-4]
-        crc_symbols = symbols[-4:]
-        bits = [int(b) for sym in payload_symbols for b in bin(V4_REVERSE_MAP.get(sym, 0))[2:].zfill(4)]
-        deinterleaved_bits = self.deinterleave(bits)
-        decoded_bits = self.viterbi_decode(deinterleaved_bits)
-        text = "".join(chr(sum(b << (7-j) for j, b in enumerate(decoded_bits[i:i+8]))) 
-                      for i in range(0, len(decoded_bits), 8) if len(decoded_bits[i:i+8]) == 8)
-        crc = crc16(text.encode('utf-8'))
-        received_crc = sum(V4_REVERSE_MAP.get(s, 0) << (12 - 4*i) for i, s in enumerate(crc_symbols))
-        return packet_id, text if crc == received_crc else None
-
-    def decode_ofdm_packet(self, symbols):
-        if len(symbols) < 10:
-            return 0, "[ERROR] Insufficient data"
-        decoded_bits = []
-        tones = 16
-        symbol_rate = 41.6
-        freq_spacing = 150
-        for freq, _ in symbols:
-            freq_idx = int((freq - 300) / freq_spacing) % tones
-            bits = [int(b) for b in bin(freq_idx)[2:].zfill(int(np.log2(tones)))]
-            decoded_bits.extend(bits[:int(symbol_rate)])
-        deinterleaved_bits = self.deinterleave(decoded_bits)
-        viterbi_decoded = self.viterbi_decode(deinterleaved_bits)
-        try:
-            rs_decoded = RSCodec(16).decode(bytes(viterbi_decoded))[0]
-            text = "".join(chr(sum(b << (7-j) for j, b in enumerate(rs_decoded[i:i+8]))) 
-                          for i in range(0, len(rs_decoded), 8) if len(rs_decoded[i:i+8]) == 8)
-            crc_pos = len(text) - 2
-            if crc_pos <= 0 or not all(c in '0123456789ABCDEFabcdef' for c in text[crc_pos:]):
-                return 0, "[ERROR] Invalid CRC"
-            crc_received = int(text[crc_pos:], 16)
-            crc_calculated = crc16(text[:crc_pos].encode('utf-8'))
-            return 0, text if crc_received == crc_calculated else "[ERROR] CRC mismatch"
-        except Exception:
-            return 0, "[ERROR] Decoding failed"
-
-    def deinterleave(self, bits):
-        block_size = 16
-        if len(bits) < block_size:
-            return bits
-        num_blocks = (len(bits) + block_size - 1) // block_size
-        padded_length = num_blocks * block_size
-        padded_bits = bits + [0] * (padded_length - len(bits))
-        deinterleaved = [0] * padded_length
-        for i in range(len(padded_bits)):
-            deinterleaved[i // 4 + (i % 4) * 4] = padded_bits[i]
-        return deinterleaved[:len(bits)]
-
-    def viterbi_decode(self, bits):
-        states = {0: (0, []), 1: (float('inf'), [])}
-        for i in range(0, len(bits), 2):
-            r1, r2 = bits[i], bits[i+1]
-            new_states = {}
-            for s in [0, 1]:
-                for b in [0, 1]:
-                    next_s = b
-                    o1, o2 = [(0, 0), (1, 1), (1, 0), (0, 1)][s*2 + b]
-                    cost = states[s][0] + (r1 ^ o1) + (r2 ^ o2)
-                    path = states[s][1] + [b]
-                    if next_s not in new_states or cost < new_states[next_s][0]:
-                        new_states[next_s] = (cost, path)
-            states = new_states
-        return min(states.values(), key=lambda x: x[0])[1]
-
-    def detect_v4_preamble(self, data):
-        preamble_freqs = [(300, 600), (900, 1200), (1500, 1800), (2100, 2400), 
-                         (600, 900), (1200, 1500), (1800, 2100)]
-        segment_size = int(SAMPLE_RATE * 0.05)
-        freq_axis = np.linspace(0, SAMPLE_RATE // 2, segment_size // 2)
-        detected = True
-        for i, (start_freq, end_freq) in enumerate(preamble_freqs):
-            chunk = data[i * segment_size:(i + 1) * segment_size]
-            if len(chunk) < segment_size:
-                return False
-            freqs = np.abs(fft(chunk)[:segment_size // 2])
-            peak_idx = np.argmax(freqs)
-            peak_freq = freq_axis[peak_idx]
-            if not (start_freq - 200 < peak_freq < end_freq + 200):
-                detected = False
-                break
-        return detected
-
-    def detect_robust_plus_preamble(self, data):
-        preamble_freqs = [(300, 600), (900, 1200), (1500, 1800), (2100, 2400), 
-                         (600, 900), (1200, 1500), (1800, 2100)]
-        segment_size = int(SAMPLE_RATE * 0.05)
-        freq_axis = np.linspace(0, SAMPLE_RATE // 2, segment_size // 2)
-        detected = True
-        for i, (start_freq, end_freq) in enumerate(preamble_freqs):
-            chunk = data[i * segment_size:(i + 1) * segment_size]
-            if len(chunk) < segment_size:
-                return False
-            freqs = np.abs(fft(chunk)[:segment_size // 2])
-            peak_idx = np.argmax(freqs)
-            peak_freq = freq_axis[peak_idx]
-            if not (start_freq - 200 < peak_freq < end_freq + 200):
-                detected = False
-                break
-        return detected
+    def decode_recording(self):
+        paths = filedialog.askopenfilenames(title="Decode Recording", 
+                                            filetypes=[("WAV files", "*.wav"), ("All files", "*.*")])
+        if not paths:
+            return
+        threading.Thread(target=self.decode_recording_thread, 
+                         args=(paths, self.current_mode.get(), self.sensitivity.get()), daemon=True).start()
+
+    def decode_recording_thread(self, paths, mode, sensitivity):
+        for path in paths:
+            name = os.path.basename(path)
+            try:
+                records, stats = decode_file(path, mode, sensitivity=sensitivity)
+            except Exception as e:
+                logging.error(f"Decode of {path} failed: {e}")
+                self.text_queue.put(f"Decode failed ({name}): {e}")
+                continue
+            for record in records:
+                if record.get("text"):
+                    self.text_queue.put(f"Decoded ({mode}) {name} @ {record['time']:.2f}s: {record['text']}")
+            self.text_queue.put(f"{name}: {stats['duration_s']:.1f} s of audio decoded in {stats['elapsed_s']:.2f} s")
 
     def update_text(self):
         if not self.running:
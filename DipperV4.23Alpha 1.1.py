@@ -1,18 +1,29 @@
 import tkinter as tk
-from tkinter import messagebox, ttk, simpledialog, Menu
+from tkinter import messagebox, ttk, simpledialog, Menu, filedialog
 import tkinter.font
 import pyaudio
 import numpy as np
-from scipy.fft import fft, ifft
-from scipy.signal import butter, lfilter
 import threading
 import time
 import os
 import serial
-from reedsolo import RSCodec, ReedSolomonError
+from reedsolo import RSCodec
 import crcmod
 import sys
 import serial.tools.list_ports
+from dipper.waveforms import render_pattern
+from dipper.rxstream import StreamingReceiver
+from dipper.txqueue import TX_ACK, TX_NEW, TX_RETRANSMIT, TxScheduler
+from dipper.txstream import StreamingTransmitter
+from dipper.uibridge import UiBridge
+from dipper.filters import StreamingBandpass, parse_band
+from dipper.modes import MODES, ModemConfig
+from dipper.arq import ArqFrame, ArqReceiver, ArqSender
+from dipper.cat import CatPoller, CatState, s_units
+from dipper.civ import CivError, CivSession
+from dipper.linkadapt import LinkAdapter, receive_codes
+from dipper.modem import Modem
+from dipper.render import render_message
 
 print("Script starting...")
 print("Imports completed")
@@ -34,51 +45,19 @@ except Exception as e:
     print(f"Dependency error: {e}")
     sys.exit(1)
 
-# Adjusted to fit 300-2700 Hz (2400 Hz bandwidth)
-CHAR_SOUNDS = {
-    "A": [(300, 300, "tone")], "B": [(600, 600, "trill")], "C": [(900, 300, "slide")],
-    "D": [(1200, 1200, "tone")], "E": [(1500, 1500, "tone")], "F": [(1800, 2100, "slide")],
-    "G": [(300, 300, "trill")], "H": [(2100, 2100, "tone")], "I": [(2400, 2400, "tone")],
-    "J": [(600, 900, "slide")], "K": [(900, 900, "tone")], "L": [(1200, 1200, "trill")],
-    "M": [(1500, 1800, "slide")], "N": [(1800, 1200, "slide")], "O": [(2100, 2100, "tone")],
-    "P": [(2400, 2400, "trill")], "Q": [(2700, 2700, "tone")], "R": [(300, 300, "trill")],
-    "S": [(600, 900, "slide")], "T": [(900, 1200, "slide")], "U": [(1200, 1200, "tone")],
-    "V": [(1500, 1500, "trill")], "W": [(1800, 2100, "slide")], "X": [(2100, 2100, "trill")],
-    "Y": [(2400, 1800, "slide")], "Z": [(2700, 2700, "trill")],
-    "0": [(300, 600, "slide")], "1": [(600, 900, "slide")], "2": [(900, 1200, "slide")],
-    "3": [(1200, 1500, "slide")], "4": [(1500, 1800, "slide")], "5": [(1800, 2100, "slide")],
-    "6": [(2100, 2400, "slide")], "7": [(2400, 2700, "slide")], "8": [(2700, 2400, "slide")],
-    "9": [(300, 600, "slide")], "!": [(600, 900, "slide")], "/": [(900, 1200, "slide")],
-    "-": [(1200, 1200, "trill")], ".": [(1500, 1500, "tone")], " ": [(300, 300, "tone")],
-    "@": [(1800, 2100, "slide")]
-}
-
-WORD_SOUNDS = {
-    "CQ": [(300, 600, "slide")], "DE": [(900, 1200, "slide")],
-}
-
 SAMPLE_RATE = 44100
 CHUNK = 1024
+TX_RING_SECONDS = 0.5
+CAT_POLL_SECONDS = 1.0
+CAT_STALE_SECONDS = 10.0   # older dial readings are not used to tag decodes
+RX_RING_SECONDS = 10.0   # capture kept while a decode runs long
+RX_MAX_BLOCK = 16 * CHUNK
+ARQ_TIMEOUT = 20.0      # s without an ACK before an over is sent again
+ARQ_ACK_DELAY = 0.5     # s to wait after a data frame in case more of the over follows
+ARQ_IDLE = 120.0        # s of silence after which the next frame heard starts a new link
 CALLSIGN_FILE = os.path.join(os.path.dirname(__file__), "mycallsign.txt")
 SETTINGS_FILE = os.path.join(os.path.dirname(__file__), "radio_settings.txt")
 
-SYMBOL_MAP = {**{char: i for i, char in enumerate(CHAR_SOUNDS.keys())},
-              **{word: i + len(CHAR_SOUNDS) for i, word in enumerate(WORD_SOUNDS.keys())}}
-REVERSE_MAP = {i: char_or_word for char_or_word, i in SYMBOL_MAP.items()}
-RS_CODEC = RSCodec(8)
-
-V4_SYMBOLS = {
-    0: "A", 1: "B", 2: "C", 3: "D", 4: "E", 5: "F", 6: "G", 7: "H",
-    8: "I", 9: "K", 10: "L", 11: "M", 12: "N", 13: "O", 14: "P", 15: "Q"
-}
-V4_REVERSE_MAP = {v: k for k, v in V4_SYMBOLS.items()}
-
-CONV_TABLE = {
-    (0, 0): [0, 0], (0, 1): [1, 1], (1, 0): [1, 0], (1, 1): [0, 1]
-}
-
-crc16 = crcmod.mkCrcFun(0x11021, initCrc=0, xorOut=0xFFFF)
-
 class DipperModeApp:
     def __init__(self, root):
         print("Initializing DipperModeApp")
@@ -111,11 +90,10 @@ class DipperModeApp:
         self.sensitivity = tk.DoubleVar(value=self.settings.get("sensitivity", 50.0))
         self.input_devices, self.output_devices = self.get_audio_devices()
 
-        valid_speeds = ["normal", "robust", "robust_plus"]
+        valid_speeds = ["normal", "robust", "robust_plus", "auto"]
         loaded_speed = self.settings.get("speed", "normal")
         self.speed_var = tk.StringVar(value=loaded_speed if loaded_speed in valid_speeds else "normal")
-        self.filter_var = tk.StringVar(value=self.settings.get("filter", "none"))
-        self.receive_buffer = []
+        self.filter_var = tk.StringVar(value=self.valid_filter(self.settings.get("filter", "none")))
         self.temp_receive_buffer = []
 
         self.light_colors = {"bg": "#FFFFFF", "fg": "#000000", "entry_bg": "#F0F0F0", "button_bg": "#D0D0D0"}
@@ -137,18 +115,39 @@ class DipperModeApp:
         self.rx_thread = None
         self.tx_thread = None
         self.is_v4_mode = False
-        self.packet_buffer = {}
         self.last_packet_id = -1
-        self.tx_queue = []
-        self.rx_ack = None
-        self.radio_serial = None
+        self.tx_queue = TxScheduler()
+        # Packet modes go through selective-repeat ARQ with the station in "To"
+        self.arq_lock = threading.Lock()
+        self.arq_tx = ArqSender(timeout=ARQ_TIMEOUT)
+        self.arq_rx = ArqReceiver()
+        self.arq_peer = None
+        self.arq_speed = None
+        self.arq_rate = None
+        self.arq_heard = 0.0
+        # The CI-V session and its CAT poller are swapped from the Tk and TX threads
+        self.radio_lock = threading.Lock()
+        self.civ = None
+        self.civ_settings = None
+        self.cat = None
+        self.cat_state = CatState()
         self.indicator_timeout = None
+        self.modem = Modem(ModemConfig(sample_rate=SAMPLE_RATE, sensitivity=self.sensitivity.get()))
+        self.link = LinkAdapter(self.modem)
+        self.tx_writer = StreamingTransmitter(int(SAMPLE_RATE * TX_RING_SECONDS))
+        self.rx_capture = StreamingReceiver(int(SAMPLE_RATE * RX_RING_SECONDS))
+        self.rx_bandpass = StreamingBandpass(SAMPLE_RATE)
+        self.rx_bandpass.set_band(self.filter_var.get())
+        self.filter_var.trace("w", self.update_filter)
 
         self.rx_output = None
+        # Worker threads reach the widgets only through this, drained at 20 Hz
+        self.ui = UiBridge(interval=0.05)
 
         print("Building GUI")
         self.build_gui()
         print("GUI built successfully")
+        self.ui.start(self.root.after)
 
         print("Scheduling audio start")
         self.root.after(100, self.start_audio)
@@ -167,6 +166,7 @@ class DipperModeApp:
             user_menu.add_command(label="My Callsign", command=self.show_user_settings_window)
             settings_menu.add_command(label="Configure Radio", command=self.show_radio_settings_window)
             settings_menu.add_command(label="Audio Settings", command=self.show_audio_settings_window)
+            settings_menu.add_command(label="Save CQ Audio...", command=self.save_cq_audio)
 
             self.callsign_frame = tk.Frame(self.main_frame, bg=self.current_colors["bg"])
             self.callsign_frame.pack(fill="x", pady=(0, 10))
@@ -246,6 +246,10 @@ class DipperModeApp:
                                                       fg=self.current_colors["fg"], bg=self.current_colors["bg"], 
                                                       selectcolor=self.current_colors["entry_bg"])
             self.speed_robust_plus_rb.pack(side="left", padx=5)
+            self.speed_auto_rb = tk.Radiobutton(self.speed_frame, text="Auto (adaptive)", variable=self.speed_var, value="auto", 
+                                               fg=self.current_colors["fg"], bg=self.current_colors["bg"], 
+                                               selectcolor=self.current_colors["entry_bg"])
+            self.speed_auto_rb.pack(side="left", padx=5)
 
             self.filter_frame = tk.LabelFrame(self.tx_frame, text="Frequency Filter", fg=self.current_colors["fg"], 
                                              bg=self.current_colors["bg"])
@@ -258,6 +262,9 @@ class DipperModeApp:
                                                     fg=self.current_colors["fg"], bg=self.current_colors["bg"], 
                                                     selectcolor=self.current_colors["entry_bg"])
             self.filter_300_2700_rb.pack(side="left", padx=5)
+            self.filter_custom_button = tk.Button(self.filter_frame, text="Custom...", command=self.choose_custom_filter, 
+                                                  fg=self.current_colors["fg"], bg=self.current_colors["button_bg"])
+            self.filter_custom_button.pack(side="left", padx=5)
 
             self.rx_frame = tk.Frame(self.main_frame, bg=self.current_colors["bg"])
             self.rx_frame.pack(fill="both", expand=True, pady=(10, 0))
@@ -303,7 +310,7 @@ class DipperModeApp:
                                        insertbackground=self.current_colors["fg"])
                 self.rx_output.pack_forget()
             if self.rx_output:
-                self.rx_output.insert(tk.END, f"GUI error: {e}\n")
+                self.log(f"GUI error: {e}\n")
 
 #end of part 1
     def toggle_dark_mode(self):
@@ -319,7 +326,7 @@ class DipperModeApp:
             self.robust_plus_label.config(fg="#00FF00", bg=self.current_colors["bg"])
             self.speed_frame.config(fg="#00FF00")
             self.filter_frame.config(fg="#00FF00")
-            for rb in [self.speed_normal_rb, self.speed_robust_rb, self.speed_robust_plus_rb,
+            for rb in [self.speed_normal_rb, self.speed_robust_rb, self.speed_robust_plus_rb, self.speed_auto_rb,
                        self.filter_none_rb, self.filter_300_2700_rb]:
                 rb.config(fg="#FFFFFF", selectcolor="#444444", activeforeground="#000000")
         else:
@@ -334,7 +341,7 @@ class DipperModeApp:
             self.robust_plus_label.config(fg=self.current_colors["fg"], bg=self.current_colors["bg"])
             self.speed_frame.config(fg=self.current_colors["fg"])
             self.filter_frame.config(fg=self.current_colors["fg"])
-            for rb in [self.speed_normal_rb, self.speed_robust_rb, self.speed_robust_plus_rb,
+            for rb in [self.speed_normal_rb, self.speed_robust_rb, self.speed_robust_plus_rb, self.speed_auto_rb,
                        self.filter_none_rb, self.filter_300_2700_rb]:
                 rb.config(fg=self.current_colors["fg"], selectcolor=self.current_colors["entry_bg"], 
                           activeforeground=self.current_colors["fg"])
@@ -390,7 +397,6 @@ class DipperModeApp:
     def clear_receive(self):
         if self.rx_output:
             self.rx_output.delete(1.0, tk.END)
-        self.receive_buffer = []
         self.temp_receive_buffer = []
 
     def load_callsign(self):
@@ -460,10 +466,10 @@ class DipperModeApp:
                         f.write(f"{key}={value}\n")
             print("Radio settings saved successfully")
             if self.rx_output:
-                self.rx_output.insert(tk.END, "Radio settings saved successfully\n")
+                self.log("Radio settings saved successfully\n")
         except Exception as e:
             if self.rx_output:
-                self.rx_output.insert(tk.END, f"Error saving settings: {str(e)}\n")
+                self.log(f"Error saving settings: {str(e)}\n")
             print(f"Error saving settings: {e}")
 
     def get_audio_devices(self):
@@ -505,21 +511,20 @@ class DipperModeApp:
             output_idx = self.output_device_index.get() if self.output_device_index.get() >= 0 and self.output_device_index.get() in self.output_devices else None
             
             print(f"Attempting to open audio streams - Input device: {input_idx}, Output device: {output_idx}")
-            self.stream_out = self.p.open(format=pyaudio.paFloat32, channels=1, rate=SAMPLE_RATE, output=True, 
-                                        output_device_index=output_idx)
-            self.stream_in = self.p.open(format=pyaudio.paFloat32, channels=1, rate=SAMPLE_RATE, input=True, 
-                                       frames_per_buffer=CHUNK, input_device_index=input_idx)
+            self.stream_out = self.tx_writer.open(self.p, SAMPLE_RATE, output_idx, CHUNK)
+            self.stream_in = self.rx_capture.open(self.p, SAMPLE_RATE, input_idx, CHUNK)
             self.running = True
             self.rx_thread = threading.Thread(target=self.receive_loop, daemon=True)
             self.rx_thread.start()
             self.tx_thread = threading.Thread(target=self.transmit_loop, daemon=True)
             self.tx_thread.start()
             if self.rx_output:
-                self.rx_output.insert(tk.END, "Audio started successfully\n")
+                self.log("Audio started successfully\n")
             print("Audio threads started")
+            self.start_cat()
         except OSError as e:
             if self.rx_output:
-                self.rx_output.insert(tk.END, f"Audio error: {str(e)}. Check your audio devices.\n")
+                self.log(f"Audio error: {str(e)}. Check your audio devices.\n")
             self.running = False
             print(f"Audio startup error: {str(e)}. Please check the selected device.")
             if self.root and self.rx_output:
@@ -530,7 +535,7 @@ class DipperModeApp:
                 self.p = None
         except Exception as e:
             if self.rx_output:
-                self.rx_output.insert(tk.END, f"Audio failed to start: {str(e)}\n")
+                self.log(f"Audio failed to start: {str(e)}\n")
             self.running = False
             print(f"Audio startup error: {e}")
             if self.root and self.rx_output:
@@ -543,141 +548,32 @@ class DipperModeApp:
 #end of part 2
 
     def generate_sound(self, pattern, duration=0.05):
-        audio = np.array([], dtype=np.float32)
-        if not pattern:
-            return np.zeros(int(SAMPLE_RATE * duration), dtype=np.float32)
-        for start_freq, end_freq, sound_type in pattern:
-            t = np.linspace(0, duration, int(SAMPLE_RATE * duration), False)
-            if sound_type == "tone":
-                signal = np.sin(2 * np.pi * start_freq * t)
-            elif sound_type == "slide":
-                freqs = np.linspace(start_freq, end_freq, len(t))
-                signal = np.sin(2 * np.pi * freqs * t)
-            elif sound_type == "trill":
-                signal = np.sin(2 * np.pi * start_freq * t) * np.sin(2 * np.pi * 20 * t)
-            audio = np.concatenate((audio, signal))
-        return audio / np.max(np.abs(audio))
-
-    def convolutional_encode(self, bits):
-        encoded = []
-        state = 0
-        for bit in bits:
-            encoded.extend(CONV_TABLE[(state, bit)])
-            state = bit
-        return encoded
-
-    def viterbi_decode(self, bits):
-        states = {0: (0, []), 1: (float('inf'), [])}
-        for i in range(0, len(bits), 2):
-            r1, r2 = bits[i], bits[i+1]
-            new_states = {}
-            for s in [0, 1]:
-                for b in [0, 1]:
-                    next_s = b
-                    o1, o2 = CONV_TABLE[(s, b)]
-                    cost = states[s][0] + (r1 ^ o1) + (r2 ^ o2)
-                    path = states[s][1] + [b]
-                    if next_s not in new_states or cost < new_states[next_s][0]:
-                        new_states[next_s] = (cost, path)
-            states = new_states
-        return min(states.values(), key=lambda x: x[0])[1]
-
-    def interleave(self, bits):
-        block_size = 16
-        padded = bits + [0] * (block_size - len(bits) % block_size) if len(bits) % block_size else bits
-        return [padded[i // 4 + (i % 4) * 4] for i in range(len(padded))]
-
-    def deinterleave(self, bits):
-        block_size = 16
-        if not bits or len(bits) < block_size:
-            print(f"deinterleave: Input too short ({len(bits)} bits), returning unchanged")
-            return bits
-        num_blocks = (len(bits) + block_size - 1) // block_size
-        padded_length = num_blocks * block_size
-        padded_bits = bits + [0] * (padded_length - len(bits))
-        deinterleaved = [0] * padded_length
-        for i in range(len(padded_bits)):
-            new_index = (i // 4 + (i % 4) * 4) % padded_length
-            deinterleaved[new_index] = padded_bits[i]
-        return deinterleaved[:len(bits)]
-
-    def detect_v4_preamble(self, data):
-        preamble_freqs = [(300, 600), (900, 1200), (1500, 1800), (2100, 2400), 
-                         (600, 900), (1200, 1500), (1800, 2100)]
-        segment_size = int(SAMPLE_RATE * 0.05)
-        freq_axis = np.linspace(0, SAMPLE_RATE // 2, segment_size // 2)
-        detected = True
-        for i, (start_freq, end_freq) in enumerate(preamble_freqs):
-            chunk = data[i * segment_size:(i + 1) * segment_size]
-            if len(chunk) < segment_size:
-                return False
-            freqs = np.abs(fft(chunk)[:segment_size // 2])
-            peak_idx = np.argmax(freqs)
-            peak_freq = freq_axis[peak_idx]
-            if not (start_freq - 200 < peak_freq < end_freq + 200):
-                detected = False
-                break
-        return detected
-
-    def detect_robust_plus_preamble(self, data):
-        preamble_freqs = [(300, 600), (900, 1200), (1500, 1800), (2100, 2400), 
-                         (600, 900), (1200, 1500), (1800, 2100)]
-        segment_size = int(SAMPLE_RATE * 0.05)
-        freq_axis = np.linspace(0, SAMPLE_RATE // 2, segment_size // 2)
-        detected = True
-        for i, (start_freq, end_freq) in enumerate(preamble_freqs):
-            chunk = data[i * segment_size:(i + 1) * segment_size]
-            if len(chunk) < segment_size:
-                return False
-            freqs = np.abs(fft(chunk)[:segment_size // 2])
-            peak_idx = np.argmax(freqs)
-            peak_freq = freq_axis[peak_idx]
-            if not (start_freq - 200 < peak_freq < end_freq + 200):
-                detected = False
-                break
-        return detected
-
-    def encode_v4_packet(self, text, packet_id):
-        bits = [int(b) for char in text for b in bin(ord(char))[2:].zfill(8)]
-        encoded_bits = self.convolutional_encode(bits)
-        interleaved_bits = self.interleave(encoded_bits)
-        symbols = []
-        for i in range(0, len(interleaved_bits), 4):
-            chunk = interleaved_bits[i:i+4]
-            value = sum(b << (3-j) for j, b in enumerate(chunk[:4]))
-            symbols.append(V4_SYMBOLS.get(value, " "))
-        
-        header = [V4_SYMBOLS[packet_id % 16]]
-        crc = crc16(text.encode('utf-8'))
-        crc_symbols = [V4_SYMBOLS[(crc >> 12) & 0xF], V4_SYMBOLS[(crc >> 8) & 0xF], 
-                      V4_SYMBOLS[(crc >> 4) & 0xF], V4_SYMBOLS[crc & 0xF]]
-        return header + symbols + crc_symbols
-
-    def decode_v4_packet(self, symbols):
-        if len(symbols) < 5:
-            return None, None
-        packet_id = V4_REVERSE_MAP.get(symbols[0], 0)
-        payload_symbols = symbols[1:-4]
-        crc_symbols = symbols[-4:]
-        bits = [int(b) for sym in payload_symbols 
-                for b in bin(V4_REVERSE_MAP.get(sym, 0))[2:].zfill(4)]
-        deinterleaved_bits = self.deinterleave(bits)
-        decoded_bits = self.viterbi_decode(deinterleaved_bits)
-        text = "".join(chr(sum(b << (7-j) for j, b in enumerate(decoded_bits[i:i+8]))) 
-                      for i in range(0, len(decoded_bits), 8) if len(decoded_bits[i:i+8]) == 8)
-        crc = crc16(text.encode('utf-8'))
-        received_crc = sum(V4_REVERSE_MAP.get(s, 0) << (12 - 4*i) for i, s in enumerate(crc_symbols))
-        return packet_id, text if crc == received_crc else None
+        return render_pattern(pattern, duration, SAMPLE_RATE)
+
+    def play_frame(self, segments):
+        self.tx_writer.play(self.modem.waveforms.iter_frame(segments))
 
 #end of part 3
-    def send_ack_nack(self, packet_id, success):
-        if not self.stream_out:
-            return
-        self.set_v4_tx_indicator() if self.speed_var.get() == "robust" else self.set_robust_plus_tx_indicator()
-        ack_sound = self.generate_sound(CHAR_SOUNDS["K" if success else "N"], 0.05)
-        audio_data = np.concatenate((ack_sound, np.zeros(int(SAMPLE_RATE * 0.025))))
-        self.stream_out.write(audio_data.astype(np.float32).tobytes())
-        self.reset_robust_plus_indicator() if self.speed_var.get() == "robust_plus" else self.reset_indicator()
+    def send_packets(self, frames, mode, label):
+        # One over: the frames back to back, each behind its own preamble
+        segments = []
+        for frame in frames:
+            segments.extend(self.modem.frame_segments(frame.text, mode, frame.packet_id))
+        self.start_radio_transmission()
+        if mode.name == "robust_plus":
+            self.set_robust_plus_tx_indicator()
+        else:
+            self.set_v4_tx_indicator()
+        if self.rx_output:
+            for frame in frames:
+                text = f"ACK {frame.seq:X} {frame.bitmap:02X}" if frame.kind == "ack" else f"#{frame.seq:X} {frame.payload}"
+                self.log(f"{label} TX (Preamble: {mode.preamble}): {text}\n", "sent")
+        self.play_frame(segments)
+        if mode.name == "robust_plus":
+            self.reset_robust_plus_indicator()
+        else:
+            self.reset_indicator()
+        self.stop_radio_transmission()
 
     def transmit(self):
         if not self.stream_out:
@@ -691,78 +587,82 @@ class DipperModeApp:
         text = self.tx_input.get().strip().upper()
         full_text = f"{to_call} DE {my_call} {text}" if text else f"{to_call} DE {my_call}"
         speed = self.speed_var.get()
-        if speed == "robust":
-            packet_id = (self.last_packet_id + 1) % 16
-            self.last_packet_id = packet_id
-            self.tx_queue.append((full_text, packet_id, False))
-        elif speed == "robust_plus":
-            packet_id = (self.last_packet_id + 1) % 16
-            self.last_packet_id = packet_id
-            self.tx_queue.append((full_text, packet_id, True))
+        if speed in ["robust", "robust_plus", "auto"]:
+            with self.arq_lock:
+                if to_call != self.arq_peer:
+                    self.arq_tx.reset()
+                self.arq_peer, self.arq_speed = to_call, speed
+                self.arq_tx.send(full_text)
+            self.schedule_over()
         else:
-            self.tx_queue.append((full_text, None, False))
+            self.tx_queue.put(("text", full_text), TX_NEW)
         self.tx_input.delete(0, tk.END)
-        self.start_radio_transmission()
         self.tx_button.config(bg="red")
 
     def transmit_loop(self):
+        # Sleeps in the scheduler until something is due: ACKs first, then
+        # resent frames, then new traffic
         while self.running:
-            if self.tx_queue and self.stream_out:
-                self.tx_button.config(bg="red")
-                self.cq_button.config(bg="red")
-                full_text, packet_id, is_robust_plus = self.tx_queue.pop(0)
-                speed = self.speed_var.get()
-                duration_map = {"normal": 0.1, "robust": 0.05, "robust_plus": 0.01}
-                duration = duration_map[speed]
-                gap_duration = duration / 2
-
+            item = self.tx_queue.get()
+            if item is None:
+                break
+            kind, arg = item
+            if kind == "ack":
+                with self.arq_lock:
+                    ack = self.arq_rx.ack()
+                if ack is not None:
+                    self.send_packets([ack], arg, arg.label)
+                continue
+            self.set_tx_busy(True)
+            if kind == "arq":
+                self.send_over()
+            elif kind == "cq":
+                self.play_cq(*arg)
+            else:
+                segments = self.modem.frame_segments(arg, MODES["normal"])
                 self.start_radio_transmission()
-                audio_data = np.array([], dtype=np.float32)
-                if speed in ["robust", "robust_plus"]:
-                    if is_robust_plus:
-                        preamble_audio = np.concatenate([self.generate_sound(CHAR_SOUNDS[num], 0.05) 
-                                                        for num in "2468135"])
-                        self.set_robust_plus_tx_indicator()
-                        ofdm_symbols = self.encode_ofdm_packet(full_text, packet_id)
-                        audio_data = preamble_audio
-                        for freq, duration in ofdm_symbols:
-                            sound = self.generate_ofdm_sound(freq, duration)
-                            audio_data = np.concatenate((audio_data, sound, np.zeros(int(SAMPLE_RATE * gap_duration / 10))))
-                        if self.rx_output:
-                            self.rx_output.insert(tk.END, f"Robust+ TX (Preamble: 2468135): " + full_text + "\n", "sent")
-                    else:
-                        preamble_audio = np.concatenate([self.generate_sound(CHAR_SOUNDS[num], 0.05) 
-                                                        for num in "1357924"])
-                        self.set_v4_tx_indicator()
-                        symbols = self.encode_v4_packet(full_text, packet_id)
-                        audio_data = preamble_audio
-                        for sym in symbols:
-                            pattern = CHAR_SOUNDS.get(sym, CHAR_SOUNDS[" "])
-                            sound = self.generate_sound(pattern, 0.05)
-                            audio_data = np.concatenate((audio_data, sound, np.zeros(int(SAMPLE_RATE * gap_duration))))
-                        if self.rx_output:
-                            self.rx_output.insert(tk.END, f"Robust TX (Preamble: 1357924): " + full_text + "\n", "sent")
-                    self.stream_out.write(audio_data.astype(np.float32).tobytes())
-                    self.reset_robust_plus_indicator() if is_robust_plus else self.reset_indicator()
-                    self.stop_radio_transmission()
-                    time.sleep(0.2)
-                    if self.rx_ack == "N":
-                        self.tx_queue.append((full_text, packet_id, is_robust_plus))
-                    self.rx_ack = None
-                else:
-                    encoded_symbols = self.encode_fec(full_text)
-                    for symbol in encoded_symbols:
-                        char = REVERSE_MAP.get(symbol, " ")
-                        pattern = WORD_SOUNDS.get(char, CHAR_SOUNDS.get(char, []))
-                        sound = self.generate_sound(pattern, duration)
-                        audio_data = np.concatenate((audio_data, sound, np.zeros(int(SAMPLE_RATE * gap_duration))))
-                    self.stream_out.write(audio_data.astype(np.float32).tobytes())
-                    if self.rx_output:
-                        self.rx_output.insert(tk.END, "Sent: " + full_text + "\n", "sent")
-                    self.stop_radio_transmission()
-                self.tx_button.config(bg=self.current_colors["button_bg"])
-                self.cq_button.config(bg=self.current_colors["button_bg"])
-            time.sleep(0.001)
+                self.play_frame(segments)
+                if self.rx_output:
+                    self.log("Sent: " + arg + "\n", "sent")
+                self.stop_radio_transmission()
+            self.set_tx_busy(False)
+            stats = self.tx_queue.stats()
+            if stats.depth["new"] and self.rx_output:
+                # Traffic is backing up: show what waits and for how long
+                waits = ", ".join(f"{name} {stats.depth[name]} ({stats.mean_wait[name]:.1f} s avg)" for name in stats.depth)
+                self.log(f"TX queue: {waits}\n")
+
+    def set_tx_busy(self, busy):
+        colour = "red" if busy else self.current_colors["button_bg"]
+        self.ui.post(self.tx_button.config, bg=colour)
+        self.ui.post(self.cq_button.config, bg=colour)
+
+    def schedule_over(self, delay=0.0, priority=None):
+        # Wake the transmit thread when the ARQ sender next has frames due:
+        # now for new ones, after the ACK timeout for those left unanswered
+        with self.arq_lock:
+            wait = self.arq_tx.next_timeout()
+        if wait is None:
+            self.tx_queue.cancel("arq")
+            return
+        if priority is None:
+            priority = TX_NEW if wait == 0.0 else TX_RETRANSMIT
+        self.tx_queue.put(("arq", None), priority, max(wait, delay), key="arq")
+
+    def send_over(self):
+        with self.arq_lock:
+            peer, speed = self.arq_peer, self.arq_speed
+        # Auto asks the link adapter for the mode and code rate that suits this peer now
+        rate = self.link.select(peer) if speed == "auto" else None
+        with self.arq_lock:
+            frames = self.arq_tx.next_over()
+            if frames:
+                self.arq_rate = rate
+        if frames:
+            mode = rate.tx_mode if rate else MODES[speed]
+            label = f"{mode.label} {rate.code}" if rate else mode.label
+            self.send_packets(frames, mode, label)
+        self.schedule_over()
 
     def send_cq(self):
         if not self.stream_out:
@@ -773,454 +673,376 @@ class DipperModeApp:
             messagebox.showwarning("Warning", "Enter your callsign!")
             return
         speed = self.speed_var.get()
-        single_cq = f"CQ CQ CQ DE {my_call}"
-        
-        self.start_radio_transmission()
+        if speed == "auto":
+            speed = "robust"   # no peer to adapt to yet
         self.cq_button.config(bg="red")
-        audio_data = np.array([], dtype=np.float32)
-        duration_map = {"normal": 0.1, "robust": 0.05, "robust_plus": 0.01}
-        duration = duration_map[speed]
-        gap_duration = duration / 2
+        self.tx_queue.put(("cq", (speed, my_call)), TX_NEW)
+
+    def play_cq(self, speed, my_call):
+        single_cq = f"CQ CQ CQ DE {my_call}"
 
         if speed == "robust":
             packet_id = (self.last_packet_id + 1) % 16
             self.last_packet_id = packet_id
-            preamble_audio = np.concatenate([self.generate_sound(CHAR_SOUNDS[num], 0.05) 
-                                            for num in "1357924"])
+            segments = self.modem.frame_segments(single_cq, MODES["robust"], packet_id)
+            self.start_radio_transmission()
             self.set_v4_tx_indicator()
-            symbols = self.encode_v4_packet(single_cq, packet_id)
-            audio_data = preamble_audio
-            for sym in symbols:
-                pattern = CHAR_SOUNDS.get(sym, CHAR_SOUNDS[" "])
-                sound = self.generate_sound(pattern, 0.05)
-                audio_data = np.concatenate((audio_data, sound, np.zeros(int(SAMPLE_RATE * gap_duration))))
             if self.rx_output:
-                self.rx_output.insert(tk.END, f"Robust TX (Preamble: 1357924): " + single_cq + "\n", "sent")
+                self.log(f"Robust TX (Preamble: 1357924): " + single_cq + "\n", "sent")
         elif speed == "robust_plus":
             packet_id = (self.last_packet_id + 1) % 16
             self.last_packet_id = packet_id
-            preamble_audio = np.concatenate([self.generate_sound(CHAR_SOUNDS[num], 0.05) 
-                                            for num in "2468135"])
+            segments = self.modem.frame_segments(single_cq, MODES["robust_plus"], packet_id)
+            self.start_radio_transmission()
             self.set_robust_plus_tx_indicator()
-            ofdm_symbols = self.encode_ofdm_packet(single_cq, packet_id)
-            audio_data = preamble_audio
-            for freq, duration in ofdm_symbols:
-                sound = self.generate_ofdm_sound(freq, duration)
-                audio_data = np.concatenate((audio_data, sound, np.zeros(int(SAMPLE_RATE * gap_duration / 10))))
             if self.rx_output:
-                self.rx_output.insert(tk.END, f"Robust+ TX (Preamble: 2468135): " + single_cq + "\n", "sent")
+                self.log(f"Robust+ TX (Preamble: 2468135): " + single_cq + "\n", "sent")
         else:
             cq_text = f"{single_cq} {single_cq}"
-            encoded_symbols = self.encode_fec(cq_text)
-            for symbol in encoded_symbols:
-                char = REVERSE_MAP.get(symbol, " ")
-                pattern = WORD_SOUNDS.get(char, CHAR_SOUNDS.get(char, []))
-                sound = self.generate_sound(pattern, duration)
-                audio_data = np.concatenate((audio_data, sound, np.zeros(int(SAMPLE_RATE * gap_duration))))
+            segments = self.modem.frame_segments(cq_text, MODES["normal"])
+            self.start_radio_transmission()
             if self.rx_output:
-                self.rx_output.insert(tk.END, "Sent: " + cq_text + "\n", "sent")
+                self.log("Sent: " + cq_text + "\n", "sent")
 
-        self.stream_out.write(audio_data.astype(np.float32).tobytes())
+        self.play_frame(segments)
         if speed in ["robust", "robust_plus"]:
-            self.reset_robust_plus_indicator() if speed == "robust_plus" else self.reset_indicator()
+            if speed == "robust_plus":
+                self.reset_robust_plus_indicator()
+            else:
+                self.reset_indicator()
         self.stop_radio_transmission()
-        self.cq_button.config(bg=self.current_colors["button_bg"])
+
+    def save_cq_audio(self):
+        # Pre-render the CQ for unattended beacons; no audio device or PTT involved
+        my_call = self.my_callsign.get().upper()
+        if not my_call:
+            messagebox.showwarning("Warning", "Enter your callsign!")
+            return
+        speed = self.speed_var.get()
+        if speed == "auto":
+            speed = "robust"
+        path = filedialog.asksaveasfilename(title="Save CQ Audio", defaultextension=".wav", 
+                                            initialfile=f"cq_{my_call}_{speed}.wav", 
+                                            filetypes=[("WAV files", "*.wav"), ("Raw float32", "*.f32")])
+        if not path:
+            return
+        single_cq = f"CQ CQ CQ DE {my_call}"
+        text = single_cq if speed in ["robust", "robust_plus"] else f"{single_cq} {single_cq}"
+        try:
+            samples = render_message(self.modem, text, MODES[speed], (self.last_packet_id + 1) % 16, path)
+        except (OSError, ValueError) as e:
+            messagebox.showwarning("Save Warning", f"Could not save audio: {e}")
+            return
+        if self.rx_output:
+            self.log(f"Saved {len(samples) / SAMPLE_RATE:.1f} s CQ audio to {path}\n")
 
     def test_ptt_connection(self):
         if self.serial_port.get() != "NONE" and self.baud_rate.get():
             if not self.baud_rate.get().isdigit():
                 messagebox.showwarning("Radio Warning", "Baud rate must be a valid number.")
                 return
-            self.start_radio_transmission()
-            self.root.after(1000, lambda: [self.stop_radio_transmission(), self.tx_button.config(bg=self.current_colors["button_bg"]), self.cq_button.config(bg=self.current_colors["button_bg"])])
+            threading.Thread(target=self.run_ptt_test, daemon=True).start()
         else:
             messagebox.showwarning("Radio Warning", "No serial port or baud rate selected for radio communication.")
 
-    def start_radio_transmission(self):
-        if self.serial_port.get() != "NONE" and self.baud_rate.get():
-            try:
-                radio = self.radio.get()
-                raw_address = self.usb_address.get().replace('H', '').replace('h', '')
-                if not raw_address:
-                    raise ValueError("No address specified for radio communication. Please set a valid hex address (e.g., '68' for IC-703).")
-                if len(raw_address) != 2 or not all(c in '0123456789ABCDEFabcdef' for c in raw_address):
-                    raise ValueError(f"Invalid address '{raw_address}'. Must be a 2-character hexadecimal value (e.g., '68', '94').")
-                address = raw_address.upper()
-
-                if not self.radio_serial or not self.radio_serial.is_open:
-                    self.radio_serial = serial.Serial(
-                        port=self.serial_port.get(),
-                        baudrate=int(self.baud_rate.get()) if self.baud_rate.get().isdigit() else 9600,
-                        timeout=0.1,
-                        rtscts=self.rts.get(),
-                        dsrdtr=self.dtr.get()
-                    )
-                    print(f"Radio serial connection established on {self.serial_port.get()} at {self.baud_rate.get()} baud")
-                    if self.rx_output:
-                        self.rx_output.insert(tk.END, f"Radio connection established on {self.serial_port.get()}\n")
+    def run_ptt_test(self):
+        # Worker thread: keying waits for the rig's acknowledgement, which
+        # would freeze the GUI on the Tk thread
+        self.start_radio_transmission()
+        time.sleep(1.0)
+        self.stop_radio_transmission()
+        self.ui.post(self.tx_button.config, bg=self.current_colors["button_bg"])
+        self.ui.post(self.cq_button.config, bg=self.current_colors["button_bg"])
+
+    def radio_session(self):
+        # The CI-V session for the current radio settings, kept open across
+        # overs and replaced only when the settings change. None without a port.
+        with self.radio_lock:
+            if self.serial_port.get() == "NONE" or not self.baud_rate.get():
+                if self.cat:
+                    self.cat.stop()
+                    self.cat = None
+                if self.civ:
+                    self.civ.close()
+                    self.civ, self.civ_settings = None, None
+                return None
+            address = self.usb_address.get().replace('H', '').replace('h', '')
+            if not address:
+                raise ValueError("No address specified for radio communication. Please set a valid hex address (e.g., '68' for IC-703).")
+            if len(address) != 2 or not all(c in '0123456789ABCDEFabcdef' for c in address):
+                raise ValueError(f"Invalid address '{address}'. Must be a 2-character hexadecimal value (e.g., '68', '94').")
+            baud = int(self.baud_rate.get()) if self.baud_rate.get().isdigit() else 9600
+            settings = (self.serial_port.get(), baud, int(address, 16), self.rts.get(), self.dtr.get())
+            if self.civ is None or settings != self.civ_settings:
+                if self.cat:
+                    self.cat.stop()
+                if self.civ:
+                    self.civ.close()
+                port, baud, address, rts, dtr = settings
+                self.civ = CivSession(port, baud, address, rtscts=rts, dsrdtr=dtr)
+                self.civ_settings = settings
+                print(f"Radio CI-V session on {port} at {baud} baud, rig address {address:02X}")
+                # Dial frequency, mode and S-meter are read in the background on the same session
+                self.cat = CatPoller(self.civ, CAT_POLL_SECONDS, on_update=self.on_cat_update)
+                self.cat.start()
+            return self.civ
+
+    def radio(self):
+        # (session, poller) as they stand, either one None
+        with self.radio_lock:
+            return self.civ, self.cat
+
+    def start_cat(self):
+        try:
+            self.radio_session()
+        except ValueError as e:
+            self.log(f"CAT not started: {str(e)}\n")
+
+    def on_cat_update(self, state):
+        # Poller thread
+        if state.error and not self.cat_state.error:
+            self.log(f"CAT: {state.error}\n")
+        self.cat_state = state
+        if state.frequency_hz is not None:
+            meter = f" {s_units(state.s_meter)}" if state.s_meter is not None else ""
+            self.ui.post(self.root.title, f"DIPPER V4.23Alpha by M0OLI - {state.dial}{meter}")
+
+    def dial_tag(self):
+        # "[14.078.000 USB] " for tagging decodes, or "" without a fresh CAT reading
+        state = self.cat_state
+        if state.frequency_time is None or time.time() - state.frequency_time > CAT_STALE_SECONDS:
+            return ""
+        return f"[{state.dial}] "
 
-                if radio in ["Icom IC-703", "Icom IC-705"]:
-                    cmd = bytes.fromhex(f"FE FE {address} E0 1C 00 FD")
-                else:
-                    cmd = bytes.fromhex(f"FE FE {address} E0 1C 00 FD")
-                self.radio_serial.write(cmd)
-                print(f"Sent PTT ON command: {cmd.hex()}")
-                if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Sent PTT ON command: {cmd.hex()}\n")
-            except (serial.SerialException, ValueError) as e:
-                print(f"Failed to start radio transmission: {str(e)}")
-                if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Failed to start radio transmission: {str(e)}\n")
-                if self.radio_serial:
-                    self.radio_serial.close()
-                    self.radio_serial = None
-            except Exception as e:
-                print(f"Unexpected error in start_radio_transmission: {str(e)}")
-                if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Unexpected error in start_radio_transmission: {str(e)}\n")
-                if self.radio_serial:
-                    self.radio_serial.close()
-                    self.radio_serial = None
+    def start_radio_transmission(self):
+        # Returns once the rig has acknowledged PTT, so the audio that follows starts when it is ready
+        try:
+            session = self.radio_session()
+            if session is None:
+                return
+            _, cat = self.radio()
+            if cat:
+                cat.pause()
+            latency = session.ptt(True)
+            print(f"PTT on, acknowledged in {latency * 1000:.0f} ms")
+        except (CivError, ValueError) as e:
+            print(f"Failed to start radio transmission: {str(e)}")
+            self.log(f"Failed to start radio transmission: {str(e)}\n")
 
     def stop_radio_transmission(self):
-        if self.radio_serial and self.radio_serial.is_open:
-            try:
-                radio = self.radio.get()
-                address = self.usb_address.get().replace('H', '').replace('h', '')
-                if not address:
-                    raise ValueError("No address specified for radio communication.")
-                if len(address) != 2 or not all(c in '0123456789ABCDEFabcdef' for c in address):
-                    raise ValueError(f"Invalid address '{address}'. Must be a 2-character hexadecimal value.")
-                address = address.upper()
-
-                if radio in ["Icom IC-703", "Icom IC-705"]:
-                    cmd = bytes.fromhex(f"FE FE {address} E0 1C 01 FD")
-                else:
-                    cmd = bytes.fromhex(f"FE FE {address} E0 1C 01 FD")
-                self.radio_serial.write(cmd)
-                print(f"Sent PTT OFF command: {cmd.hex()}")
-                if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Sent PTT OFF command: {cmd.hex()}\n")
-            except serial.SerialException as e:
-                print(f"Failed to stop radio transmission: {str(e)}")
-                if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Failed to stop radio transmission: {str(e)}\n")
-            finally:
-                if self.radio_serial:
-                    self.radio_serial.close()
-                    self.radio_serial = None
+        session, cat = self.radio()
+        if session is None:
+            return
+        try:
+            latency = session.ptt(False)
+            stats = session.ptt_stats()
+            print(f"PTT off, acknowledged in {latency * 1000:.0f} ms "
+                  f"(key-up avg {stats.keyup_mean * 1000:.0f} ms, max {stats.keyup_max * 1000:.0f} ms)")
+        except CivError as e:
+            print(f"Failed to stop radio transmission: {str(e)}")
+            self.log(f"Failed to stop radio transmission: {str(e)}\n")
+        if cat:
+            cat.resume()
 
 #end of part 4
-    def encode_fec(self, text):
-        symbol_list = []
-        words = text.split()
-        for word in words:
-            if word in WORD_SOUNDS:
-                symbol_list.append(SYMBOL_MAP[word])
-            else:
-                for char in word:
-                    symbol_list.append(SYMBOL_MAP.get(char, SYMBOL_MAP[" "]))
-        speed = self.speed_var.get()
-        if speed == "robust":
-            while len(symbol_list) % 23 != 0:
-                symbol_list.append(SYMBOL_MAP[" "])
-            blocks = [symbol_list[i:i+23] for i in range(0, len(symbol_list), 23)]
-            encoded_blocks = []
-            for block in blocks:
-                encoded = RSCodec.encode(data=block)
-                encoded_blocks.extend(encoded)
-            return encoded_blocks
-        elif speed == "robust_plus":
-            ofdm_symbols = self.encode_ofdm_packet(text, 0)
-            return ofdm_symbols
-        return symbol_list
-
-    def decode_fec(self, symbols):
-        speed = self.speed_var.get()
-        if speed == "robust":
-            blocks = [symbols[i:i+31] for i in range(0, len(symbols), 31)]
-            decoded_text = ""
-            for block in blocks:
-                if len(block) == 31:
-                    try:
-                        if not all(isinstance(s, int) for s in block):
-                            decoded_text += "[ERROR] Invalid symbol data "
-                            continue
-                        decoded = RSCodec.decode(data=block)[0]
-                        decoded_text += "".join(REVERSE_MAP.get(sym, " ") for sym in decoded)
-                    except ReedSolomonError:
-                        decoded_text += "[ERROR] "
-            return decoded_text.strip()
-        elif speed == "robust_plus":
-            if not isinstance(symbols, list) or not all(isinstance(s, tuple) and len(s) == 2 for s in symbols):
-                return "[ERROR] Invalid OFDM data"
-            packet_id, decoded_text = self.decode_ofdm_packet(symbols)
-            return decoded_text.strip()
-        return "".join(REVERSE_MAP.get(sym, " ") for sym in symbols).strip()
-
-    def encode_ofdm_packet(self, text, packet_id):
-        bits = [int(b) for char in text for b in bin(ord(char))[2:].zfill(8)]
-        encoded_bits = self.convolutional_encode(bits)
-        interleaved_bits = self.interleave(encoded_bits)
-        rs_encoded = RSCodec(16).encode(data=interleaved_bits)
-        ofdm_symbols = []
-        tones = 16
-        symbol_rate = 41.6
-        freq_spacing = 150
-        for i in range(0, len(rs_encoded), int(symbol_rate)):
-            chunk = rs_encoded[i:i+int(symbol_rate)]
-            if chunk:
-                freq_idx = sum(chunk) % tones
-                freq = 300 + freq_idx * freq_spacing
-                duration = 0.01
-                ofdm_symbols.append((freq, duration))
-        crc = crc16(text.encode('utf-8'))
-        crc_bits = [int(b) for b in bin(crc)[2:].zfill(16)]
-        for i in range(0, len(crc_bits), int(symbol_rate)):
-            chunk = crc_bits[i:i+int(symbol_rate)]
-            if chunk:
-                freq_idx = sum(chunk) % tones
-                freq = 300 + freq_idx * freq_spacing
-                duration = 0.01
-                ofdm_symbols.append((freq, duration))
-        return ofdm_symbols
-
-    def decode_ofdm_packet(self, symbols):
-        if len(symbols) < 10:
-            print(f"decode_ofdm_packet: Not enough symbols ({len(symbols)}), skipping")
-            return (0, "[ERROR] Insufficient data")
-        decoded_bits = []
-        tones = 16
-        symbol_rate = 41.6
-        freq_spacing = 150
-        for freq, _ in symbols:
-            freq_idx = int((freq - 300) / freq_spacing) % tones
-            bits = [int(b) for b in bin(freq_idx)[2:].zfill(int(np.log2(tones)))]
-            decoded_bits.extend(bits[:int(symbol_rate)])
-        deinterleaved_bits = self.deinterleave(decoded_bits)
-        viterbi_decoded = self.viterbi_decode(deinterleaved_bits)
+    def valid_filter(self, spec):
+        # The passband spec if parse_band accepts it, else "none"
         try:
-            rs_decoded = RSCodec(16).decode(data=viterbi_decoded)[0]
-            text = ""
-            for i in range(0, len(rs_decoded), 8):
-                byte = rs_decoded[i:i+8]
-                if len(byte) == 8:
-                    char = chr(sum(b << (7-j) for j, b in enumerate(byte)))
-                    text += char
-            crc_pos = len(text) - 2
-            if crc_pos <= 0 or not text[crc_pos:].strip():
-                return (0, "[ERROR] Invalid CRC data")
-            crc_received = int(text[crc_pos:], 16)
-            crc_calculated = crc16(text[:crc_pos].encode('utf-8'))
-            if crc_received != crc_calculated:
-                return (0, "[ERROR] CRC mismatch")
-            return (0, text[:crc_pos])
-        except ReedSolomonError:
-            return (0, "[ERROR] Decoding failed")
-
-    def generate_ofdm_sound(self, freq, duration):
-        t = np.linspace(0, duration, int(SAMPLE_RATE * duration), False)
-        signal = np.sin(2 * np.pi * freq * t)
-        return signal / np.max(np.abs(signal))
-
-    def butter_bandpass(self, lowcut, highcut, fs, order=5):
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='band')
-        return b, a
+            parse_band(spec, SAMPLE_RATE)
+        except ValueError as e:
+            print(f"Filter error: {e} Using no filter.")
+            return "none"
+        return spec
+
+    def update_filter(self, *args):
+        # Redesign the bandpass when the filter changes, not on every audio block
+        spec = self.valid_filter(self.filter_var.get())
+        if spec != self.filter_var.get():
+            self.filter_var.set(spec)
+            return
+        self.rx_bandpass.set_band(spec)
 
     def apply_filter(self, data):
-        filter_type = self.filter_var.get()
-        if filter_type == "none":
-            return data
-        elif filter_type == "300-2700":
-            b, a = self.butter_bandpass(300, 2700, SAMPLE_RATE)
-            return lfilter(b, a, data)
-        return data
-
-    def decode_audio(self, data):
-        freqs = np.abs(fft(data)[:len(data)//2])
-        freq_axis = np.linspace(0, SAMPLE_RATE // 2, len(freqs))
-        peak_idx = np.argmax(freqs)
-        peak_freq = freq_axis[peak_idx]
-        
-        sensitivity_value = self.sensitivity.get() / 100.0
-        min_amplitude = 0.01 + (sensitivity_value * 0.99)
-        if np.max(freqs) < min_amplitude * np.max(freqs):
-            return None
+        return self.rx_bandpass.process(data)
 
-        tolerance = 150
-        speed = self.speed_var.get()
-        if speed in ["robust", "robust_plus"]:
-            if speed == "robust":
-                for sym, pattern in CHAR_SOUNDS.items():
-                    start_freq = pattern[0][0]
-                    if abs(peak_freq - start_freq) < tolerance:
-                        return sym
-            else:
-                tones = 16
-                duration = 0.01
-                freq_spacing = 150
-                for freq_idx in range(tones):
-                    expected_freq = 300 + freq_idx * freq_spacing
-                    if abs(peak_freq - expected_freq) < 75:
-                        return (expected_freq, duration)
-        else:
-            for word, pattern in WORD_SOUNDS.items():
-                start_freq = pattern[0][0]
-                if abs(peak_freq - start_freq) < tolerance:
-                    return SYMBOL_MAP[word]
-            for char, pattern in CHAR_SOUNDS.items():
-                start_freq = pattern[0][0]
-                if abs(peak_freq - start_freq) < tolerance:
-                    return SYMBOL_MAP[char]
-        return None
+    def choose_custom_filter(self):
+        spec = simpledialog.askstring("Frequency Filter", "Passband in Hz (e.g. 500-2500):", 
+                                      initialvalue=self.filter_var.get() if self.filter_var.get() != "none" else "300-2700", 
+                                      parent=self.root)
+        if not spec:
+            return
+        try:
+            band = parse_band(spec, SAMPLE_RATE)
+        except ValueError as e:
+            messagebox.showwarning("Filter Warning", str(e))
+            return
+        self.filter_var.set(f"{band[0]:g}-{band[1]:g}" if band else "none")
+        if self.rx_output:
+            self.log(f"Filter set to {self.filter_var.get()}\n")
 
+    # The indicator methods are called from the audio threads, so they post
+    # the actual change to the Tk thread
     def set_v4_tx_indicator(self):
-        if self.indicator_timeout is not None:
-            self.root.after_cancel(self.indicator_timeout)
-        self.v4_indicator.itemconfig("robust_mode_light", fill="red")
+        self.ui.post(self.show_indicator, self.v4_indicator, "robust_mode_light", "red")
 
     def set_v4_rx_indicator(self):
-        self.v4_indicator.itemconfig("robust_mode_light", fill="green")
-        if self.indicator_timeout is not None:
-            self.root.after_cancel(self.indicator_timeout)
-        self.indicator_timeout = self.root.after(3000, self.reset_indicator)
+        self.ui.post(self.show_indicator, self.v4_indicator, "robust_mode_light", "green", self.reset_indicator)
 
     def set_robust_plus_tx_indicator(self):
-        if self.indicator_timeout is not None:
-            self.root.after_cancel(self.indicator_timeout)
-        self.robust_plus_indicator.itemconfig("robust_plus_mode_light", fill="orange")
+        self.ui.post(self.show_indicator, self.robust_plus_indicator, "robust_plus_mode_light", "orange")
 
     def set_robust_plus_rx_indicator(self):
-        self.robust_plus_indicator.itemconfig("robust_plus_mode_light", fill="yellow")
-        if self.indicator_timeout is not None:
-            self.root.after_cancel(self.indicator_timeout)
-        self.indicator_timeout = self.root.after(3000, self.reset_robust_plus_indicator)
+        self.ui.post(self.show_indicator, self.robust_plus_indicator, "robust_plus_mode_light", "yellow",
+                     self.reset_robust_plus_indicator)
 
     def reset_indicator(self):
-        self.v4_indicator.itemconfig("robust_mode_light", fill="grey")
-        self.indicator_timeout = None
+        self.ui.post(self.show_indicator, self.v4_indicator, "robust_mode_light", "grey", cancel=False)
 
     def reset_robust_plus_indicator(self):
-        self.robust_plus_indicator.itemconfig("robust_plus_mode_light", fill="grey")
-        self.indicator_timeout = None
+        self.ui.post(self.show_indicator, self.robust_plus_indicator, "robust_plus_mode_light", "grey", cancel=False)
+
+    def show_indicator(self, canvas, light, colour, reset=None, cancel=True):
+        # Tk thread only. An RX light goes back to grey by itself after 3 s.
+        if cancel and self.indicator_timeout is not None:
+            self.root.after_cancel(self.indicator_timeout)
+        self.indicator_timeout = self.root.after(3000, reset) if reset else None
+        canvas.itemconfig(light, fill=colour)
 
     def receive_loop(self):
-        buffer = []
-        gap_map = {"normal": 0.05, "robust": 0.025, "robust_plus": 0.005}
-        duration_map = {"normal": 0.1, "robust": 0.05, "robust_plus": 0.01}
-        preamble_detected = False
         last_update_time = time.time()
         update_interval = 2.0
+        receivers = None
+        # This DSP worker pulls from the capture ring at its own pace
+        reader = self.rx_capture.reader()
+        reported = (0, 0, 0)
 
         while self.running:
             try:
                 speed = self.speed_var.get()
-                if speed not in duration_map:
+                if speed not in MODES and speed != "auto":
                     raise ValueError(f"Invalid speed setting: '{speed}'.")
-                
-                duration = duration_map[speed]
-                chunk_size = int(SAMPLE_RATE * (duration + gap_map[speed] * 2))
-                data = self.stream_in.read(chunk_size, exception_on_overflow=False)
-                if not data:
-                    time.sleep(0.01)
+                # Auto listens for both packet modes and every code rate the link adapter may pick
+                names = ["robust", "robust_plus"] if speed == "auto" else [speed]
+                if receivers is None or [r.mode.name for r in receivers] != names:
+                    receivers = [self.modem.receiver(MODES[name], receive_codes(name) if MODES[name].packetized else None)
+                                 for name in names]
+
+                # Blocks of any size suit the sliding analyzers, so after a
+                # long decode the backlog is taken in a few large reads
+                data = reader.read(RX_MAX_BLOCK, timeout=0.1)
+                if not len(data):
                     continue
-                data = np.frombuffer(data, dtype=np.float32)
+                losses = (reader.dropped, self.rx_capture.overflows, self.rx_capture.underruns)
+                if losses != reported:
+                    reported = losses
+                    if self.rx_output:
+                        self.log(f"Capture: {losses[0]} samples lost behind decoding, "
+                                                      f"{losses[1]} input overflows, {losses[2]} underruns\n")
                 gain = self.input_volume.get() / 100.0
                 data = data * gain
                 data = self.apply_filter(data)
 
-                if not preamble_detected and len(buffer) == 0:
-                    if self.detect_v4_preamble(data[:int(SAMPLE_RATE * 0.4)]):
-                        self.is_v4_mode = True
-                        self.set_v4_rx_indicator()
-                        preamble_detected = True
-                        continue
-                    elif self.detect_robust_plus_preamble(data[:int(SAMPLE_RATE * 0.4)]):
-                        self.is_v4_mode = True
-                        self.set_robust_plus_rx_indicator()
-                        preamble_detected = True
-                        continue
-
-                symbol = self.decode_audio(data)
-                if symbol is not None:
-                    if speed in ["robust", "robust_plus"]:
-                        buffer.append(symbol)
-                        expected_buffer_size = 31 if speed == "robust" else 30
-                        if len(buffer) >= expected_buffer_size:
-                            result = (self.decode_v4_packet(buffer) if speed == "robust" 
-                                     else self.decode_ofdm_packet(buffer))
-                            if result is None or len(result) != 2:
-                                buffer.clear()
-                                preamble_detected = False
-                                self.is_v4_mode = False
-                                self.reset_robust_plus_indicator() if speed == "robust_plus" else self.reset_indicator()
-                                continue
-                            packet_id, decoded_text = result
-                            if decoded_text and packet_id not in self.packet_buffer:
-                                self.packet_buffer[packet_id] = decoded_text
-                                preamble = "1357924" if speed == "robust" else "2468135"
-                                self.display_received_text(f"{'Robust' if speed == 'robust' else 'Robust+'} RX (Preamble: {preamble}): " + decoded_text + "\n", "received")
-                                self.send_ack_nack(packet_id, True)
-                                self.rx_ack = "K"
-                            elif not decoded_text:
-                                self.send_ack_nack(packet_id, False)
-                                self.rx_ack = "N"
-                            buffer.clear()
-                            preamble_detected = False
-                            self.is_v4_mode = False
-                            self.reset_robust_plus_indicator() if speed == "robust_plus" else self.reset_indicator()
-                    else:
-                        buffer.append(symbol)
-                        if len(buffer) >= 1:
-                            decoded_text = self.decode_fec(buffer[:1])
-                            self.temp_receive_buffer.extend(decoded_text)
-                            buffer = buffer[1:]
-                        current_time = time.time()
-                        if not hasattr(self, 'dynamic_width'):
-                            self.update_dynamic_width(None)
-                        buffer_text = "".join(self.temp_receive_buffer)
-                        if (len(buffer_text) >= self.dynamic_width or 
-                            current_time - last_update_time >= update_interval or not self.running):
-                            if self.temp_receive_buffer:
-                                self.display_received_text(buffer_text + "\n")
-                                self.temp_receive_buffer = []
-                            last_update_time = current_time
-                time.sleep(0.01)
+                for receiver in receivers:
+                    receiver.sensitivity = self.sensitivity.get()
+                    for event in receiver.push(data):
+                        if event.kind == "preamble":
+                            self.is_v4_mode = True
+                            if event.mode == "robust_plus":
+                                self.set_robust_plus_rx_indicator()
+                            else:
+                                self.set_v4_rx_indicator()
+                        elif event.kind == "packet":
+                            self.handle_rx_packet(receiver.mode, event.packet_id, event.text, event.snr)
+                        else:
+                            self.temp_receive_buffer.extend(event.text)
+                current_time = time.time()
+                if speed == "normal":
+                    if not hasattr(self, 'dynamic_width'):
+                        self.update_dynamic_width(None)
+                    buffer_text = "".join(self.temp_receive_buffer)
+                    if (len(buffer_text) >= self.dynamic_width or 
+                        current_time - last_update_time >= update_interval or not self.running):
+                        if self.temp_receive_buffer:
+                            self.display_received_text(self.dial_tag() + buffer_text + "\n")
+                            self.temp_receive_buffer = []
+                        last_update_time = current_time
             except Exception as e:
                 if self.running:
                     if self.rx_output:
-                        self.rx_output.insert(tk.END, f"Receive loop error: {str(e)}\n")
+                        self.log(f"Receive loop error: {str(e)}\n")
                     print(f"Receive loop error: {e}")
                 break
 
+    def handle_rx_packet(self, mode, packet_id, decoded_text, snr=None):
+        frame = ArqFrame.parse(packet_id, decoded_text)
+        if frame is None:
+            words = (decoded_text or "").split()
+            if "DE" in words[:-1]:
+                # The sender's SNR here stands in for ours at their end when adapting the rate
+                self.link.report_snr(words[words.index("DE") + 1], snr)
+            if decoded_text:
+                self.display_received_text(f"{self.dial_tag()}{mode.label} RX (Preamble: {mode.preamble}): " + decoded_text + "\n", "received")
+        else:
+            now = time.monotonic()
+            with self.arq_lock:
+                peer, rate = self.arq_peer, self.arq_rate
+                if frame.kind == "ack":
+                    results = self.arq_tx.on_ack(frame)
+                    messages = []
+                else:
+                    if now - self.arq_heard > ARQ_IDLE:
+                        self.arq_rx.reset()
+                    messages = self.arq_rx.on_frame(frame)
+                    results = []
+                self.arq_heard = now
+            if frame.kind == "data":
+                # ACK the whole over at once, in the mode it came in
+                self.tx_queue.put(("ack", mode), TX_ACK, ARQ_ACK_DELAY, key="ack")
+            if peer:
+                self.link.report_snr(peer, snr)
+            for sent, ok in results:
+                if rate:
+                    self.link.report_ack(peer, rate, ok, len(sent.text.encode("utf-8")))
+            if results:
+                if all(ok for _, ok in results):
+                    self.schedule_over()
+                else:
+                    # Missing frames wait out the adapter's backoff before going again
+                    self.schedule_over(self.link.retry_delay(peer) if rate else 0.0, TX_RETRANSMIT)
+            if results and rate and self.rx_output:
+                status = self.link.status(peer)
+                goodput = "-" if status.goodput is None else f"{status.goodput:.0f}"
+                self.log(f"Link {peer}: {status.rate}, goodput {goodput} bit/s\n")
+            for message in messages:
+                self.display_received_text(f"{self.dial_tag()}{mode.label} RX (Preamble: {mode.preamble}): " + message + "\n", "received")
+        self.is_v4_mode = False
+        if mode.name == "robust_plus":
+            self.reset_robust_plus_indicator()
+        else:
+            self.reset_indicator()
+
+    def log(self, text, tag=""):
+        # Append to the receive pane from any thread
+        if self.rx_output:
+            self.ui.post_text(self.rx_output, text, tag)
+
     def display_received_text(self, text, tag=""):
         if not self.rx_output:
             return
 
         if not hasattr(self, 'dynamic_width'):
             self.update_dynamic_width(None)
-        widget_width = self.dynamic_width
-
-        for char in text:
-            self.receive_buffer.append(char)
-            if len(self.receive_buffer) >= widget_width:
-                self.rx_output.insert(tk.END, ''.join(self.receive_buffer) + "\n", tag)
-                self.receive_buffer = []
-
-        if self.receive_buffer:
-            remaining_text = ''.join(self.receive_buffer)
-            if remaining_text:
-                self.rx_output.insert(tk.END, remaining_text + "\n", tag)
-            self.receive_buffer = []
-
-        self.rx_output.see(tk.END)
+        width = self.dynamic_width
+        # Wrapped to the pane and handed over as one piece
+        self.log("".join(text[i:i + width] + "\n" for i in range(0, len(text), width)), tag)
 
 #end of part 5
     def on_closing(self):
         self.running = False
+        self.ui.stop()
+        self.tx_queue.close()
+        self.tx_writer.close()
+        self.rx_capture.close()
         if self.stream_out:
             try:
                 self.stream_out.stop_stream()
@@ -1241,8 +1063,12 @@ class DipperModeApp:
             self.tx_thread.join(timeout=1.0)
         self.rx_thread = None
         self.tx_thread = None
-        if self.radio_serial and self.radio_serial.is_open:
+        session, cat = self.radio()
+        if cat:
+            cat.stop()
+        if session:
             self.stop_radio_transmission()
+            session.close()
         if self.p:
             try:
                 self.p.terminate()
@@ -1275,7 +1101,7 @@ class DipperModeApp:
                 self.my_callsign.insert(0, new_callsign)
                 self.my_callsign.config(state="disabled")
                 if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Callsign updated to: {new_callsign}\n")
+                    self.log(f"Callsign updated to: {new_callsign}\n")
                 user_window.destroy()
             else:
                 messagebox.showwarning("Warning", "Callsign cannot be empty!", parent=user_window)
@@ -1338,19 +1164,18 @@ class DipperModeApp:
                     self.stream_in.stop_stream()
                     self.stream_in.close()
                 if self.stream_out:
+                    self.tx_writer.close()
                     self.stream_out.stop_stream()
                     self.stream_out.close()
 
-                self.stream_out = self.p.open(format=pyaudio.paFloat32, channels=1, rate=SAMPLE_RATE, output=True, 
-                                            output_device_index=output_idx)
-                self.stream_in = self.p.open(format=pyaudio.paFloat32, channels=1, rate=SAMPLE_RATE, input=True, 
-                                           frames_per_buffer=CHUNK, input_device_index=input_idx)
+                self.stream_out = self.tx_writer.open(self.p, SAMPLE_RATE, output_idx, CHUNK)
+                self.stream_in = self.rx_capture.open(self.p, SAMPLE_RATE, input_idx, CHUNK)
                 if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Audio devices updated to Input: {input_idx}, Output: {output_idx}\n")
+                    self.log(f"Audio devices updated to Input: {input_idx}, Output: {output_idx}\n")
                 print(f"Audio devices updated - Input device: {input_idx}, Output device: {output_idx}")
             except OSError as e:
                 if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Audio update error: {str(e)}\n")
+                    self.log(f"Audio update error: {str(e)}\n")
                 print(f"Audio update error: {str(e)}. Please check the selected device.")
                 if self.root and self.rx_output:
                     self.root.after(0, lambda: messagebox.showwarning("Audio Error", 
@@ -1361,7 +1186,7 @@ class DipperModeApp:
                     self.running = False
             except Exception as e:
                 if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Audio update failed: {str(e)}\n")
+                    self.log(f"Audio update failed: {str(e)}\n")
                 print(f"Audio update error: {e}")
                 if self.root and self.rx_output:
                     self.root.after(0, lambda: messagebox.showwarning("Audio Warning", 
@@ -1389,10 +1214,10 @@ class DipperModeApp:
             self.save_settings()
             self.update_audio_devices()
             if self.rx_output:
-                self.rx_output.insert(tk.END, "Audio settings saved and devices updated.\n")
+                self.log("Audio settings saved and devices updated.\n")
         except Exception as e:
             if self.rx_output:
-                self.rx_output.insert(tk.END, f"Error saving audio settings: {str(e)}\n")
+                self.log(f"Error saving audio settings: {str(e)}\n")
             print(f"Error saving audio settings: {e}")
 
     def show_radio_settings_window(self):
@@ -1482,7 +1307,7 @@ class DipperModeApp:
         self.tx_info_label.pack(side="left", padx=5)
         self.radio.trace("w", self.update_tx_info)
 
-        tk.Button(settings_window, text="Save", command=lambda: [self.save_settings(), settings_window.destroy()], 
+        tk.Button(settings_window, text="Save", command=lambda: [self.save_settings(), self.start_cat(), settings_window.destroy()], 
                   fg=self.current_colors["fg"], bg=self.current_colors["button_bg"]).pack(pady=5)
         tk.Button(settings_window, text="Test PTT", command=self.test_ptt_connection, 
                   fg=self.current_colors["fg"], bg=self.current_colors["button_bg"]).pack(pady=5)
@@ -1495,7 +1320,7 @@ class DipperModeApp:
         else:
             self.usb_address.set("00")
             if self.rx_output:
-                self.rx_output.insert(tk.END, "Warning: Generic radio selected. Set a valid 2-digit hex address (e.g., '26').\n")
+                self.log("Warning: Generic radio selected. Set a valid 2-digit hex address (e.g., '26').\n")
         if radio == "Generic":
             self.mode_usb.set(False)
             self.mode_usb_digital.set(False)
@@ -1516,58 +1341,6 @@ class DipperModeApp:
         radio = self.radio.get()
         self.tx_info_label.config(text=self.radio_tx_info.get(radio, ""))
 
-    def communicate_with_radio(self, command):
-        if self.serial_port.get() != "NONE" and self.baud_rate.get():
-            try:
-                radio = self.radio.get()
-                address = self.usb_address.get().replace('H', '').replace('h', '')
-                if not address:
-                    raise ValueError("No address specified for radio communication.")
-                if len(address) != 2 or not all(c in '0123456789ABCDEFabcdef' for c in address):
-                    raise ValueError(f"Invalid address '{address}'. Must be a 2-character hexadecimal value.")
-                address = address.upper()
-
-                if not self.radio_serial or not self.radio_serial.is_open:
-                    self.radio_serial = serial.Serial(
-                        port=self.serial_port.get(),
-                        baudrate=int(self.baud_rate.get()) if self.baud_rate.get().isdigit() else 9600,
-                        timeout=0.1,
-                        rtscts=self.rts.get(),
-                        dsrdtr=self.dtr.get()
-                    )
-                    print(f"Radio serial connection established on {self.serial_port.get()} at {self.baud_rate.get()} baud")
-                    if self.rx_output:
-                        self.rx_output.insert(tk.END, f"Radio connection established on {self.serial_port.get()}\n")
-
-                if command == "READ_FREQ":
-                    if radio in ["Icom IC-703", "Icom IC-705"]:
-                        cmd = bytes.fromhex(f"FE FE {address} E0 03 FD")
-                    else:
-                        cmd = bytes.fromhex(f"FE FE {address} E0 03 FD")
-                    self.radio_serial.write(cmd)
-                    time.sleep(0.1)
-                    if self.radio_serial.in_waiting > 0:
-                        response = self.radio_serial.read(self.radio_serial.in_waiting).hex()
-                        print(f"Received frequency: {response}")
-                        if self.rx_output:
-                            self.rx_output.insert(tk.END, f"Received frequency: {response}\n")
-                            self.rx_output.see(tk.END)
-                else:
-                    print(f"Unknown command: {command}")
-                    if self.rx_output:
-                        self.rx_output.insert(tk.END, f"Unknown radio command: {command}\n")
-            except (serial.SerialException, ValueError) as e:
-                print(f"Radio communication error: {str(e)}")
-                if self.rx_output:
-                    self.rx_output.insert(tk.END, f"Radio communication error: {str(e)}\n")
-                if self.radio_serial:
-                    self.radio_serial.close()
-                    self.radio_serial = None
-        else:
-            print("No serial port or baud rate selected for radio communication.")
-            if self.rx_output:
-                self.rx_output.insert(tk.END, "No serial port or baud rate selected for radio communication.\n")
-
 if __name__ == "__main__":
     try:
         print("Starting main")
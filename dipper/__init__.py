@@ -0,0 +1,22 @@
+from .waveforms import WaveformBank, render_pattern
+from .txstream import StreamingTransmitter, TxRingBuffer
+from .txqueue import TX_ACK, TX_NEW, TX_RETRANSMIT, TxQueueStats, TxScheduler
+from .rxstream import RxReader, RxRingBuffer, StreamingReceiver
+from .uibridge import UiBridge
+from .civ import CivError, CivFrame, CivParser, CivSession, PttStats
+from .cat import CIV_MODES, CatPoller, CatState, bcd_to_int, s_units
+from .fec import Trellis, viterbi_decode, viterbi_decode_costs, viterbi_decode_llr
+from .demod import SoftDemodulator
+from .tonebank import ToneDetectorBank
+from .rxengine import SlidingToneAnalyzer, SymbolTimingRecovery
+from .filters import StreamingBandpass, bandpass_sos, parse_band
+from .modes import MODES, Mode, ModemConfig, get_mode
+from .codec import (decode_fec, decode_ofdm_packet, decode_packet, encode_fec, encode_ofdm_packet, encode_v4_packet,
+                    find_v4_packet)
+from .ofdm import OfdmModem, OfdmParams
+from .modem import Modem, ModemReceiver, RxEvent
+from .linkadapt import RATES, LinkAdapter, LinkStatus, Rate, receive_codes
+from .arq import ArqFrame, ArqReceiver, ArqSender, fragment
+from .sync import PreambleCorrelator, PreambleMatch, shift_frequency
+from .wideband import WidebandDecoder, channel_symbols, decode_channel
+from .channel import ChannelModel
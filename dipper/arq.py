@@ -0,0 +1,301 @@
+import time
+from dataclasses import dataclass
+
+SEQ_SPACE = 16                # sequence numbers ride in the 4-bit packet id
+MAX_WINDOW = SEQ_SPACE // 2   # selective repeat needs the window within half the space
+
+# Control character leading the text of each frame: fragment position, or ACK
+_MARKERS = {(True, True): "\x03", (True, False): "\x02", (False, False): "\x01", (False, True): "\x04"}
+_POSITIONS = {marker: position for position, marker in _MARKERS.items()}
+_ACK = "\x06"
+
+
+def fragment(text, size):
+    # Split text into pieces of at most `size` UTF-8 bytes, never inside a character
+    pieces, piece, used = [], "", 0
+    for char in text:
+        n = len(char.encode("utf-8"))
+        if used + n > size and piece:
+            pieces.append(piece)
+            piece, used = "", 0
+        piece += char
+        used += n
+    pieces.append(piece)
+    return pieces
+
+
+@dataclass
+class ArqFrame:
+    # One ARQ packet. Data frames carry a fragment of a message, flagged as
+    # its first and/or last, and in base the oldest sequence number the
+    # sender still holds. ACK frames carry in seq the next sequence number
+    # the receiver wants, and in bitmap which of the following ones it
+    # already holds (bit i for seq + 1 + i). Frames go on air as ordinary
+    # packets: the sequence number is the packet id and a control character
+    # leads the text, so they cannot be mistaken for plain traffic.
+    kind: str            # "data" or "ack"
+    seq: int
+    payload: str = ""
+    first: bool = True
+    last: bool = True
+    base: int = 0
+    bitmap: int = 0
+
+    @property
+    def text(self):
+        if self.kind == "ack":
+            return f"{_ACK}{self.seq:X}{self.bitmap:02X}"
+        return f"{_MARKERS[(self.first, self.last)]}{self.base:X}{self.payload}"
+
+    @property
+    def packet_id(self):
+        return self.seq
+
+    @classmethod
+    def parse(cls, packet_id, text):
+        # The frame a decoded packet carries, or None for a packet sent outside ARQ
+        if not text:
+            return None
+        if text[0] == _ACK and len(text) == 4:
+            try:
+                return cls("ack", int(text[1], 16), bitmap=int(text[2:], 16))
+            except ValueError:
+                return None
+        if text[0] in _POSITIONS and len(text) >= 2 and packet_id is not None:
+            try:
+                base = int(text[1], 16)
+            except ValueError:
+                return None
+            first, last = _POSITIONS[text[0]]
+            return cls("data", packet_id % SEQ_SPACE, text[2:], first, last, base)
+        return None
+
+
+class _Outstanding:
+    def __init__(self, frame, message):
+        self.frame = frame
+        self.message = message
+        self.sent = None      # time of the last sending
+        self.tries = 0
+        self.due = True       # to be (re)sent in the next over
+
+
+class ArqSender:
+    # Selective-repeat sender for one link. send() queues a message as
+    # numbered fragments. next_over() hands out the frames for the next
+    # transmission: outstanding ones the peer reported missing or whose ACK
+    # timed out, then new ones while fewer than `window` are outstanding.
+    # on_ack() retires what the peer holds and marks the rest of the over
+    # for resending. A frame still missing after max_tries sendings is
+    # dropped with the rest of its message; the base carried by the next
+    # frames tells the receiver to skip it. Not thread-safe: callers hold
+    # their own lock.
+
+    def __init__(self, window=4, fragment_size=24, timeout=10.0, max_tries=5, clock=time.monotonic):
+        if not 1 <= window <= MAX_WINDOW:
+            raise ValueError(f"ARQ window must be 1-{MAX_WINDOW}, got {window}.")
+        self.window = window
+        self.fragment_size = fragment_size
+        self.timeout = timeout
+        self.max_tries = max_tries
+        self.clock = clock
+        self.next_seq = 0
+        self.acked = 0            # next sequence number the peer wants, as last heard
+        self._stalled = None      # since when only a missing ACK holds back new frames
+        self._probe = None        # a frame given up on, to ask for that ACK with
+        self._queue = []          # (payload, first, last, message number)
+        self._outstanding = {}    # seq -> _Outstanding, oldest first
+        self._failed = set()      # message numbers given up on
+        self._pending = {}        # message number -> fragments not yet acknowledged
+        self._messages = 0
+        self.frames_sent = 0
+        self.retransmissions = 0
+        self.messages_delivered = 0
+        self.messages_failed = 0
+
+    @property
+    def idle(self):
+        return not self._queue and not self._outstanding
+
+    @property
+    def base(self):
+        # Oldest sequence number not yet acknowledged
+        return next(iter(self._outstanding), self.next_seq)
+
+    @property
+    def outstanding(self):
+        return len(self._outstanding)
+
+    def send(self, text):
+        # Queue a message; returns its number
+        number = self._messages
+        self._messages += 1
+        pieces = fragment(text, self.fragment_size)
+        self._pending[number] = len(pieces)
+        for i, piece in enumerate(pieces):
+            self._queue.append((piece, i == 0, i == len(pieces) - 1, number))
+        return number
+
+    def next_timeout(self, now=None):
+        # Seconds until an unanswered over times out (0 if frames are due now), or None
+        now = self.clock() if now is None else now
+        waits = [0.0 if o.due else max(0.0, o.sent + self.timeout - now) for o in self._outstanding.values()]
+        if self._queue and self._can_open():
+            waits.append(0.0)
+        elif self._queue and self._probe is not None and not self._outstanding:
+            waits.append(0.0 if self._stalled is None else max(0.0, self._stalled + self.timeout - now))
+        return min(waits) if waits else None
+
+    def next_over(self, now=None):
+        # Frames to send now, in sequence order; marks them sent
+        now = self.clock() if now is None else now
+        frames = []
+        for out in list(self._outstanding.values()):
+            if not out.due and now - out.sent < self.timeout:
+                continue
+            if out.tries >= self.max_tries:
+                self._give_up(out.message)
+                continue
+            frames.append(out)
+        while self._queue and self._can_open():
+            payload, first, last, number = self._queue.pop(0)
+            if number in self._failed:
+                continue
+            out = _Outstanding(ArqFrame("data", self.next_seq, payload, first, last), number)
+            self._outstanding[self.next_seq] = out
+            self.next_seq = (self.next_seq + 1) % SEQ_SPACE
+            frames.append(out)
+        base = self.base
+        frames = [self._sent(out, base, now) for out in frames if out.message not in self._failed]
+        if not frames and self._queue and self._probe is not None and not self._outstanding:
+            # Only an ACK lost after a message was given up holds things
+            # back: resend a frame given up on, which the peer drops as a
+            # duplicate of an old one but answers.
+            if self._stalled is None or now - self._stalled >= self.timeout:
+                self._stalled = now
+                self._probe.base = base
+                self.frames_sent += 1
+                frames.append(self._probe)
+        return frames
+
+    def _can_open(self):
+        # New frames stay within `window` of the base, and the base they
+        # carry within MAX_WINDOW - 1 of what the peer last acknowledged, so
+        # the receiver can tell both from old ones even after messages were
+        # given up
+        return ((self.next_seq - self.base) % SEQ_SPACE < self.window
+                and (self.next_seq - self.acked) % SEQ_SPACE < MAX_WINDOW - 1)
+
+    def _sent(self, out, base, now):
+        out.frame.base = base
+        if out.tries:
+            self.retransmissions += 1
+        out.sent, out.due = now, False
+        out.tries += 1
+        self.frames_sent += 1
+        return out.frame
+
+    def _give_up(self, message):
+        if message in self._pending:
+            del self._pending[message]
+            self._failed.add(message)
+            self.messages_failed += 1
+        for seq in [s for s, o in self._outstanding.items() if o.message == message]:
+            self._probe = self._outstanding.pop(seq).frame
+
+    def on_ack(self, ack):
+        # Apply an ACK frame. Returns [(frame, delivered)] for every frame
+        # sent since the last ACK, for the caller's link statistics.
+        if (ack.seq - self.acked) % SEQ_SPACE <= MAX_WINDOW:
+            self.acked = ack.seq
+        self._stalled = None
+        results = []
+        for seq, out in list(self._outstanding.items()):
+            if out.sent is None or out.due:
+                continue
+            behind = (ack.seq - seq) % SEQ_SPACE
+            ahead = (seq - ack.seq) % SEQ_SPACE
+            if 1 <= behind <= MAX_WINDOW or (1 <= ahead < MAX_WINDOW and ack.bitmap >> (ahead - 1) & 1):
+                del self._outstanding[seq]
+                self._pending[out.message] -= 1
+                if not self._pending[out.message]:
+                    del self._pending[out.message]
+                    self.messages_delivered += 1
+                results.append((out.frame, True))
+            else:
+                out.due = True
+                results.append((out.frame, False))
+        return results
+
+    def reset(self):
+        self._queue.clear()
+        self._outstanding.clear()
+        self._pending.clear()
+        self.acked, self._stalled, self._probe = self.next_seq, None, None
+
+
+class ArqReceiver:
+    # Selective-repeat receiver for one link: frames may arrive out of order
+    # or more than once, and on_frame() returns the messages they complete,
+    # in order. Where the sequence starts, and any gap the sender has given
+    # up on, comes from the base the data frames carry; a message that loses
+    # a fragment that way is dropped whole.
+
+    def __init__(self):
+        self.base = None          # next sequence number to deliver
+        self._buffer = {}         # seq -> frame, within the window after base
+        self._partial = []        # fragments of the message being rebuilt; None while resyncing
+        self.duplicates = 0
+        self.messages_dropped = 0
+
+    def on_frame(self, frame):
+        if self.base is None:
+            self.base = frame.base
+        messages = []
+        if 1 <= (frame.base - self.base) % SEQ_SPACE < MAX_WINDOW:
+            messages = self._deliver(until=frame.base)
+        if (frame.seq - self.base) % SEQ_SPACE >= MAX_WINDOW or frame.seq in self._buffer:
+            self.duplicates += 1   # the next ACK tells the sender it arrived
+        else:
+            self._buffer[frame.seq] = frame
+        return messages + self._deliver()
+
+    def _deliver(self, until=None):
+        # Deliver in order from base: first every slot up to `until`, skipping
+        # the missing frames, then whatever is buffered in order after it
+        messages = []
+        while (self.base != until) if until is not None else (self.base in self._buffer):
+            frame = self._buffer.pop(self.base, None)
+            self.base = (self.base + 1) % SEQ_SPACE
+            if frame is None:
+                if self._partial:
+                    self.messages_dropped += 1
+                self._partial = None
+                continue
+            if frame.first:
+                if self._partial:
+                    self.messages_dropped += 1   # its last fragment never came
+                self._partial = []
+            if self._partial is None:
+                continue
+            self._partial.append(frame.payload)
+            if frame.last:
+                messages.append("".join(self._partial))
+                self._partial = []
+        return messages
+
+    def ack(self):
+        # ACK frame for the current state, or None before any frame
+        if self.base is None:
+            return None
+        bitmap = 0
+        for seq in self._buffer:
+            ahead = (seq - self.base) % SEQ_SPACE
+            if 1 <= ahead < MAX_WINDOW:
+                bitmap |= 1 << (ahead - 1)
+        return ArqFrame("ack", self.base, bitmap=bitmap)
+
+    def reset(self):
+        self.base = None
+        self._buffer.clear()
+        self._partial = []
@@ -0,0 +1,301 @@
+"""Timing runs for the modem pipeline, written out as JSON.
+
+    python -m dipper.bench --out bench.json
+    python -m dipper.bench --quick --baseline bench.json --tolerance 0.25
+
+Every case is timed `repeat` times; each timing runs the call `number` times
+and the per-call minimum is the headline figure. With --baseline, cases that
+got slower than the tolerance are listed and the exit status is 1.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import mean, median
+
+import numpy as np
+
+from .codec import (ROBUST_MAX_BYTES, decode_ofdm_packet, decode_v4_packet, encode_fec, encode_ofdm_packet,
+                    encode_v4_packet)
+from .fec import reed_solomon, viterbi_decode, viterbi_decode_llr
+from .modem import Modem
+from .modes import MODES, ModemConfig
+from .symbols import CHAR_SOUNDS, CONV_CODES, CONV_TRELLIS, V4_REVERSE_MAP
+from .waveforms import render_pattern
+
+MESSAGE_SIZES = (1, 8, 32, 128)
+BIT_SIZES = (256, 4096, 65536)
+RX_CHUNK = 1024
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 "
+
+
+def message(size, seed=0):
+    rng = np.random.default_rng(seed)
+    return "".join(rng.choice(list(ALPHABET), size))
+
+
+def time_call(fn, repeat=5, number=1):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return timings
+
+
+def autorange(fn, budget=0.05):
+    # Calls per timing so one timing takes roughly `budget` seconds
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= budget or number >= 1 << 20:
+            return number
+        number *= 2
+
+
+class Case:
+    # name/mode/size identify a result across runs; items and unit scale the
+    # throughput (characters, bits or samples handled per call).
+
+    def __init__(self, name, mode, size, setup, items=None, unit="call"):
+        self.name = name
+        self.mode = mode
+        self.size = size
+        self.setup = setup
+        self.items = items or 1
+        self.unit = unit
+
+    @property
+    def key(self):
+        return f"{self.name}[{self.mode}:{self.size}]"
+
+
+def build_cases(modem, sizes=MESSAGE_SIZES, bit_sizes=BIT_SIZES):
+    sr = modem.sample_rate
+    cases = []
+
+    for mode in MODES.values():
+        pattern = CHAR_SOUNDS["C"]
+        duration = mode.symbol_duration
+        cases.append(Case("generate_sound", mode.name, 1,
+                          lambda p=pattern, d=duration: (lambda: render_pattern(p, d, sr)),
+                          int(sr * duration), "sample"))
+
+    for size in sizes:
+        text = message(size)
+        # Robust packets stop at ROBUST_MAX_BYTES
+        robust = size <= ROBUST_MAX_BYTES
+        if robust:
+            cases.append(Case("encode_v4_packet", "robust", size,
+                              lambda t=text: (lambda: encode_v4_packet(t, 1)), size, "char"))
+
+            def v4_decode(t=text, soft=False):
+                symbols = encode_v4_packet(t, 1)
+                if not soft:
+                    return lambda: decode_v4_packet(symbols)
+                bits = [(V4_REVERSE_MAP.get(s, 0) >> (3 - j)) & 1 for s in symbols for j in range(4)]
+                llrs = [np.where(np.array(bits[i:i + 4]) == 0, 4.0, -4.0) for i in range(0, len(bits), 4)]
+                return lambda: decode_v4_packet(symbols, llrs)
+            cases.append(Case("decode_v4_packet", "robust", size, v4_decode, size, "char"))
+            cases.append(Case("decode_v4_packet_soft", "robust", size,
+                              lambda t=text: v4_decode(t, soft=True), size, "char"))
+
+        cases.append(Case("encode_ofdm_packet", "robust_plus", size,
+                          lambda t=text: (lambda: encode_ofdm_packet(t, 1)), size, "char"))
+        cases.append(Case("decode_ofdm_packet", "robust_plus", size,
+                          lambda t=text: (lambda s=encode_ofdm_packet(t, 1): decode_ofdm_packet(s)),
+                          size, "char"))
+
+        for mode in MODES.values():
+            cases.append(Case("encode_fec", mode.name, size,
+                              lambda t=text, m=mode: (lambda: encode_fec(t, m)), size, "char"))
+            if mode.name == "robust" and not robust:
+                continue
+            cases.append(Case("modulate", mode.name, size,
+                              lambda t=text, m=mode: (lambda: modem.modulate(t, m, 1)), size, "char"))
+
+            def rx_decode(t=text, m=mode):
+                signal = modem.modulate(t, m, 1)
+                blocks = [signal[i:i + RX_CHUNK] for i in range(0, len(signal), RX_CHUNK)]
+
+                def run():
+                    receiver = modem.receiver(m)
+                    for block in blocks:
+                        receiver.push(block)
+                return run, len(signal)
+            cases.append(Case("rx_chunk_decoder", mode.name, size, rx_decode, unit="sample"))
+
+    rng = np.random.default_rng(1)
+    for n in bit_sizes:
+        bits = rng.integers(0, 2, n)
+        llrs = rng.normal(0, 3, n)
+        cases.append(Case("viterbi_decode", "hard", n,
+                          lambda b=bits: (lambda: viterbi_decode(b, CONV_TRELLIS)), n, "bit"))
+        cases.append(Case("viterbi_decode", "soft", n,
+                          lambda l=llrs: (lambda: viterbi_decode_llr(l, CONV_TRELLIS)), n, "bit"))
+        for name in ("k7", "k7-3/4"):
+            code = CONV_CODES[name]
+            coded = code.encode(bits)
+            cases.append(Case("conv_encode", name, n, lambda c=code, b=bits: (lambda: c.encode(b)), n, "bit"))
+            cases.append(Case("conv_decode_llr", name, n,
+                              lambda c=code, l=4.0 - 8.0 * coded: (lambda: c.decode_llr(l)), n, "bit"))
+
+    bps = modem.ofdm.params.bits_per_symbol
+    for n in (4, 32):
+        bits = rng.integers(0, 2, n * bps)
+        signal = modem.ofdm.modulate(bits)
+        cases.append(Case("ofdm_modulate", "robust_plus", n,
+                          lambda b=bits: (lambda: modem.ofdm.modulate(b)), n * bps, "bit"))
+        cases.append(Case("ofdm_demodulate", "robust_plus", n,
+                          lambda x=signal, k=n: (lambda: modem.ofdm.demodulate(x, 0, k)), n * bps, "bit"))
+
+    for mode in (m for m in MODES.values() if m.packetized):
+        def correlate(m=mode):
+            signal = np.concatenate((rng.normal(0, 0.1, modem.sample_rate), modem.modulate("BENCH", m, 1)))
+            blocks = [signal[i:i + RX_CHUNK] for i in range(0, len(signal), RX_CHUNK)]
+            correlator = modem.receiver(m).correlator
+
+            def run():
+                correlator.reset()
+                for block in blocks:
+                    correlator.push(block)
+            return run, len(signal)
+        cases.append(Case("preamble_correlator", mode.name, RX_CHUNK, correlate, unit="sample"))
+
+    rs = reed_solomon(8)
+    for n in (16, 256):
+        blocks = np.array([list(rs.encode(m)) for m in rng.integers(0, 45, (n, 23))], dtype=np.uint8)
+        blocks[::2, 5] ^= 0x11   # every other block needs correcting
+        cases.append(Case("rs_decode_blocks", "rs31_23", n,
+                          lambda b=blocks: (lambda: rs.decode_blocks(b)), n, "block"))
+    return cases
+
+
+def run_case(case, repeat=5, budget=0.05):
+    result = {"name": case.name, "mode": case.mode, "size": case.size, "unit": case.unit}
+    try:
+        fn = case.setup()
+        items = case.items
+        if isinstance(fn, tuple):
+            fn, items = fn
+        fn()  # warm caches (waveform tables, detector matrices)
+        number = autorange(fn, budget)
+        timings = time_call(fn, repeat, number)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+    best = min(timings)
+    result.update({
+        "items": items,
+        "repeat": repeat,
+        "number": number,
+        "min_s": best,
+        "median_s": median(timings),
+        "mean_s": mean(timings),
+        "items_per_s": items / best if best > 0 else None,
+    })
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(cases, repeat=5, budget=0.05, match=None, progress=None):
+    results = []
+    for case in cases:
+        if match and match not in case.key:
+            continue
+        result = run_case(case, repeat, budget)
+        if progress:
+            progress(case, result)
+        results.append(result)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    # Cases whose best time grew by more than `tolerance` (0.2 = 20 %)
+    def keyed(rep):
+        return {(r["name"], r["mode"], r["size"]): r for r in rep["results"] if "min_s" in r}
+    old = keyed(baseline)
+    slower = []
+    for key, new in keyed(report).items():
+        if key in old and new["min_s"] > old[key]["min_s"] * (1 + tolerance):
+            slower.append({"name": key[0], "mode": key[1], "size": key[2],
+                           "baseline_s": old[key]["min_s"], "min_s": new["min_s"],
+                           "ratio": new["min_s"] / old[key]["min_s"]})
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Dipper modem pipeline")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.05, help="seconds per timing, sets calls per timing")
+    parser.add_argument("--quick", action="store_true", help="small sizes only, 3 repeats")
+    parser.add_argument("--sizes", help="comma separated message sizes in characters")
+    parser.add_argument("--match", help="only cases whose key contains this, e.g. 'viterbi' or '[robust:'")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    args = parser.parse_args(argv)
+
+    sizes = MESSAGE_SIZES
+    bit_sizes = BIT_SIZES
+    repeat = args.repeat
+    if args.quick:
+        sizes, bit_sizes, repeat = sizes[:2], bit_sizes[:2], min(repeat, 3)
+    if args.sizes:
+        sizes = tuple(int(s) for s in args.sizes.split(","))
+
+    modem = Modem(ModemConfig(sample_rate=args.sample_rate))
+
+    def progress(case, result):
+        if "error" in result:
+            print(f"{case.key:48s} ERROR {result['error']}", file=sys.stderr)
+        else:
+            print(f"{case.key:48s} {result['min_s'] * 1e3:10.3f} ms  "
+                  f"{result['items_per_s']:14.1f} {case.unit}/s", file=sys.stderr)
+
+    report = run(build_cases(modem, sizes, bit_sizes), repeat, args.budget, args.match, progress)
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = slower
+        for r in slower:
+            print(f"SLOWER {r['name']}[{r['mode']}:{r['size']}] x{r['ratio']:.2f}", file=sys.stderr)
+        status = 1 if slower else 0
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    else:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import threading
+import time
+from dataclasses import dataclass, replace
+
+from .civ import CivError
+
+# CI-V operating modes (command 04 / transceive 01)
+CIV_MODES = {0x00: "LSB", 0x01: "USB", 0x02: "AM", 0x03: "CW", 0x04: "RTTY", 0x05: "FM", 0x06: "WFM",
+             0x07: "CW-R", 0x08: "RTTY-R", 0x17: "DV", 0x22: "DD"}
+
+_READ_FREQ = (0x03, b"")
+_READ_MODE = (0x04, b"")
+_READ_S_METER = (0x15, b"\x02")
+
+
+def bcd_to_int(data, little_endian=True):
+    # Packed BCD, two digits a byte: CI-V frequencies come least significant byte first, meter levels most
+    value = 0
+    for byte in (reversed(data) if little_endian else data):
+        value = value * 100 + (byte >> 4) * 10 + (byte & 0x0F)
+    return value
+
+
+def s_units(level):
+    # Icom meter level 0-255 as S units: 0 is S0, 120 is S9 and 241 is S9+60 dB
+    if level <= 120:
+        return f"S{round(level * 9 / 120)}"
+    return f"S9+{round((min(level, 241) - 120) * 60 / 121)}"
+
+
+@dataclass(frozen=True)
+class CatState:
+    # The rig as last read. Each field carries the time.time() it was read
+    # at, so a caller can tell a stale value from a fresh one.
+    frequency_hz: int = None
+    mode: str = None
+    filter: int = None
+    s_meter: int = None
+    frequency_time: float = None
+    mode_time: float = None
+    s_meter_time: float = None
+    error: str = None
+
+    @property
+    def dial(self):
+        # "14.078.000 USB" style, or "" before the first frequency
+        if self.frequency_hz is None:
+            return ""
+        mhz, rest = divmod(self.frequency_hz, 1_000_000)
+        khz, hz = divmod(rest, 1000)
+        return f"{mhz}.{khz:03d}.{hz:03d}" + (f" {self.mode}" if self.mode else "")
+
+
+class CatPoller:
+    # Background CAT reader: every `interval` s it asks the rig for
+    # frequency, mode and S-meter in one pipelined exchange on a CivSession
+    # and publishes a new CatState to on_update (called on the poller's
+    # thread) and to `state`. Transceive broadcasts the rig sends between
+    # polls update it too, as the session reads them at the start of its
+    # next exchange. pause() stops polling while transmitting, so the
+    # session is free when PTT is wanted and the S-meter is not read on TX;
+    # a poll already on the wire finishes first.
+
+    def __init__(self, session, interval=1.0, on_update=None, clock=time.time):
+        self.session = session
+        self.interval = interval
+        self.on_update = on_update
+        self.clock = clock
+        self.state = CatState()
+        self.polls = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._thread = None
+        session.on_unsolicited = self._transceive
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cat-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        self._resume.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def pause(self):
+        self._resume.clear()
+
+    def resume(self):
+        self._resume.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._resume.wait()
+            if self._stop.is_set():
+                break
+            self.poll()
+            self._stop.wait(self.interval)
+
+    def poll(self):
+        # One pipelined read of frequency, mode and S-meter; returns the new state
+        try:
+            freq, mode, meter = self.session.pipeline([_READ_FREQ, _READ_MODE, _READ_S_METER])
+        except CivError as e:
+            return self._publish(error=str(e))
+        now = self.clock()
+        self.polls += 1
+        changes = {"error": None}
+        if freq is not None and len(freq.data) >= 4:
+            changes.update(frequency_hz=bcd_to_int(freq.data), frequency_time=now)
+        if mode is not None and mode.data:
+            changes.update(mode=CIV_MODES.get(mode.data[0], f"{mode.data[0]:02X}"), mode_time=now,
+                           filter=mode.data[1] if len(mode.data) > 1 else None)
+        if meter is not None and len(meter.data) >= 3:
+            changes.update(s_meter=bcd_to_int(meter.data[1:3], little_endian=False), s_meter_time=now)
+        return self._publish(**changes)
+
+    def _transceive(self, frame):
+        # Frequency (00) and mode (01) the rig broadcasts when the dial moves
+        now = self.clock()
+        if frame.command == 0x00 and len(frame.data) >= 4:
+            self._publish(frequency_hz=bcd_to_int(frame.data), frequency_time=now)
+        elif frame.command == 0x01 and frame.data:
+            self._publish(mode=CIV_MODES.get(frame.data[0], f"{frame.data[0]:02X}"), mode_time=now,
+                          filter=frame.data[1] if len(frame.data) > 1 else None)
+
+    def _publish(self, **changes):
+        with self._lock:
+            self.state = replace(self.state, **changes)
+            state = self.state
+        if self.on_update:
+            self.on_update(state)
+        return state
@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.signal import hilbert
+
+from .modes import NOISE_BANDWIDTH
+
+# Watterson / CCIR 520 conditions: (differential delay s, Doppler spread Hz)
+FADING_PRESETS = {
+    "none": None,
+    "good": (0.0005, 0.1),
+    "moderate": (0.001, 0.5),
+    "poor": (0.002, 1.0),
+    "flutter": (0.0005, 10.0),
+}
+
+
+def _rng(rng):
+    return rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+
+
+def signal_power(samples):
+    # Mean power while keyed; gaps between symbols do not dilute it
+    samples = np.asarray(samples, dtype=np.float64)
+    active = samples[np.abs(samples) > 1e-9]
+    return float(np.mean(active ** 2)) if len(active) else 0.0
+
+
+def awgn(samples, snr_db, sample_rate=44100, bandwidth=NOISE_BANDWIDTH, rng=None, power=None):
+    # White Gaussian noise at snr_db measured in `bandwidth` Hz
+    samples = np.asarray(samples, dtype=np.float64)
+    power = signal_power(samples) if power is None else power
+    n0 = power / (10 ** (snr_db / 10.0)) / bandwidth
+    sigma = np.sqrt(n0 * sample_rate / 2.0)
+    return samples + _rng(rng).normal(0.0, sigma, len(samples))
+
+
+def fading_taps(n, spread, sample_rate=44100, rng=None, rate=None):
+    # Complex Gaussian tap with Gaussian Doppler spectrum (2-sigma width =
+    # spread Hz) and unit mean power. Generated at a low rate and
+    # interpolated, since the tap changes over seconds, not samples.
+    rng = _rng(rng)
+    rate = rate or max(16.0, 8.0 * spread)
+    m = int(np.ceil(n * rate / sample_rate)) + 2
+    sigma_f = spread / 2.0
+    taps = rng.normal(size=m) + 1j * rng.normal(size=m)
+    spectrum = np.fft.fft(taps)
+    f = np.fft.fftfreq(m, 1.0 / rate)
+    spectrum *= np.exp(-0.5 * (f / max(sigma_f, 1e-6)) ** 2)
+    taps = np.fft.ifft(spectrum)
+    taps /= np.sqrt(np.mean(np.abs(taps) ** 2)) + 1e-12
+    t = np.arange(n) * rate / sample_rate
+    idx = np.arange(m)
+    return np.interp(t, idx, taps.real) + 1j * np.interp(t, idx, taps.imag)
+
+
+def watterson(analytic, delay, spread, sample_rate=44100, rng=None):
+    # Two independently fading paths of equal mean power, `delay` s apart
+    rng = _rng(rng)
+    n = len(analytic)
+    lag = int(round(delay * sample_rate))
+    delayed = np.concatenate((np.zeros(lag, dtype=complex), analytic[:n - lag])) if lag else analytic
+    g1 = fading_taps(n, spread, sample_rate, rng)
+    g2 = fading_taps(n, spread, sample_rate, rng)
+    return (g1 * analytic + g2 * delayed) / np.sqrt(2.0)
+
+
+def qsb(analytic, depth_db, period, sample_rate=44100, phase=0.0):
+    # Slow sinusoidal fading: gain swings over depth_db once per `period` s
+    t = np.arange(len(analytic)) / sample_rate
+    swing_db = -0.5 * depth_db * (1 - np.cos(2 * np.pi * t / period + phase))
+    return analytic * 10 ** (swing_db / 20.0)
+
+
+def frequency_shift(analytic, offset, drift=0.0, sample_rate=44100):
+    # offset Hz at t=0, changing by drift Hz/s
+    t = np.arange(len(analytic)) / sample_rate
+    return analytic * np.exp(2j * np.pi * (offset * t + 0.5 * drift * t * t))
+
+
+def impulse_noise(n, rate, amplitude, sample_rate=44100, decay=0.0005, rng=None):
+    # Poisson clicks (rate per second) with random sign, exponentially
+    # decaying over `decay` s; amplitude is the peak value
+    rng = _rng(rng)
+    out = np.zeros(n)
+    count = rng.poisson(rate * n / sample_rate)
+    if not count:
+        return out
+    hits = np.zeros(n)
+    np.add.at(hits, rng.integers(0, n, count), amplitude * rng.choice((-1.0, 1.0), count))
+    length = max(1, int(decay * sample_rate * 5))
+    kernel = np.exp(-np.arange(length) / (decay * sample_rate))
+    return np.convolve(hits, kernel)[:n]
+
+
+@dataclass
+class ChannelModel:
+    # An HF path applied in order: fading, QSB, frequency offset/drift,
+    # then AWGN and impulse noise. snr_db=None leaves out the Gaussian noise.
+    snr_db: float = None
+    fading: str = "none"            # key of FADING_PRESETS
+    delay: float = None             # override the preset delay (s)
+    spread: float = None            # override the preset Doppler spread (Hz)
+    qsb_depth_db: float = 0.0
+    qsb_period: float = 10.0
+    offset_hz: float = 0.0
+    drift_hz_per_s: float = 0.0
+    impulse_rate: float = 0.0       # clicks per second
+    impulse_amplitude: float = 10.0  # peak, relative to the signal RMS
+    bandwidth: float = NOISE_BANDWIDTH
+
+    def fading_params(self):
+        preset = FADING_PRESETS[self.fading]
+        if preset is None and self.delay is None and self.spread is None:
+            return None
+        delay, spread = preset or (0.0, 0.0)
+        return (delay if self.delay is None else self.delay, spread if self.spread is None else self.spread)
+
+    def apply(self, samples, sample_rate=44100, rng=None):
+        rng = _rng(rng)
+        samples = np.asarray(samples, dtype=np.float64)
+        power = signal_power(samples)
+        params = self.fading_params()
+        if params or self.qsb_depth_db or self.offset_hz or self.drift_hz_per_s:
+            analytic = hilbert(samples)
+            if params:
+                analytic = watterson(analytic, params[0], params[1], sample_rate, rng)
+            if self.qsb_depth_db:
+                analytic = qsb(analytic, self.qsb_depth_db, self.qsb_period, sample_rate,
+                               rng.uniform(0, 2 * np.pi))
+            if self.offset_hz or self.drift_hz_per_s:
+                analytic = frequency_shift(analytic, self.offset_hz, self.drift_hz_per_s, sample_rate)
+            samples = analytic.real
+        if self.snr_db is not None:
+            # SNR refers to the transmitted power, so fades show up as lost SNR
+            samples = awgn(samples, self.snr_db, sample_rate, self.bandwidth, rng, power)
+        if self.impulse_rate:
+            samples = samples + impulse_noise(len(samples), self.impulse_rate,
+                                              self.impulse_amplitude * np.sqrt(power), sample_rate, rng=rng)
+        return samples.astype(np.float32)
+
+
+def transmit(modem, text, mode, channel, packet_id=0, lead=0.25, tail=0.25, rng=None):
+    # Modulate text, pad with silence and pass it through the channel.
+    # Returns (received samples, index of the frame's first sample).
+    frame = modem.modulate(text, mode, packet_id)
+    start = int(lead * modem.sample_rate)
+    padded = np.zeros(start + len(frame) + int(tail * modem.sample_rate), dtype=np.float32)
+    padded[start:start + len(frame)] = frame
+    return channel.apply(padded, modem.sample_rate, rng), start
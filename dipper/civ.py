@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+CONTROLLER = 0xE0     # our address on the CI-V bus
+_PREAMBLE = 0xFE
+_END = 0xFD
+_COLLISION = 0xFC
+ACK = 0xFB
+NAK = 0xFA
+
+
+class CivError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class CivFrame:
+    to: int
+    source: int
+    command: int
+    data: bytes = b""
+
+    def to_bytes(self):
+        return bytes((_PREAMBLE, _PREAMBLE, self.to, self.source, self.command)) + self.data + bytes((_END,))
+
+
+class CivParser:
+    # Incremental CI-V frame parser: feed() the bytes as they come off the
+    # port and get back the complete frames. Bytes outside a frame and frames
+    # broken by a bus collision (FC) are dropped.
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.dropped = 0
+
+    def feed(self, data):
+        self._buf.extend(data)
+        frames = []
+        while True:
+            start = self._buf.find(b"\xfe\xfe")
+            if start < 0:
+                # keep a trailing FE, it may begin the next preamble
+                del self._buf[:len(self._buf) - 1 if self._buf[-1:] == b"\xfe" else len(self._buf)]
+                return frames
+            del self._buf[:start]
+            i = 2
+            while i < len(self._buf) and self._buf[i] == _PREAMBLE:
+                i += 1          # rigs may send more than two FE
+            end = self._buf.find(bytes((_END,)), i)
+            cut = self._buf.find(bytes((_PREAMBLE,)), i)
+            if 0 <= cut and (end < 0 or cut < end):
+                # FE never occurs inside a frame: this one was cut short
+                del self._buf[:cut]
+                self.dropped += 1
+                continue
+            if end < 0:
+                return frames
+            body = bytes(self._buf[i:end])
+            del self._buf[:end + 1]
+            if len(body) < 3 or _COLLISION in body:
+                self.dropped += 1
+                continue
+            frames.append(CivFrame(body[0], body[1], body[2], body[3:]))
+
+
+@dataclass
+class PttStats:
+    # Seconds from sending a PTT command to the rig's FB, over recent overs
+    keyup_last: float
+    keyup_mean: float
+    keyup_max: float
+    keydown_last: float
+    keydown_mean: float
+    keydown_max: float
+    reconnects: int
+    errors: int
+
+
+class CivSession:
+    # A long-lived CI-V link to one rig. The port is opened on first use and
+    # kept open, so keying no longer pays for opening it (and for USB serial
+    # enumeration) on every over. request() sends a command and waits for the
+    # rig's own answer - FB, FA or the data it asked for - skipping the echo
+    # of our frame and transceive broadcasts, which go to on_unsolicited.
+    # Broadcasts that came in since the last exchange are read and passed on
+    # before the next one is written. A port error or a missing answer closes
+    # the port and tries once more on a fresh one. Safe to share between
+    # threads.
+
+    def __init__(self, port, baudrate, address, controller=CONTROLLER, rtscts=False, dsrdtr=False,
+                 timeout=0.5, retries=1, on_unsolicited=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.address = address
+        self.controller = controller
+        self.rtscts = rtscts
+        self.dsrdtr = dsrdtr
+        self.timeout = timeout
+        self.retries = retries
+        self.on_unsolicited = on_unsolicited
+        self._serial = None
+        self._parser = CivParser()
+        self._lock = threading.RLock()
+        self._keyup = deque(maxlen=50)
+        self._keydown = deque(maxlen=50)
+        self.reconnects = 0
+        self.errors = 0
+
+    @property
+    def is_open(self):
+        return self._serial is not None and self._serial.is_open
+
+    def open(self):
+        import serial
+        with self._lock:
+            if not self.is_open:
+                self._serial = serial.Serial(port=self.port, baudrate=self.baudrate, timeout=0.02,
+                                             rtscts=self.rtscts, dsrdtr=self.dsrdtr)
+                self._parser = CivParser()
+
+    def close(self):
+        with self._lock:
+            if self._serial is not None:
+                try:
+                    self._serial.close()
+                except OSError:
+                    pass
+                self._serial = None
+
+    def _unsolicited(self, frame):
+        # True for a frame that does not answer us; broadcasts are passed on
+        if frame.source == self.address and frame.to == self.controller:
+            return False
+        if frame.source != self.controller and self.on_unsolicited:
+            self.on_unsolicited(frame)
+        return True
+
+    def _exchange(self, frames, timeout):
+        # Write the frames back to back, then read until each has its answer.
+        # What arrived before the write is no answer to these frames: late
+        # replies to an earlier exchange are dropped.
+        self.open()
+        if self._serial.in_waiting:
+            for frame in self._parser.feed(self._serial.read(self._serial.in_waiting)):
+                self._unsolicited(frame)
+        self._serial.write(b"".join(frame.to_bytes() for frame in frames))
+        replies = [None] * len(frames)
+        deadline = time.monotonic() + timeout
+        while None in replies and time.monotonic() < deadline:
+            for reply in self._parser.feed(self._serial.read(max(1, self._serial.in_waiting))):
+                if self._unsolicited(reply):
+                    continue
+                for i, frame in enumerate(frames):
+                    # FB/FA answer the oldest open request; data replies echo the command and sub-command
+                    if replies[i] is None and (reply.command in (ACK, NAK) or (
+                            reply.command == frame.command and reply.data.startswith(frame.data[:1]))):
+                        replies[i] = reply
+                        break
+        return replies
+
+    def _transact(self, frames, timeout):
+        import serial
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.close()
+                    self.reconnects += 1
+                try:
+                    replies = self._exchange(frames, timeout)
+                except (serial.SerialException, OSError) as e:
+                    error = CivError(f"CI-V port {self.port}: {e}")
+                    continue
+                if any(replies):
+                    return replies
+                error = CivError(f"No answer from rig {self.address:02X} to command {frames[0].command:02X}.")
+            self.errors += 1
+            raise error
+
+    def request(self, command, data=b"", timeout=None):
+        # The rig's reply frame; raises CivError on FA or when it stays silent
+        reply, = self._transact([CivFrame(self.address, self.controller, command, bytes(data))], timeout)
+        if reply.command == NAK:
+            self.errors += 1
+            raise CivError(f"Rig {self.address:02X} refused command {command:02X}.")
+        return reply
+
+    def pipeline(self, requests, timeout=None):
+        # Several (command, data) requests in one write and one wait: their
+        # replies in order, None for any the rig refused or left unanswered.
+        # Raises CivError only when none is answered.
+        frames = [CivFrame(self.address, self.controller, command, bytes(data)) for command, data in requests]
+        replies = self._transact(frames, timeout)
+        return [None if reply is None or reply.command == NAK else reply for reply in replies]
+
+    def ptt(self, on):
+        # Key or unkey the rig; returns once it has acknowledged, with the
+        # seconds that took
+        start = time.perf_counter()
+        self.request(0x1C, b"\x00\x01" if on else b"\x00\x00")
+        latency = time.perf_counter() - start
+        (self._keyup if on else self._keydown).append(latency)
+        return latency
+
+    def ptt_stats(self):
+        with self._lock:
+            up, down = list(self._keyup) or [0.0], list(self._keydown) or [0.0]
+            return PttStats(up[-1], sum(up) / len(up), max(up), down[-1], sum(down) / len(down), max(down),
+                            self.reconnects, self.errors)
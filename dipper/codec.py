@@ -0,0 +1,313 @@
+from functools import lru_cache
+
+import numpy as np
+
+from .fec import ConvolutionalCode, erasure_positions, reed_solomon
+from .modes import get_mode
+from .symbols import (CHAR_SOUNDS, CONV_CODES, REVERSE_MAP, SYMBOL_MAP, V4_REVERSE_MAP,
+                      V4_SYMBOLS, WORD_SOUNDS, crc16)
+
+
+INTERLEAVE_BLOCK = 16
+ROBUST_MAX_BYTES = 32    # longest Robust packet receivers wait for
+_NIBBLE_WEIGHTS = np.array([8, 4, 2, 1], dtype=np.uint8)
+# V4 values whose symbols sound the same ('H' and 'O' are both a 2100 Hz
+# tone) cannot be told apart on air; each maps to the lowest of its kind
+_V4_HEARD = [min(w for w, t in V4_SYMBOLS.items() if CHAR_SOUNDS[t] == CHAR_SOUNDS[s])
+             for _, s in sorted(V4_SYMBOLS.items())]
+
+
+def get_code(code):
+    # Accepts a ConvolutionalCode or a key of CONV_CODES
+    if isinstance(code, ConvolutionalCode):
+        return code
+    try:
+        return CONV_CODES[code]
+    except KeyError:
+        raise ValueError(f"Unknown convolutional code '{code}'.")
+
+
+def convolutional_encode(bits, code="v4"):
+    return get_code(code).encode(bits)
+
+
+@lru_cache(maxsize=None)
+def interleave_permutation(length):
+    # Every 16-bit block is read out as a 4x4 transpose. The transpose is its
+    # own inverse, so the same gather interleaves and deinterleaves.
+    i = np.arange(length)
+    local = i % INTERLEAVE_BLOCK
+    perm = i - local + local // 4 + (local % 4) * 4
+    perm.setflags(write=False)
+    return perm
+
+
+def _pad_block(bits):
+    bits = np.asarray(bits)
+    pad = -len(bits) % INTERLEAVE_BLOCK
+    return np.concatenate((bits, np.zeros(pad, dtype=bits.dtype))) if pad else bits
+
+
+def interleave(bits):
+    padded = _pad_block(bits)
+    return padded[interleave_permutation(len(padded))]
+
+
+def deinterleave(bits):
+    # Hard bits or soft values; the output has the input's length
+    bits = np.asarray(bits)
+    if len(bits) < INTERLEAVE_BLOCK:
+        return bits
+    padded = _pad_block(bits)
+    return padded[interleave_permutation(len(padded))][:len(bits)]
+
+
+def text_bits(text):
+    return np.unpackbits(np.frombuffer(text.encode("utf-8"), dtype=np.uint8))
+
+
+def bits_text(bits):
+    # Whole bytes only; a trailing partial byte is dropped
+    bits = np.asarray(bits, dtype=np.uint8)
+    return np.packbits(bits[:len(bits) // 8 * 8]).tobytes().decode("utf-8", errors="replace")
+
+
+def text_symbols(text):
+    # Normal mode: one symbol per character, CQ/DE as single word symbols
+    symbol_list = []
+    for word in text.split():
+        if word in WORD_SOUNDS:
+            symbol_list.append(SYMBOL_MAP[word])
+        else:
+            for char in word:
+                symbol_list.append(SYMBOL_MAP.get(char, SYMBOL_MAP[" "]))
+    return symbol_list
+
+
+def encode_v4_packet(text, packet_id, code="v4"):
+    # Receivers only try packet lengths up to ROBUST_MAX_BYTES, so a longer
+    # one could never be decoded
+    n_bytes = len(text.encode("utf-8"))
+    if n_bytes > ROBUST_MAX_BYTES:
+        raise ValueError(f"Robust packets carry at most {ROBUST_MAX_BYTES} bytes, got {n_bytes}.")
+    interleaved_bits = interleave(convolutional_encode(text_bits(text), code))
+    values = interleaved_bits.reshape(-1, 4) @ _NIBBLE_WEIGHTS
+    symbols = [V4_SYMBOLS[v] for v in values.tolist()]
+
+    header = [V4_SYMBOLS[packet_id % 16]]
+    crc = crc16(text.encode('utf-8'))
+    crc_symbols = [V4_SYMBOLS[(crc >> 12) & 0xF], V4_SYMBOLS[(crc >> 8) & 0xF],
+                   V4_SYMBOLS[(crc >> 4) & 0xF], V4_SYMBOLS[crc & 0xF]]
+    return header + symbols + crc_symbols
+
+
+def decode_v4_payload(symbols, llrs=None, code="v4"):
+    # Returns (packet_id, text, received_crc) without checking the CRC, so
+    # callers can see what the Viterbi decoder made of a damaged packet.
+    # With per-symbol LLRs for every symbol the Viterbi decoder runs soft.
+    if len(symbols) < 5:
+        return None, None, None
+    values = np.fromiter((V4_REVERSE_MAP.get(s, 0) for s in symbols), dtype=np.uint8, count=len(symbols))
+    packet_id = int(values[0])
+    if llrs is not None and all(l is not None for l in llrs):
+        soft_bits = np.concatenate([np.asarray(l, dtype=np.float64) for l in llrs[1:-4]])
+        decoded_bits = get_code(code).decode_llr(deinterleave(soft_bits))
+    else:
+        bits = np.unpackbits(values[1:-4, None], axis=1)[:, 4:].reshape(-1)
+        decoded_bits = get_code(code).decode(deinterleave(bits))
+    received_crc = int(values[-4:].astype(np.int64) @ np.array([1 << 12, 1 << 8, 1 << 4, 1]))
+    # Interleaver padding can leave room for one more byte than was sent;
+    # it decodes from the zero padding as NUL
+    return packet_id, bits_text(decoded_bits).rstrip("\x00"), received_crc
+
+
+def decode_v4_packet(symbols, llrs=None, code="v4"):
+    # Returns (packet_id, text); text is None when the CRC does not match.
+    packet_id, text, received_crc = decode_v4_payload(symbols, llrs, code)
+    if text is None:
+        return None, None
+    crc = crc16(text.encode('utf-8'))
+    # The CRC nibbles are sent without FEC, so compare them as they are heard
+    match = all(_V4_HEARD[(crc >> s) & 0xF] == _V4_HEARD[(received_crc >> s) & 0xF] for s in (12, 8, 4, 0))
+    return packet_id, text if match else None
+
+
+def v4_packet_symbols(n_bytes, code="v4"):
+    # Symbols in a Robust packet carrying n_bytes of text, header and CRC included
+    coded = get_code(code).coded_length(8 * n_bytes)
+    return 5 + (coded + -coded % INTERLEAVE_BLOCK) // 4
+
+
+def find_v4_packet(symbols, llrs=None, code="v4", after=0):
+    # Robust packets do not send their length, so every packet length that
+    # fits in the leading symbols (and is longer than `after`) is tried in
+    # turn. Returns (packet_id, text, n_symbols) for the first whose CRC
+    # matches; text and n_symbols are None when none does.
+    tried = after
+    for n_bytes in range(1, ROBUST_MAX_BYTES + 1):
+        n = v4_packet_symbols(n_bytes, code)
+        if n > len(symbols):
+            break
+        if n <= tried:
+            continue
+        tried = n
+        packet_id, text = decode_v4_packet(symbols[:n], None if llrs is None else llrs[:n], code)
+        if text is not None:
+            return packet_id, text, n
+    return (V4_REVERSE_MAP.get(symbols[0]) if len(symbols) else None), None, None
+
+
+RS_NSYM_ROBUST = 8       # RS(31,23) over Normal-mode symbol indices, as in V3
+RS_BLOCK_ROBUST = 31
+RS_NSYM_OFDM = 16
+OFDM_BITS_PER_SYMBOL = 44
+OFDM_HEADER_CODE = "k7"  # 16 header bits + tail -> 44 coded bits, one symbol
+OFDM_MAX_BYTES = 255 - RS_NSYM_OFDM - 2
+
+
+def _ofdm_header_bits(packet_id, n_bytes):
+    # Packet id (4 bits), payload length in bytes (8), check (4)
+    check = crc16(bytes([packet_id, n_bytes])) & 0xF
+    value = (packet_id << 12) | (n_bytes << 4) | check
+    return np.unpackbits(np.array([value >> 8, value & 0xFF], dtype=np.uint8))
+
+
+@lru_cache(maxsize=None)
+def ofdm_permutation(length, stride=OFDM_BITS_PER_SYMBOL + 5):
+    # Coded bit i goes to position stride * i mod length: neighbours in the
+    # Viterbi decoder land on different symbols and different carriers
+    while np.gcd(stride, length) != 1:
+        stride += 1
+    perm = (stride * np.arange(length)) % length
+    perm.setflags(write=False)
+    return perm
+
+
+def ofdm_payload_symbols(n_bytes, code="k7", bits_per_symbol=OFDM_BITS_PER_SYMBOL):
+    coded = get_code(code).coded_length(8 * (n_bytes + 2 + RS_NSYM_OFDM))
+    return -(-coded // bits_per_symbol)
+
+
+def encode_ofdm_packet(text, packet_id, code="k7", bits_per_symbol=OFDM_BITS_PER_SYMBOL):
+    # (symbols, bits_per_symbol) coded bits: a header symbol, then the text
+    # with its CRC under RS(16) outer and convolutional inner coding,
+    # interleaved across the whole packet
+    data = text.encode("utf-8")
+    if len(data) > OFDM_MAX_BYTES:
+        raise ValueError(f"Robust+ packets carry at most {OFDM_MAX_BYTES} bytes, got {len(data)}.")
+    header = get_code(OFDM_HEADER_CODE).encode(_ofdm_header_bits(packet_id % 16, len(data)))
+    header = np.concatenate((header, np.zeros(bits_per_symbol - len(header), dtype=np.uint8)))
+    crc = crc16(data)
+    block = reed_solomon(RS_NSYM_OFDM).encode(data + bytes([crc >> 8, crc & 0xFF]))
+    coded = get_code(code).encode(np.unpackbits(np.frombuffer(block, dtype=np.uint8)))
+    payload = np.zeros(ofdm_payload_symbols(len(data), code, bits_per_symbol) * bits_per_symbol, dtype=np.uint8)
+    payload[ofdm_permutation(len(payload))[:len(coded)]] = coded
+    return np.concatenate((header, payload)).reshape(-1, bits_per_symbol)
+
+
+def _as_llrs(values):
+    # Hard bits become confident LLRs (positive favours 0)
+    values = np.asarray(values)
+    if values.dtype.kind in "biu":
+        return 4.0 - 8.0 * values.astype(np.float64)
+    return values.astype(np.float64)
+
+
+def decode_ofdm_header(header):
+    # (packet_id, n_bytes) from the header symbol's bits or LLRs, or None
+    code = get_code(OFDM_HEADER_CODE)
+    bits = code.decode_llr(_as_llrs(header)[:code.coded_length(16)], 16)
+    value = int(bits @ (1 << np.arange(15, -1, -1)))
+    packet_id, n_bytes, check = value >> 12, (value >> 4) & 0xFF, value & 0xF
+    if check != crc16(bytes([packet_id, n_bytes])) & 0xF or n_bytes > OFDM_MAX_BYTES:
+        return None
+    return packet_id, n_bytes
+
+
+def decode_ofdm_packet(symbols, code="k7", erasures=None):
+    # symbols: (symbols, bits_per_symbol) LLRs or hard bits, header first.
+    # Returns (packet_id, text); text is None when RS or the CRC fail and
+    # both are None when the header is unreadable or the packet incomplete.
+    # erasures: byte positions in the RS block that are known to be bad.
+    llrs = _as_llrs(symbols)
+    if llrs.ndim != 2 or len(llrs) < 2:
+        return None, None
+    header = decode_ofdm_header(llrs[0])
+    if header is None:
+        return None, None
+    packet_id, n_bytes = header
+    bits_per_symbol = llrs.shape[1]
+    n_symbols = ofdm_payload_symbols(n_bytes, code, bits_per_symbol)
+    if len(llrs) < 1 + n_symbols:
+        return None, None
+    payload = llrs[1:1 + n_symbols].reshape(-1)
+    n_block = n_bytes + 2 + RS_NSYM_OFDM
+    coded = payload[ofdm_permutation(len(payload))[:get_code(code).coded_length(8 * n_block)]]
+    block = np.packbits(get_code(code).decode_llr(coded, 8 * n_block))
+    message = reed_solomon(RS_NSYM_OFDM).decode_blocks(block[None], [erasures] if erasures else None)[0]
+    if message is None or crc16(message[:-2]) != (message[-2] << 8 | message[-1]):
+        return packet_id, None
+    return packet_id, message[:-2].decode("utf-8", errors="replace")
+
+
+def encode_fec(text, mode):
+    mode = get_mode(mode)
+    symbol_list = text_symbols(text)
+    if mode.name == "robust":
+        data_size = RS_BLOCK_ROBUST - RS_NSYM_ROBUST
+        symbol_list += [SYMBOL_MAP[" "]] * (-len(symbol_list) % data_size)
+        rs = reed_solomon(RS_NSYM_ROBUST)
+        return [sym for i in range(0, len(symbol_list), data_size)
+                for sym in rs.encode(symbol_list[i:i + data_size])]
+    elif mode.name == "robust_plus":
+        return encode_ofdm_packet(text, 0, mode.code)
+    return symbol_list
+
+
+def decode_fec(symbols, mode, confidence=None):
+    # confidence: optional per-symbol score (higher is surer); in Robust mode
+    # the least confident symbols of each RS block become erasure hints.
+    # Robust symbols of None (squelched) are always erasures.
+    mode = get_mode(mode)
+    if mode.name == "robust":
+        n = len(symbols) // RS_BLOCK_ROBUST * RS_BLOCK_ROBUST
+        blocks = [symbols[i:i + RS_BLOCK_ROBUST] for i in range(0, n, RS_BLOCK_ROBUST)]
+        valid = [all(s is None or isinstance(s, (int, np.integer)) for s in block) for block in blocks]
+        rows = np.array([[0 if s is None else s for s in block] for block, ok in zip(blocks, valid) if ok],
+                        dtype=np.uint8).reshape(-1, RS_BLOCK_ROBUST)
+        erasures = []
+        for b, block in enumerate(blocks):
+            if not valid[b]:
+                continue
+            hints = {i for i, s in enumerate(block) if s is None}
+            if confidence is not None:
+                hints.update(erasure_positions(confidence[b * RS_BLOCK_ROBUST:(b + 1) * RS_BLOCK_ROBUST],
+                                               RS_NSYM_ROBUST))
+            erasures.append(sorted(hints)[:RS_NSYM_ROBUST])
+        decoded = iter(reed_solomon(RS_NSYM_ROBUST).decode_blocks(rows, erasures))
+        decoded_text = ""
+        for ok in valid:
+            message = next(decoded) if ok else None
+            if not ok:
+                decoded_text += "[ERROR] Invalid symbol data "
+            elif message is None:
+                decoded_text += "[ERROR] "
+            else:
+                decoded_text += "".join(REVERSE_MAP.get(sym, " ") for sym in message)
+        return decoded_text.strip()
+    elif mode.name == "robust_plus":
+        if np.ndim(symbols) != 2:
+            return "[ERROR] Invalid OFDM data"
+        packet_id, decoded_text = decode_ofdm_packet(symbols, mode.code)
+        return "[ERROR] Decoding failed" if decoded_text is None else decoded_text.strip()
+    return "".join(REVERSE_MAP.get(sym, " ") for sym in symbols).strip()
+
+
+def decode_packet(symbols, mode, llrs=None):
+    # (packet_id, text) for a complete Robust or Robust+ packet
+    mode = get_mode(mode)
+    if mode.name == "robust":
+        return decode_v4_packet(symbols, llrs, mode.code)
+    if mode.name == "robust_plus":
+        return decode_ofdm_packet(symbols if llrs is None else llrs, mode.code)
+    raise ValueError(f"Mode '{mode.name}' does not send packets")
@@ -0,0 +1,52 @@
+import numpy as np
+from scipy.signal import hilbert
+
+
+class SoftDemodulator:
+    # Non-coherent matched-filter demodulator for a 16-ary symbol alphabet.
+    # Every template is the analytic (phase-free) version of the transmitted
+    # waveform, so one matrix-vector product gives the energy of all 16 symbols,
+    # and max-log LLRs for each of the 4 bits follow from those energies.
+
+    def __init__(self, waveforms, symbols, duration):
+        # symbols: {value: key} like V4_SYMBOLS, values 0..15
+        self.values = np.array(sorted(symbols), dtype=np.int64)
+        self.keys = [symbols[v] for v in self.values]
+        self.bits_per_symbol = int(np.log2(len(self.values)))
+        templates = np.array([hilbert(waveforms.waveform(k, duration)) for k in self.keys])
+        templates /= np.linalg.norm(templates, axis=1, keepdims=True)
+        self.templates = np.conj(templates)
+        self.length = templates.shape[1]
+        # bit_masks[j, k]: bit j (MSB first) of symbol value k is 1
+        shifts = np.arange(self.bits_per_symbol - 1, -1, -1)
+        self.bit_masks = ((self.values[None, :] >> shifts[:, None]) & 1).astype(bool)
+
+    def energies(self, windows):
+        # windows: (..., length) -> (..., n_symbols)
+        return np.abs(np.asarray(windows) @ self.templates.T) ** 2
+
+    def best_window(self, data, hop=None):
+        # Symbol timing is unknown inside a receive chunk: test windows every hop
+        # samples and keep the one with the strongest symbol.
+        data = np.asarray(data, dtype=np.float64)
+        if len(data) < self.length:
+            data = np.pad(data, (0, self.length - len(data)))
+        hop = hop or max(1, self.length // 16)
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.length)[::hop]
+        energies = self.energies(windows)
+        return energies[np.argmax(energies.max(axis=1))]
+
+    def llrs(self, energies):
+        # LLR > 0 favours bit 0, matching the cost convention in dipper.fec.llr_costs
+        energies = np.asarray(energies, dtype=np.float64)
+        noise = np.median(energies, axis=-1, keepdims=True) + 1e-12
+        metrics = energies / noise
+        masks = self.bit_masks
+        zero = np.where(~masks, metrics[..., None, :], -np.inf).max(axis=-1)
+        one = np.where(masks, metrics[..., None, :], -np.inf).max(axis=-1)
+        return zero - one
+
+    def demodulate(self, data, hop=None):
+        # Returns (hard symbol key, per-bit LLRs, symbol energies) for one chunk
+        energies = self.best_window(data, hop)
+        return self.keys[int(np.argmax(energies))], self.llrs(energies), energies
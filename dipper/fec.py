@@ -0,0 +1,274 @@
+from functools import lru_cache
+
+import numpy as np
+from reedsolo import RSCodec, ReedSolomonError
+
+
+class Trellis:
+    # Shift-register convolutional code described by a table like CONV_TABLE:
+    # {(state, bit): [out1, out2, ...]}, where the state holds the last K-1 input
+    # bits (newest in the low bit), so next_state = ((state << 1) | bit) & mask.
+
+    def __init__(self, outputs, next_states):
+        self.outputs = np.asarray(outputs, dtype=np.uint8)          # (n_states, 2, n_out)
+        self.next_states = np.asarray(next_states, dtype=np.int64)  # (n_states, 2)
+        self.n_states, _, self.n_out = self.outputs.shape
+        # Each next state has exactly two predecessors; keep them in ascending
+        # order so ties resolve to the lower state as the old dict trellis did.
+        prev = [[] for _ in range(self.n_states)]
+        for s in range(self.n_states):
+            for b in range(2):
+                prev[self.next_states[s, b]].append((s, b))
+        if any(len(p) != 2 for p in prev):
+            raise ValueError("Trellis must have exactly two branches into every state")
+        self.prev_states = np.array([[s for s, _ in p] for p in prev], dtype=np.int64)
+        self.prev_bits = np.array([[b for _, b in p] for p in prev], dtype=np.int64)
+
+    @classmethod
+    def from_table(cls, table):
+        n_states = max(s for s, _ in table) + 1
+        mask = n_states - 1
+        if n_states & mask:
+            raise ValueError("Number of states must be a power of two")
+        n_out = len(next(iter(table.values())))
+        outputs = np.zeros((n_states, 2, n_out), dtype=np.uint8)
+        next_states = np.zeros((n_states, 2), dtype=np.int64)
+        for (s, b), out in table.items():
+            outputs[s, b] = out
+            next_states[s, b] = ((s << 1) | b) & mask
+        return cls(outputs, next_states)
+
+    @classmethod
+    def from_generators(cls, generators, constraint_length):
+        # Generators in the usual octal notation, most significant bit on the
+        # newest input bit: (0o171, 0o133) is the K=7 NASA code.
+        registers = register_outputs(generators, constraint_length)
+        n_states = 1 << (constraint_length - 1)
+        reg = (np.arange(n_states)[:, None] << 1) | np.arange(2)
+        return cls(registers[reg], reg & (n_states - 1))
+
+
+def register_outputs(generators, constraint_length):
+    # (2**K, n_out) output bits for every shift register value, newest bit low
+    reg = np.arange(1 << constraint_length)
+    out = np.zeros((len(reg), len(generators)), dtype=np.uint8)
+    for j, g in enumerate(generators):
+        taps = sum(((g >> (constraint_length - 1 - k)) & 1) << k for k in range(constraint_length))
+        masked = reg & taps
+        out[:, j] = sum((masked >> k) & 1 for k in range(constraint_length)) & 1
+    return out
+
+
+class ConvolutionalCode:
+    # Rate 1/n feedforward code with optional puncturing. puncture has one row
+    # per generator and one column per step of the period; 0 drops that output.
+    # With terminate, K-1 zero bits flush the encoder back to state 0.
+
+    def __init__(self, generators, constraint_length, puncture=None, terminate=True):
+        self.generators = tuple(generators)
+        self.constraint_length = constraint_length
+        self.n_out = len(self.generators)
+        self.tail = constraint_length - 1 if terminate else 0
+        self.outputs = register_outputs(self.generators, constraint_length)
+        self.trellis = Trellis.from_generators(self.generators, constraint_length)
+        self._weights = 1 << np.arange(constraint_length)
+        if puncture is None:
+            self.keep = None
+        else:
+            puncture = np.asarray(puncture, dtype=bool)
+            if puncture.shape[0] != self.n_out:
+                raise ValueError("Puncture pattern needs one row per generator")
+            self.keep = puncture.T.reshape(-1)   # in transmit order, one period
+
+    @property
+    def rate(self):
+        if self.keep is None:
+            return 1.0 / self.n_out
+        return (len(self.keep) / self.n_out) / int(self.keep.sum())
+
+    def coded_length(self, n_bits):
+        # Transmitted bits for a message of n_bits
+        full = (n_bits + self.tail) * self.n_out
+        if self.keep is None:
+            return full
+        period = len(self.keep)
+        return full // period * int(self.keep.sum()) + int(self.keep[:full % period].sum())
+
+    def message_bits(self, n_coded):
+        # Longest message whose coded form fits in n_coded bits
+        n = max(0, int(n_coded * self.rate) - self.tail + 1)
+        while n > 0 and self.coded_length(n) > n_coded:
+            n -= 1
+        return n
+
+    def encode(self, bits):
+        bits = np.concatenate((np.asarray(bits, dtype=np.int64), np.zeros(self.tail, dtype=np.int64)))
+        registers = np.convolve(bits, self._weights)[:len(bits)]
+        coded = self.outputs[registers].reshape(-1)
+        if self.keep is not None:
+            coded = coded[np.resize(self.keep, len(coded))]
+        return coded
+
+    def _depuncture(self, values, n_bits, fill):
+        full = (n_bits + self.tail) * self.n_out
+        values = np.asarray(values, dtype=np.float64)
+        if self.keep is None:
+            return values[:full]
+        out = np.full(full, fill)
+        out[np.resize(self.keep, full)] = values[:self.coded_length(n_bits)]
+        return out
+
+    def decode(self, received, n_bits=None):
+        # Hard bits (or soft values in [0, 1]); n_bits defaults to the longest
+        # message that fits. Punctured positions cost nothing either way.
+        n_bits = self.message_bits(len(received)) if n_bits is None else n_bits
+        bits = viterbi_decode(self._depuncture(received, n_bits, 0.5), self.trellis)
+        return bits[:n_bits]
+
+    def decode_llr(self, llrs, n_bits=None):
+        n_bits = self.message_bits(len(llrs)) if n_bits is None else n_bits
+        bits = viterbi_decode_llr(self._depuncture(llrs, n_bits, 0.0), self.trellis)
+        return bits[:n_bits]
+
+
+def bit_costs(received):
+    # Per-bit cost of deciding 0 / 1. Hard bits and soft values in [0, 1]
+    # (0 = confident zero, 1 = confident one) give Hamming/L1 branch metrics.
+    r = np.asarray(received, dtype=np.float64)
+    return np.stack((r, 1.0 - r), axis=-1)
+
+
+def llr_costs(llrs):
+    # Max-log costs from log-likelihood ratios log(P(0) / P(1))
+    llrs = np.asarray(llrs, dtype=np.float64)
+    return np.stack((np.maximum(-llrs, 0.0), np.maximum(llrs, 0.0)), axis=-1)
+
+
+def viterbi_decode_costs(costs, trellis):
+    # costs: (n_bits, 2) array of decision costs, n_bits a multiple of n_out.
+    # Path metrics live in one array, survivors in a (steps, n_states) uint8 matrix.
+    costs = np.asarray(costs, dtype=np.float64)
+    steps = len(costs) // trellis.n_out
+    if steps == 0:
+        return np.zeros(0, dtype=np.uint8)
+    costs = costs[:steps * trellis.n_out].reshape(steps, trellis.n_out, 2)
+    out_idx = np.arange(trellis.n_out)
+    # Branch metric of every (state, input) pair at every step in one gather
+    bm = costs[:, out_idx, trellis.outputs].sum(axis=-1)            # (steps, n_states, 2)
+    bm_in = bm[:, trellis.prev_states, trellis.prev_bits]           # (steps, n_states, 2)
+
+    decisions = np.empty((steps, trellis.n_states), dtype=np.uint8)
+    metric = np.full(trellis.n_states, np.inf)
+    metric[0] = 0.0
+    prev_states = trellis.prev_states
+    rows = np.arange(trellis.n_states)
+    for t in range(steps):
+        cand = metric[prev_states] + bm_in[t]
+        choice = np.argmin(cand, axis=1)
+        decisions[t] = choice
+        metric = cand[rows, choice]
+        metric -= metric.min()
+
+    bits = np.empty(steps, dtype=np.uint8)
+    state = int(np.argmin(metric))
+    prev_bits = trellis.prev_bits
+    for t in range(steps - 1, -1, -1):
+        choice = decisions[t, state]
+        bits[t] = prev_bits[state, choice]
+        state = prev_states[state, choice]
+    return bits
+
+
+def viterbi_decode(received, trellis):
+    return viterbi_decode_costs(bit_costs(received), trellis)
+
+
+def viterbi_decode_llr(llrs, trellis):
+    return viterbi_decode_costs(llr_costs(llrs), trellis)
+
+
+class ReedSolomon:
+    # RS over GF(2^8) on bytes. Wraps one RSCodec (use reed_solomon() to get
+    # the shared instance) and adds a vectorised syndrome check, so a batch
+    # of blocks only sends the damaged ones through the Python decoder.
+    # Blocks may be shortened: any length up to nsize.
+
+    def __init__(self, nsym, nsize=255):
+        self.nsym = nsym
+        self.nsize = nsize
+        self.codec = RSCodec(nsym, nsize)
+        self._log = np.array(self.codec.gf_log, dtype=np.int64)
+        self._exp = np.array(self.codec.gf_exp, dtype=np.uint8)
+        self._powers = {}
+
+    def encode(self, data):
+        return bytes(self.codec.encode(bytearray(data)))
+
+    def encode_bits(self, bits):
+        # Bits in, bits out; the input is zero-padded to whole bytes
+        bits = np.asarray(bits, dtype=np.uint8)
+        return np.unpackbits(np.frombuffer(self.encode(np.packbits(bits).tobytes()), dtype=np.uint8))
+
+    def _power_table(self, n):
+        # log of alpha^((i + fcr) * (n - 1 - j)) for syndrome i, byte j
+        table = self._powers.get(n)
+        if table is None:
+            i = np.arange(self.nsym)[:, None] + self.codec.fcr
+            j = n - 1 - np.arange(n)[None, :]
+            table = self._powers[n] = (i * j) % 255
+        return table
+
+    def syndromes(self, blocks):
+        # (n_blocks, n) bytes -> (n_blocks, nsym); all zero for a clean codeword
+        blocks = np.atleast_2d(np.asarray(blocks, dtype=np.uint8))
+        logs = self._log[blocks][:, None, :] + self._power_table(blocks.shape[1])[None]
+        terms = np.where(blocks[:, None, :] != 0, self._exp[logs % 255], 0).astype(np.uint8)
+        return np.bitwise_xor.reduce(terms, axis=-1)
+
+    def decode(self, block, erase_pos=None):
+        # Message bytes; raises ReedSolomonError when beyond repair. With
+        # erasure positions the decoder can fix up to nsym of those, else
+        # nsym // 2 errors; a failed erasure decode retries without them.
+        block = bytearray(block)
+        if erase_pos:
+            try:
+                return bytes(self.codec.decode(block, erase_pos=list(erase_pos))[0])
+            except ReedSolomonError:
+                pass
+        return bytes(self.codec.decode(block)[0])
+
+    def decode_blocks(self, blocks, erasures=None):
+        # Equal-length blocks -> list of message bytes, None where decoding
+        # failed. erasures: per-block position lists (or None).
+        blocks = np.atleast_2d(np.asarray(blocks, dtype=np.uint8))
+        if not blocks.size:
+            return []
+        clean = ~self.syndromes(blocks).any(axis=1)
+        out = []
+        for i, block in enumerate(blocks):
+            if clean[i]:
+                out.append(block[:-self.nsym].tobytes())
+                continue
+            try:
+                out.append(self.decode(block, erasures[i] if erasures else None))
+            except ReedSolomonError:
+                out.append(None)
+        return out
+
+
+@lru_cache(maxsize=None)
+def reed_solomon(nsym, nsize=255):
+    # Building an RSCodec recomputes its field tables and generator
+    # polynomial, so every caller shares one instance per (nsym, nsize)
+    return ReedSolomon(nsym, nsize)
+
+
+def erasure_positions(confidence, nsym, threshold=None, limit=None):
+    # Least confident positions (below threshold, if given) as erasure hints,
+    # at most `limit` of them (default nsym // 2, leaving room for errors)
+    confidence = np.asarray(confidence, dtype=np.float64)
+    limit = nsym // 2 if limit is None else min(limit, nsym)
+    order = np.argsort(confidence, kind="stable")[:limit]
+    if threshold is not None:
+        order = order[confidence[order] < threshold]
+    return sorted(order.tolist())
@@ -0,0 +1,60 @@
+import threading
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, sosfilt
+
+
+@lru_cache(maxsize=None)
+def bandpass_sos(lowcut, highcut, sample_rate, order=5):
+    nyq = 0.5 * sample_rate
+    return butter(order, [lowcut / nyq, highcut / nyq], btype='band', output='sos')
+
+
+def parse_band(spec, sample_rate=44100):
+    # "300-2700" -> (300.0, 2700.0); "none" or "" -> None
+    if spec is None or str(spec).strip().lower() in ("", "none"):
+        return None
+    try:
+        low, high = (float(part) for part in str(spec).split("-", 1))
+    except ValueError:
+        raise ValueError(f"Invalid passband '{spec}'. Use the form 'low-high' in Hz, e.g. '300-2700'.")
+    if not 0 < low < high < sample_rate / 2:
+        raise ValueError(f"Invalid passband '{spec}'. Need 0 < low < high < {sample_rate / 2:.0f} Hz.")
+    return low, high
+
+
+class StreamingBandpass:
+    # Butterworth bandpass as second-order sections, designed once per
+    # (band, order, sample rate), with filter state carried from chunk to chunk
+    # so block boundaries do not add transients.
+
+    def __init__(self, sample_rate=44100, order=5):
+        self.sample_rate = sample_rate
+        self.order = order
+        self.band = None
+        self.sos = None
+        self.zi = None
+        self._lock = threading.Lock()
+
+    def set_band(self, spec):
+        band = parse_band(spec, self.sample_rate)
+        with self._lock:
+            if band != self.band:
+                self.band = band
+                self.sos = None if band is None else bandpass_sos(band[0], band[1], self.sample_rate, self.order)
+                self.zi = None if band is None else np.zeros((self.sos.shape[0], 2))
+
+    def reset(self):
+        with self._lock:
+            if self.sos is not None:
+                self.zi = np.zeros((self.sos.shape[0], 2))
+
+    def process(self, data, spec=None):
+        if spec is not None:
+            self.set_band(spec)
+        with self._lock:
+            if self.sos is None:
+                return data
+            filtered, self.zi = sosfilt(self.sos, data, zi=self.zi)
+            return filtered
@@ -0,0 +1,219 @@
+import math
+import threading
+from collections import deque
+from dataclasses import dataclass, replace
+
+from .modes import ROBUST, ROBUST_PLUS, Mode, get_mode
+
+
+@dataclass(frozen=True)
+class Rate:
+    # One step of the rate ladder: a packet mode sent with a convolutional
+    # code. min_snr is the SNR (dB in 2500 Hz) above which dipper.sweep
+    # gets it through a plain AWGN channel.
+    mode: Mode
+    code: str
+    min_snr: float
+
+    @property
+    def name(self):
+        return f"{self.mode.name}/{self.code}"
+
+    @property
+    def tx_mode(self):
+        # The Mode to hand to Modem.frame_segments and friends
+        return replace(self.mode, code=self.code)
+
+
+# Slowest first. Robust holds to -9 dB with every code; Robust+ is limited by
+# its own sync and header below about 5 dB, and the punctured codes need 3-4 dB more.
+RATES = (
+    Rate(ROBUST, "k7", -10.0),
+    Rate(ROBUST, "k7-3/4", -8.0),
+    Rate(ROBUST_PLUS, "k7", 5.0),
+    Rate(ROBUST_PLUS, "k7-2/3", 8.0),
+    Rate(ROBUST_PLUS, "k7-3/4", 8.5),
+)
+
+
+def receive_codes(mode, rates=RATES):
+    # Codes a ModemReceiver for `mode` tries so it can follow an adaptive
+    # sender, the mode's own code first
+    mode = get_mode(mode)
+    codes = [mode.code]
+    for rate in rates:
+        if rate.mode.name == mode.name and rate.code not in codes:
+            codes.append(rate.code)
+    return codes
+
+
+@dataclass
+class LinkStatus:
+    # LinkAdapter's view of one peer. Goodputs are in delivered text bits
+    # per second of airtime: `goodput` as measured over the recent ACKs
+    # (None before any), `expected` as predicted for `rate`. `ceiling` is
+    # the fastest rate allowed while a rate drop is held, None otherwise.
+    peer: str
+    rate: str
+    snr_db: float
+    success: float
+    goodput: float
+    expected: float
+    failures: int
+    ceiling: str = None
+
+
+class _Peer:
+    def __init__(self, rate, window):
+        self.rate = rate
+        self.snr = None
+        self.outcomes = {}                    # rate name -> deque of (ok, SNR then)
+        self.sent = deque(maxlen=window)      # (bits delivered, airtime s)
+        self.failures = 0                     # NACKs in a row, at any rate
+        self.strikes = 0                      # NACKs in a row since the last rate drop
+        self.ceiling = None                   # index of the highest rate allowed after a drop
+        self.acks = 0                         # ACKs in a row under the ceiling
+
+
+class LinkAdapter:
+    # Rate selection for ARQ links. For each peer it keeps a smoothed SNR,
+    # taken from the peer's own packets since an HF path is close to
+    # reciprocal over a QSO, and the ACK/NACK outcomes of recent packets at
+    # each rate. select() picks the rate with the best expected goodput: its
+    # bit rate times its chance of getting through. That chance starts from
+    # the SNR against the rate's threshold and gives way to the ACK history
+    # as it fills, counting only outcomes seen within snr_span dB of the
+    # current SNR so a fade does not inherit the luck of a quiet band.
+    # drop_after NACKs in a row drop one rate at once. The rate dropped from
+    # and those above it are then held out of reach, and every recover_after
+    # ACKs in a row let select() climb back one rate. Retries back off
+    # exponentially with the NACKs in a row. Reports may come from the
+    # receive and transmit threads at once.
+
+    def __init__(self, modem, rates=RATES, payload_bytes=16, margin_db=2.0, window=8, prior_weight=2.0,
+                 hysteresis=1.15, smoothing=0.3, snr_span=3.0, drop_after=2, recover_after=3, backoff=0.5,
+                 max_backoff=8.0):
+        self.modem = modem
+        self.rates = tuple(rates)
+        self.margin_db = margin_db
+        self.window = window
+        self.prior_weight = prior_weight
+        self.hysteresis = hysteresis
+        self.smoothing = smoothing
+        self.snr_span = snr_span
+        self.drop_after = drop_after
+        self.recover_after = recover_after
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.payload_bytes = payload_bytes
+        self.bit_rates = {r.name: 8 * payload_bytes / self.airtime(r, payload_bytes) for r in self.rates}
+        self._peers = {}
+        self._lock = threading.Lock()
+
+    def airtime(self, rate, n_bytes):
+        # Seconds on air for one packet of n_bytes at `rate`, preamble included
+        mode = rate.tx_mode
+        preamble = len(mode.preamble) * int(self.modem.sample_rate * mode.preamble_duration)
+        return (preamble + self.modem.packet_span(mode, n_bytes)) / self.modem.sample_rate
+
+    def rate(self, name):
+        for rate in self.rates:
+            if rate.name == name:
+                return rate
+        raise ValueError(f"Unknown rate '{name}'.")
+
+    def _peer(self, peer):
+        if peer not in self._peers:
+            self._peers[peer] = _Peer(self.rates[0].name, self.window)
+        return self._peers[peer]
+
+    def report_snr(self, peer, snr_db):
+        # SNR of a packet heard from `peer` (RxEvent.snr)
+        if snr_db is None or not math.isfinite(snr_db):
+            return
+        with self._lock:
+            state = self._peer(peer)
+            state.snr = snr_db if state.snr is None else state.snr + self.smoothing * (snr_db - state.snr)
+
+    def report_ack(self, peer, rate, ok, n_bytes=None):
+        # Outcome of one packet of n_bytes (default: payload_bytes) sent to
+        # `peer` at `rate` (a Rate or its name)
+        rate = rate if isinstance(rate, Rate) else self.rate(rate)
+        n_bytes = self.payload_bytes if n_bytes is None else n_bytes
+        with self._lock:
+            state = self._peer(peer)
+            state.outcomes.setdefault(rate.name, deque(maxlen=self.window)).append((bool(ok), state.snr))
+            state.sent.append((8 * n_bytes if ok else 0, self.airtime(rate, n_bytes)))
+            if ok:
+                state.failures = state.strikes = 0
+                state.acks += 1
+                if state.ceiling is not None and state.acks >= self.recover_after:
+                    state.ceiling += 1
+                    state.acks = 0
+                    if state.ceiling >= len(self.rates) - 1:
+                        state.ceiling = None
+                return
+            state.failures += 1
+            state.strikes += 1
+            state.acks = 0
+            if state.strikes >= self.drop_after and rate.name == state.rate:
+                index = self.rates.index(rate)
+                state.rate = self.rates[max(index - 1, 0)].name
+                state.strikes = 0
+                state.ceiling = max(index - 1, 0)
+                # the rate that just failed starts over from its last outcomes
+                state.outcomes[rate.name] = deque(list(state.outcomes[rate.name])[-self.drop_after:],
+                                                  maxlen=self.window)
+
+    def _success(self, state, rate):
+        if state.snr is None:
+            prior = 0.9 if rate is self.rates[0] else 0.1
+        else:
+            x = state.snr - rate.min_snr - self.margin_db
+            prior = 1.0 / (1.0 + math.exp(-max(min(x, 50.0), -50.0)))
+        outcomes = [ok for ok, snr in state.outcomes.get(rate.name, ())
+                    if snr is None or state.snr is None or abs(snr - state.snr) <= self.snr_span]
+        return (sum(outcomes) + self.prior_weight * prior) / (len(outcomes) + self.prior_weight)
+
+    def _select(self, state):
+        allowed = self.rates if state.ceiling is None else self.rates[:state.ceiling + 1]
+        expected = {r.name: self._success(state, r) * self.bit_rates[r.name] for r in allowed}
+        best = max(allowed, key=lambda r: expected[r.name]).name
+        if expected[best] > self.hysteresis * expected[state.rate]:
+            state.rate = best
+        return self.rate(state.rate)
+
+    def select(self, peer):
+        # Rate for the next packet to `peer`
+        with self._lock:
+            return self._select(self._peer(peer))
+
+    def retry_delay(self, peer):
+        # Seconds to wait before resending after NACKs; 0 after an ACK
+        with self._lock:
+            failures = self._peer(peer).failures
+        return 0.0 if not failures else min(self.backoff * 2 ** (failures - 1), self.max_backoff)
+
+    def goodput(self, peer):
+        # Delivered text bits per second of airtime over the recent packets, or None
+        with self._lock:
+            sent = list(self._peer(peer).sent)
+        airtime = sum(t for _, t in sent)
+        return sum(b for b, _ in sent) / airtime if airtime else None
+
+    def status(self, peer):
+        goodput = self.goodput(peer)
+        with self._lock:
+            state = self._peer(peer)
+            rate = self.rate(state.rate)
+            success = self._success(state, rate)
+            ceiling = None if state.ceiling is None else self.rates[state.ceiling].name
+            return LinkStatus(peer, rate.name, state.snr, success, goodput, success * self.bit_rates[rate.name],
+                              state.failures, ceiling)
+
+    def reset(self, peer=None):
+        with self._lock:
+            if peer is None:
+                self._peers.clear()
+            else:
+                self._peers.pop(peer, None)
@@ -0,0 +1,363 @@
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+from .codec import (OFDM_MAX_BYTES, ROBUST_MAX_BYTES, decode_fec, decode_ofdm_header, decode_packet,
+                    encode_ofdm_packet, encode_v4_packet, find_v4_packet, ofdm_payload_symbols, text_symbols,
+                    v4_packet_symbols)
+from .demod import SoftDemodulator
+from .modes import ModemConfig, ROBUST, ROBUST_PLUS, get_mode
+from .ofdm import OfdmModem, OfdmParams
+from .rxengine import SlidingToneAnalyzer, SymbolTimingRecovery
+from .symbols import CHAR_SOUNDS, DETECTOR_FREQS, REVERSE_MAP, SYMBOL_MAP, V4_SYMBOLS, WORD_SOUNDS
+from .sync import PreambleCorrelator, shift_frequency
+from .tonebank import ToneDetectorBank
+from .waveforms import WaveformBank
+
+
+class Modem:
+    # Tk-free Dipper modem: frame building and modulation on the transmit side,
+    # symbol decisions and packet decoding on the receive side. Everything a
+    # GUI used to read from its widgets comes in through ModemConfig and Mode.
+
+    def __init__(self, config=None):
+        self.config = config or ModemConfig()
+        self.sample_rate = self.config.sample_rate
+        self.waveforms = WaveformBank({**CHAR_SOUNDS, **WORD_SOUNDS}, self.sample_rate)
+        self.tone_bank = ToneDetectorBank(DETECTOR_FREQS, self.sample_rate)
+        self._v4_demod = None
+        self.ofdm = OfdmModem(OfdmParams.for_mode(ROBUST_PLUS, self.sample_rate))
+
+    @property
+    def v4_demod(self):
+        if self._v4_demod is None:
+            self._v4_demod = SoftDemodulator(self.waveforms, V4_SYMBOLS, ROBUST.symbol_duration)
+        return self._v4_demod
+
+    # Transmit
+
+    def frame_segments(self, text, mode, packet_id=None):
+        # WaveformBank segments for one transmission of text in the given mode
+        mode = get_mode(mode)
+        preamble = (list(mode.preamble), mode.preamble_duration, 0) if mode.packetized else None
+        if mode.name == "robust":
+            keys = [sym if sym in CHAR_SOUNDS else " " for sym in encode_v4_packet(text, packet_id, mode.code)]
+            return [preamble, (keys, mode.symbol_duration, mode.gap_duration)]
+        if mode.name == "robust_plus":
+            bits = encode_ofdm_packet(text, 0 if packet_id is None else packet_id, mode.code,
+                                      self.ofdm.params.bits_per_symbol)
+            return [preamble, self.ofdm.modulate(bits)]
+        keys = []
+        for symbol in text_symbols(text):
+            char = REVERSE_MAP.get(symbol, " ")
+            keys.append(char if char in WORD_SOUNDS or char in CHAR_SOUNDS else None)
+        return [(keys, mode.symbol_duration, mode.gap_duration)]
+
+    def modulate(self, text, mode, packet_id=None):
+        # Whole frame as one float32 array
+        return self.waveforms.render_frame(self.frame_segments(text, mode, packet_id))
+
+    def modulate_batch(self, texts, mode, packet_ids=None, spacing=0.0):
+        # Many messages in one gather: (buffer, starts), message i at
+        # buffer[starts[i]:starts[i + 1]] including `spacing` s of trailing silence
+        mode = get_mode(mode)
+        packet_ids = list(range(len(texts)) if packet_ids is None else packet_ids)
+        frames = {}   # repeated beacons are encoded once
+        for text, pid in zip(texts, packet_ids):
+            if (text, pid) not in frames:
+                frames[(text, pid)] = self.frame_segments(text, mode, pid)
+        return self.waveforms.render_frames([frames[(text, pid)] for text, pid in zip(texts, packet_ids)], spacing)
+
+    # Receive
+
+    def squelched(self, energies, sensitivity=None):
+        # Squelch on peak-to-median tone or symbol energy; noise alone sits
+        # around 2-4. Digital silence (all zeros) is squelched too.
+        sensitivity = self.config.sensitivity if sensitivity is None else sensitivity
+        energies = np.asarray(energies)
+        return np.max(energies, axis=-1) <= (1 + sensitivity / 10.0) * np.median(energies, axis=-1)
+
+    def symbol_from_energies(self, energies, mode, sensitivity=None):
+        mode = get_mode(mode)
+        if self.squelched(energies, sensitivity):
+            return None
+        peak_freq = self.tone_bank.freqs[np.argmax(energies)]
+
+        tolerance = 150
+        if mode.name == "robust":
+            for sym, pattern in CHAR_SOUNDS.items():
+                start_freq = pattern[0][0]
+                if abs(peak_freq - start_freq) < tolerance:
+                    return sym
+        else:
+            for word, pattern in WORD_SOUNDS.items():
+                start_freq = pattern[0][0]
+                if abs(peak_freq - start_freq) < tolerance:
+                    return SYMBOL_MAP[word]
+            for char, pattern in CHAR_SOUNDS.items():
+                start_freq = pattern[0][0]
+                if abs(peak_freq - start_freq) < tolerance:
+                    return SYMBOL_MAP[char]
+        return None
+
+    def ofdm_header(self, samples, start):
+        # (packet_id, n_bytes) of the Robust+ packet starting at samples[start]
+        # (its reference symbol), or None if unreadable or not all there yet
+        llrs = self.ofdm.demodulate(samples, start, 1)
+        return None if llrs is None else decode_ofdm_header(llrs[0])
+
+    def ofdm_symbols(self, n_bytes, mode=ROBUST_PLUS):
+        # OFDM symbols after the reference for a payload of n_bytes, header included
+        return 1 + ofdm_payload_symbols(n_bytes, get_mode(mode).code, self.ofdm.params.bits_per_symbol)
+
+    def channel_symbols(self, mode, samples, start=0, count=None, offset=0.0):
+        # Hard symbol decisions for `count` symbols whose first one begins at
+        # samples[start], with the tones moved by `offset` Hz. Returns
+        # (symbols, llrs); llrs is None in Normal mode, and both are None
+        # when the samples run out first. By default every whole symbol in
+        # the samples is taken, up to the longest Robust packet. Robust+
+        # symbols are OFDM symbols (header and payload, after the reference
+        # at start) given as tuples of hard bits; by default their number
+        # comes from the header.
+        mode = get_mode(mode)
+        sr = self.sample_rate
+        samples = shift_frequency(samples, -offset, sr)
+        if mode.name == "robust_plus":
+            if count is None:
+                header = self.ofdm_header(samples, start)
+                if header is None:
+                    return None, None
+                count = self.ofdm_symbols(header[1], mode)
+            llrs = self.ofdm.demodulate(samples, start, count)
+            if llrs is None:
+                return None, None
+            return [tuple(row) for row in (llrs < 0).astype(int).tolist()], llrs
+        symbol_samples = int(sr * mode.symbol_duration)
+        period = symbol_samples + int(sr * mode.gap_duration)
+        if count is None:
+            count = max(0, (len(samples) - start - symbol_samples) // period + 1)
+            if mode.name == "robust":
+                count = min(count, v4_packet_symbols(ROBUST_MAX_BYTES, mode.code))
+        starts = start + period * np.arange(count)
+        if not count or starts[-1] + symbol_samples > len(samples):
+            return None, None
+        windows = samples[starts[:, None] + np.arange(symbol_samples)]
+        if mode.name == "robust":
+            demod = self.v4_demod
+            energies = demod.energies(windows)
+            return [demod.keys[i] for i in np.argmax(energies, axis=1)], list(demod.llrs(energies))
+        energies = self.tone_bank.energies(windows)
+        return [self.symbol_from_energies(e, mode) for e in energies], None
+
+    def packet_span(self, mode, n_bytes=None):
+        # Samples from the end of the preamble to the end of a packet
+        # carrying n_bytes (default: the longest possible)
+        mode = get_mode(mode)
+        if mode.name == "robust_plus":
+            n_bytes = OFDM_MAX_BYTES if n_bytes is None else n_bytes
+            return self.ofdm.frame_length(self.ofdm_symbols(n_bytes, mode))
+        if mode.name != "robust":
+            return 0
+        n_bytes = ROBUST_MAX_BYTES if n_bytes is None else n_bytes
+        period = int(self.sample_rate * mode.symbol_duration) + int(self.sample_rate * mode.gap_duration)
+        return period * v4_packet_symbols(n_bytes, mode.code)
+
+    def decode_packet(self, symbols, mode, llrs=None):
+        return decode_packet(symbols, mode, llrs)
+
+    def receiver(self, mode, codes=None):
+        return ModemReceiver(self, mode, codes)
+
+
+@dataclass
+class RxEvent:
+    # kind: "preamble" (packet start seen), "packet" (packet decoded; text is
+    # None on a CRC failure) or "text" (Normal mode characters). offset is the
+    # station's frequency offset in Hz and snr its SNR in dB (2500 Hz), when
+    # the preamble gave them.
+    kind: str
+    mode: str
+    text: str = None
+    packet_id: int = None
+    position: int = None
+    offset: float = None
+    snr: float = None
+
+
+class ModemReceiver:
+    # Streaming receiver for one mode. push() takes audio blocks of any size
+    # and returns the RxEvents they completed; ARQ replies are left to the caller.
+    # Normal mode follows the symbols with timing recovery. Packet modes find
+    # their preamble with a PreambleCorrelator, whose start time and offset
+    # are exact enough to cut every symbol of the packet straight out of the
+    # recent audio. They decode blind across `codes` (default: the mode's
+    # own), so a sender may change code rate from one packet to the next.
+
+    def __init__(self, modem, mode, codes=None):
+        self.modem = modem
+        self.mode = get_mode(mode)
+        self.codes = list(codes) if codes else [self.mode.code]
+        self.sensitivity = modem.config.sensitivity
+        sample_rate = modem.sample_rate
+        hops = modem.config.hops_per_symbol
+        symbol_samples = int(sample_rate * self.mode.symbol_duration)
+        period = symbol_samples + int(sample_rate * self.mode.gap_duration)
+        hop = max(1, symbol_samples // hops)
+        self.symbol_engine = SlidingToneAnalyzer(modem.tone_bank, symbol_samples, hop)
+        self.timing = SymbolTimingRecovery(period, hop)
+        self.correlator = None
+        if self.mode.packetized:
+            self.correlator = PreambleCorrelator(modem.waveforms, (self.mode.name,), sample_rate)
+        self.preamble = None      # PreambleMatch of the packet in progress
+        self.ofdm_packet = None   # (packet_id, n_bytes) once a Robust+ header is read
+        self.tried = 0            # Robust packet lengths up to this many symbols have failed the CRC
+        # Recent audio, with the absolute index of its first sample. A match
+        # is confirmed up to a preamble length after the preamble ends.
+        self.margin = int(sample_rate * self.mode.preamble_duration)
+        self.keep = 2 * len(self.mode.preamble or "") * self.margin + 2 * self.margin
+        self.history = np.zeros(0, dtype=np.float32)
+        self.history_start = 0
+
+    @property
+    def preamble_detected(self):
+        return self.preamble is not None
+
+    def reset(self):
+        for part in (self.symbol_engine, self.timing, self.correlator):
+            if part is not None:
+                part.reset()
+        self.clear_packet()
+        self.history = np.zeros(0, dtype=np.float32)
+        self.history_start = 0
+
+    def flush(self):
+        # End of stream: a correlator confirms a preamble only once a little
+        # more audio has passed, so silence is pushed to finish what has begun
+        events = []
+        if self.mode.packetized:
+            events = self.push(np.zeros(self.keep, dtype=np.float32))
+        self.reset()
+        return events
+
+    def clear_packet(self):
+        self.preamble = None
+        self.ofdm_packet = None
+        self.tried = 0
+
+    def push(self, samples):
+        if self.mode.packetized:
+            return self._push_packet(samples)
+        mode = self.mode
+        events = []
+        positions, energies, _ = self.symbol_engine.push(samples)
+        # The median tone energy stays at the noise level under a single tone
+        emit = self.timing.update(positions, energies.max(axis=1), np.median(energies, axis=1))
+        for pos, symbol_energies in zip(positions[emit], energies[emit]):
+            symbol = self.modem.symbol_from_energies(symbol_energies, mode, self.sensitivity)
+            if symbol is not None:
+                events.append(RxEvent("text", mode.name, text=decode_fec([symbol], mode), position=int(pos)))
+        return events
+
+    def _push_packet(self, samples):
+        mode = self.mode
+        self.history = np.concatenate((self.history, np.asarray(samples, dtype=np.float32)))
+        end = self.history_start + len(self.history)
+        events = []
+        for match in self.correlator.push(samples):
+            if match.end < self.history_start + self.margin:
+                continue
+            if self.preamble is not None:
+                # Packets sent back to back: the next preamble ends this one
+                events.extend(self._decode_ready(end))
+                if self.preamble is not None:
+                    if match.start < self.preamble.end:
+                        continue
+                    events.append(self._packet_event(None, None, match.start))
+            if self.preamble is None:
+                self.preamble = match
+                events.append(RxEvent("preamble", mode.name, position=match.end, offset=match.offset,
+                                      snr=match.snr_db))
+        if self.preamble is not None:
+            events.extend(self._decode_ready(end))
+        first = end - self.keep
+        if self.preamble is not None:
+            first = min(first, self.preamble.end - self.margin)
+        if first > self.history_start:
+            self.history = self.history[first - self.history_start:]
+            self.history_start = first
+        return events
+
+    def _decode_ready(self, end):
+        # Decode the packet in progress once all of it has arrived. Robust+
+        # reads its header first for the length; the FFT windows end half a
+        # cyclic prefix before the frame does.
+        modem = self.modem
+        mode = self.mode
+        start = self.preamble.end
+        if mode.name == "robust":
+            return self._decode_robust(end)
+        if mode.name == "robust_plus":
+            slack = modem.ofdm.params.cyclic_prefix // 2
+            if self.ofdm_packet is None:
+                if start + modem.ofdm.frame_length(1) - slack > end:
+                    return []
+                header = modem.ofdm_header(*self._packet_audio(start))
+                if header is None:
+                    self.clear_packet()
+                    return []
+                self.ofdm_packet = header
+            count = max(modem.ofdm_symbols(self.ofdm_packet[1], replace(mode, code=c)) for c in self.codes)
+            stop = start + modem.ofdm.frame_length(count) - slack
+        if stop > end:
+            return []
+        symbols, llrs = modem.channel_symbols(mode, *self._packet_audio(start), count)
+        if symbols is None:
+            self.clear_packet()
+            return []
+        for code in self.codes:
+            packet_id, text = decode_packet(symbols, replace(mode, code=code), llrs)
+            if text is not None:
+                break
+        return [self._packet_event(text, packet_id, stop)]
+
+    def _decode_robust(self, end):
+        # Robust packets do not send their length: each packet length is
+        # tried as soon as its symbols are in, and the packet fails once two
+        # symbols in a row are below the squelch or the longest one is in
+        modem = self.modem
+        mode = self.mode
+        sr = modem.sample_rate
+        symbol_samples = int(sr * mode.symbol_duration)
+        period = symbol_samples + int(sr * mode.gap_duration)
+        longest = max(v4_packet_symbols(ROBUST_MAX_BYTES, code) for code in self.codes)
+        count = min((end - self.preamble.end - symbol_samples) // period + 1, longest)
+        if count <= max(self.tried, 1):
+            return []
+        samples, start = self._packet_audio(self.preamble.end)
+        symbols, llrs = modem.channel_symbols(mode, samples, start, count)
+        for code in self.codes:
+            packet_id, text, length = find_v4_packet(symbols, llrs, code, self.tried)
+            if text is not None:
+                break
+        if text is None:
+            self.tried = count
+            last = start + period * np.arange(count - 2, count)
+            energies = modem.v4_demod.energies(samples[last[:, None] + np.arange(symbol_samples)])
+            if count < longest and not np.all(modem.squelched(energies, self.sensitivity)):
+                return []
+            length = count
+        return [self._packet_event(text, packet_id, self.preamble.end + period * length)]
+
+    def _packet_event(self, text, packet_id, stop):
+        # Packet event carrying its preamble's offset and SNR; ends the packet
+        match = self.preamble
+        self.clear_packet()
+        return RxEvent("packet", self.mode.name, text=text, packet_id=packet_id, position=stop,
+                       offset=match.offset, snr=match.snr_db)
+
+    def _packet_audio(self, start):
+        # (samples, local start) from a little before the packet, moved back
+        # by the preamble's frequency offset
+        lo = max(start - self.margin, self.history_start) - self.history_start
+        samples = shift_frequency(self.history[lo:], -self.preamble.offset, self.modem.sample_rate)
+        return samples, start - self.history_start - lo
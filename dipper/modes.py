@@ -0,0 +1,47 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Mode:
+    # One Dipper speed setting. Durations are what goes on air: symbol length
+    # and the silence after each symbol, both in seconds. Robust+ is OFDM:
+    # there the symbol is the FFT window and the gap its cyclic prefix.
+    name: str
+    label: str
+    symbol_duration: float
+    gap_duration: float
+    preamble: str = None         # preamble symbols sent ahead of a packet, if any
+    preamble_duration: float = 0.05
+    code: str = None             # convolutional code, a key of symbols.CONV_CODES
+
+    @property
+    def packetized(self):
+        return self.preamble is not None
+
+
+NORMAL = Mode("normal", "Normal", 0.1, 0.05)
+ROBUST = Mode("robust", "Robust", 0.05, 0.025, preamble="1357924", code="v4")
+ROBUST_PLUS = Mode("robust_plus", "Robust+", 0.01, 0.002, preamble="2468135", code="k7")
+
+MODES = {mode.name: mode for mode in (NORMAL, ROBUST, ROBUST_PLUS)}
+
+NOISE_BANDWIDTH = 2500.0   # SNR reference bandwidth in Hz, as usual for HF digital modes
+
+
+def get_mode(mode):
+    # Accepts a Mode or its name ("normal", "robust", "robust_plus")
+    if isinstance(mode, Mode):
+        return mode
+    try:
+        return MODES[mode]
+    except KeyError:
+        raise ValueError(f"Invalid speed setting: '{mode}'.")
+
+
+@dataclass
+class ModemConfig:
+    # Receiver/transmitter settings that used to be read from Tk variables.
+    # sensitivity is the 0-100 slider value.
+    sample_rate: int = 44100
+    sensitivity: float = 50.0
+    hops_per_symbol: int = 5
@@ -0,0 +1,114 @@
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class OfdmParams:
+    # Robust+ multi-carrier layout. The FFT window is 1/spacing long and each
+    # symbol is preceded by a cyclic prefix of `guard` seconds, which soaks up
+    # multipath and timing error. 22 carriers at 100 Hz cover 400-2500 Hz,
+    # inside a 2400 Hz SSB passband. Peaks are clipped at clip_ratio times
+    # the RMS so a peak-limited transmitter is not mostly idle.
+    sample_rate: int = 44100
+    spacing: float = 100.0
+    first_carrier: float = 400.0
+    carriers: int = 22
+    guard: float = 0.002
+    clip_ratio: float = 1.6
+
+    @property
+    def fft_size(self):
+        return int(round(self.sample_rate / self.spacing))
+
+    @property
+    def cyclic_prefix(self):
+        return int(round(self.guard * self.sample_rate))
+
+    @property
+    def symbol_samples(self):
+        return self.fft_size + self.cyclic_prefix
+
+    @property
+    def bins(self):
+        first = int(round(self.first_carrier / self.spacing))
+        return first + np.arange(self.carriers)
+
+    @property
+    def bits_per_symbol(self):
+        return 2 * self.carriers
+
+    @classmethod
+    def for_mode(cls, mode, sample_rate=44100):
+        # symbol_duration is the FFT window, gap_duration the cyclic prefix
+        return cls(sample_rate=sample_rate, spacing=1.0 / mode.symbol_duration, guard=mode.gap_duration)
+
+
+class OfdmModem:
+    # Differential QPSK on every carrier: the first symbol is a known
+    # reference and each later symbol carries two bits per carrier as a phase
+    # step from the one before, so neither channel estimation nor carrier
+    # phase recovery is needed. Gray-coded steps of 45, 135, 225 and 315
+    # degrees put bit 0 on the sign of the real part and bit 1 on the
+    # imaginary part of the differential product.
+
+    def __init__(self, params=None):
+        self.params = params or OfdmParams()
+
+    @cached_property
+    def reference(self):
+        # Newman phases keep the crest factor of the reference symbol low
+        k = np.arange(self.params.carriers)
+        return np.exp(1j * np.pi * k * k / self.params.carriers)
+
+    @cached_property
+    def _noise_bins(self):
+        # Empty bins just outside the carriers, for the noise estimate
+        bins = self.params.bins
+        return np.r_[max(1, bins[0] - 3):bins[0] - 1, bins[-1] + 2:bins[-1] + 4]
+
+    def frame_length(self, n_symbols):
+        # Samples for n_symbols data symbols plus the reference
+        return (n_symbols + 1) * self.params.symbol_samples
+
+    def modulate(self, bits):
+        # bits: multiple of bits_per_symbol -> float32 samples, peak 1.0.
+        # One inverse real FFT renders every symbol at once.
+        p = self.params
+        bits = np.asarray(bits, dtype=np.uint8).reshape(-1, p.carriers, 2)
+        steps = np.pi / 4 + np.pi / 2 * np.array([[0, 3], [1, 2]])[bits[..., 0], bits[..., 1]]
+        phases = np.angle(self.reference) + np.cumsum(np.vstack((np.zeros(p.carriers), steps)), axis=0)
+        spectra = np.zeros((len(phases), p.fft_size // 2 + 1), dtype=complex)
+        spectra[:, p.bins] = np.exp(1j * phases)
+        symbols = np.fft.irfft(spectra, n=p.fft_size, axis=1)
+        framed = np.hstack((symbols[:, p.fft_size - p.cyclic_prefix:], symbols))
+        out = framed.reshape(-1)
+        if self.params.clip_ratio:
+            limit = self.params.clip_ratio * np.sqrt(np.mean(out ** 2))
+            out = np.clip(out, -limit, limit)
+        return (out / np.max(np.abs(out))).astype(np.float32)
+
+    def spectra(self, samples, start, n_symbols):
+        # Carrier values of the reference and n_symbols data symbols. Each FFT
+        # window starts halfway into the cyclic prefix, so timing may be off
+        # by half the prefix either way; the resulting phase ramp is the same
+        # for every symbol and drops out of the differential product.
+        p = self.params
+        first = start + p.cyclic_prefix // 2 + p.symbol_samples * np.arange(n_symbols + 1)
+        if first[0] < 0 or first[-1] + p.fft_size > len(samples):
+            return None
+        windows = np.asarray(samples, dtype=np.float64)[first[:, None] + np.arange(p.fft_size)]
+        return np.fft.rfft(windows, axis=1)
+
+    def demodulate(self, samples, start, n_symbols):
+        # (n_symbols, bits_per_symbol) LLRs, positive favouring 0, or None
+        # when the samples end first
+        full = self.spectra(samples, start, n_symbols)
+        if full is None:
+            return None
+        y = full[:, self.params.bins]
+        z = y[1:] * np.conj(y[:-1])
+        noise = np.median(np.abs(full[:, self._noise_bins]) ** 2) + 1e-12
+        llrs = np.stack((z.real, z.imag), axis=-1) / noise
+        return llrs.reshape(n_symbols, -1)
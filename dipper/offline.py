@@ -0,0 +1,179 @@
+"""Batch decoding of recorded audio, as fast as the CPU allows.
+
+    python -m dipper.offline --mode robust band-20m-*.wav > decodes.jsonl
+    python -m dipper.offline --mode robust --wideband --workers 8 *.wav
+    python -m dipper.offline --raw --sample-rate 44100 capture.f32
+
+WAV files (PCM 8/16/32-bit or float) and headerless float32 files are
+memory-mapped and fed to the streaming receiver in large blocks. Files are
+spread over a process pool. Every decode is written as one JSON line with its
+time into the file and, when the recording start is known, a UTC timestamp.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from scipy.io import wavfile
+
+from .modem import Modem
+from .modes import MODES, ModemConfig, get_mode
+from .wideband import WidebandDecoder
+
+BLOCK = 1 << 16
+
+
+class Recording:
+    # A memory-mapped recording; blocks() yields mono float32 in [-1, 1]
+
+    def __init__(self, path, raw=False, sample_rate=44100, channels=1, channel=0):
+        self.path = path
+        if raw:
+            data = np.memmap(path, dtype="<f4", mode="r")
+            data = data[:len(data) - len(data) % channels].reshape(-1, channels)
+            self.sample_rate = sample_rate
+        else:
+            self.sample_rate, data = wavfile.read(path, mmap=True)
+            if data.ndim == 1:
+                data = data[:, None]
+        if not 0 <= channel < data.shape[1]:
+            raise ValueError(f"{path}: no channel {channel} ({data.shape[1]} channels)")
+        self.data = data
+        self.channel = channel
+
+    @property
+    def frames(self):
+        return self.data.shape[0]
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def _to_float(self, block):
+        if block.dtype == np.uint8:
+            return (block.astype(np.float32) - 128.0) / 128.0
+        if np.issubdtype(block.dtype, np.integer):
+            return block.astype(np.float32) / float(-np.iinfo(block.dtype).min)
+        return block.astype(np.float32)
+
+    def blocks(self, size=BLOCK):
+        for start in range(0, self.frames, size):
+            yield self._to_float(np.asarray(self.data[start:start + size, self.channel]))
+
+
+def _merge_text(events, gap):
+    # Normal mode yields one event per character; join runs into lines.
+    # Returns (event, text) pairs.
+    merged = []   # [event, text, position of the last character]
+    for event in events:
+        if (event.kind == "text" and merged and merged[-1][0].kind == "text"
+                and event.position - merged[-1][2] <= gap):
+            merged[-1][1] += event.text
+            merged[-1][2] = event.position
+        else:
+            merged.append([event, event.text, event.position])
+    return [(event, text) for event, text, _ in merged]
+
+
+def decode_file(path, mode, raw=False, sample_rate=44100, channels=1, channel=0, wideband=False,
+                start_time=None, sensitivity=50.0, block=BLOCK):
+    # Returns (records, stats). start_time is the UTC datetime of the first sample.
+    mode = get_mode(mode)
+    rec = Recording(path, raw, sample_rate, channels, channel)
+    modem = Modem(ModemConfig(sample_rate=rec.sample_rate, sensitivity=sensitivity))
+    if wideband:
+        decoder = WidebandDecoder(modem, mode, workers=1)
+    else:
+        decoder = modem.receiver(mode)
+    began = time.perf_counter()
+    events = []
+    for samples in rec.blocks(block):
+        events.extend(decoder.push(samples))
+    events.extend(decoder.close() if wideband else decoder.flush())
+    elapsed = time.perf_counter() - began
+
+    period = rec.sample_rate * (mode.symbol_duration + mode.gap_duration)
+    records = []
+    for event, text in _merge_text(events, 3 * period):
+        seconds = (event.position or 0) / rec.sample_rate
+        record = {"file": path, "time": round(seconds, 4), "mode": event.mode, "kind": event.kind}
+        if start_time is not None:
+            record["timestamp"] = (start_time + timedelta(seconds=seconds)).isoformat(timespec="milliseconds")
+        if event.kind != "preamble":
+            record["text"] = text
+        if event.packet_id is not None:
+            record["packet_id"] = event.packet_id
+        if event.offset is not None:
+            record["offset_hz"] = round(float(event.offset), 1)
+        if event.snr is not None:
+            record["snr_db"] = round(float(event.snr), 1)
+        records.append(record)
+    stats = {"file": path, "duration_s": rec.duration, "elapsed_s": elapsed,
+             "realtime_factor": rec.duration / elapsed if elapsed > 0 else None,
+             "sample_rate": rec.sample_rate, "decodes": len(records)}
+    return records, stats
+
+
+def _start_time(path, args):
+    if args.start_time:
+        return datetime.fromisoformat(args.start_time).astimezone(timezone.utc)
+    if args.start_from_mtime:
+        # The file was last written when recording stopped
+        rec = Recording(path, args.raw, args.sample_rate, args.channels, args.channel)
+        end = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+        return end - timedelta(seconds=rec.duration)
+    return None
+
+
+def _decode_job(path, args):
+    return decode_file(path, args.mode, args.raw, args.sample_rate, args.channels, args.channel,
+                       args.wideband, _start_time(path, args), args.sensitivity)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode Dipper recordings offline")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--mode", choices=list(MODES), default="normal")
+    parser.add_argument("--wideband", action="store_true", help="search all frequency offsets (packet modes)")
+    parser.add_argument("--raw", action="store_true", help="headerless little-endian float32 samples")
+    parser.add_argument("--sample-rate", type=int, default=44100, help="for --raw files")
+    parser.add_argument("--channels", type=int, default=1, help="for --raw files")
+    parser.add_argument("--channel", type=int, default=0)
+    parser.add_argument("--sensitivity", type=float, default=50.0)
+    parser.add_argument("--start-time", help="ISO time of the first sample (applies to every file)")
+    parser.add_argument("--start-from-mtime", action="store_true",
+                        help="take the recording start as file mtime minus duration")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--out", help="JSON lines output (default: stdout)")
+    args = parser.parse_args(argv)
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    failed = 0
+    try:
+        with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(args.files)))) as pool:
+            jobs = {pool.submit(_decode_job, path, args): path for path in args.files}
+            for job in as_completed(jobs):
+                path = jobs[job]
+                try:
+                    records, stats = job.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"{path}: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+                for record in records:
+                    out.write(json.dumps(record) + "\n")
+                out.flush()
+                print(f"{path}: {stats['duration_s']:.1f} s audio in {stats['elapsed_s']:.2f} s "
+                      f"(x{stats['realtime_factor']:.0f}), {stats['decodes']} decodes", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Render Dipper transmissions to audio files without an audio device.
+
+    python -m dipper.render --mode robust --text "CQ CQ CQ DE M0OLI" --out cq.wav
+    python -m dipper.render --mode normal --batch beacons.txt --out-dir beacons/
+    python -m dipper.render --mode robust_plus --batch corpus.txt --out corpus.f32 --raw --spacing 0.5
+
+--batch takes one message per line and renders them all in one call; with
+--out-dir each message gets its own file, otherwise they are written back to
+back (separated by --spacing seconds) into --out.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+from scipy.io import wavfile
+
+from .modem import Modem
+from .modes import MODES, ModemConfig
+
+SAMPLE_FORMATS = ("int16", "float32")
+
+
+def write_wav(path, samples, sample_rate=44100, sample_format="int16"):
+    samples = np.asarray(samples, dtype=np.float32)
+    if sample_format == "int16":
+        data = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    elif sample_format == "float32":
+        data = samples
+    else:
+        raise ValueError(f"Unknown sample format '{sample_format}'. Use one of {', '.join(SAMPLE_FORMATS)}.")
+    wavfile.write(path, sample_rate, data)
+
+
+def write_raw(path, samples):
+    # Headerless little-endian float32, the format dipper.offline --raw reads
+    np.asarray(samples, dtype="<f4").tofile(path)
+
+
+def render_message(modem, text, mode, packet_id=None, path=None, sample_format="int16"):
+    # Whole frame as float32; also written to `path` if given (.wav, else raw)
+    samples = modem.modulate(text, mode, packet_id)
+    if path is not None:
+        save(path, samples, modem.sample_rate, sample_format)
+    return samples
+
+
+def render_batch(modem, texts, mode, packet_ids=None, spacing=0.0):
+    # One buffer for many messages and a list of per-message views into it
+    buffer, starts = modem.modulate_batch(texts, mode, packet_ids, spacing)
+    return buffer, [buffer[starts[i]:starts[i + 1]] for i in range(len(texts))]
+
+
+def save(path, samples, sample_rate=44100, sample_format="int16"):
+    if str(path).lower().endswith(".wav"):
+        write_wav(path, samples, sample_rate, sample_format)
+    else:
+        write_raw(path, samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render Dipper transmissions to WAV or raw float32")
+    parser.add_argument("--mode", choices=list(MODES), default="normal")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--text", help="message to render")
+    source.add_argument("--batch", help="file with one message per line")
+    parser.add_argument("--packet-id", type=int, default=0, help="first packet id for robust modes")
+    parser.add_argument("--out", help="output file (.wav, anything else is raw float32)")
+    parser.add_argument("--out-dir", help="with --batch: one numbered file per message")
+    parser.add_argument("--raw", action="store_true", help="with --out-dir: write .f32 instead of .wav")
+    parser.add_argument("--spacing", type=float, default=0.0, help="seconds of silence after each message")
+    parser.add_argument("--format", choices=SAMPLE_FORMATS, default="int16", help="WAV sample format")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    args = parser.parse_args(argv)
+    if not args.out and not (args.batch and args.out_dir):
+        parser.error("give --out, or --batch with --out-dir")
+
+    modem = Modem(ModemConfig(sample_rate=args.sample_rate))
+    if args.text is not None:
+        texts = [args.text.upper()]
+    else:
+        texts = [line.strip().upper() for line in Path(args.batch).read_text().splitlines() if line.strip()]
+    packet_ids = [(args.packet_id + i) % 16 for i in range(len(texts))]
+    try:
+        buffer, messages = render_batch(modem, texts, args.mode, packet_ids, args.spacing)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.out_dir:
+        out_dir = Path(args.out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        suffix = ".f32" if args.raw else ".wav"
+        for i, samples in enumerate(messages):
+            save(str(out_dir / f"{i:05d}{suffix}"), samples, args.sample_rate, args.format)
+        print(f"{len(messages)} messages written to {out_dir}", file=sys.stderr)
+    if args.out:
+        save(args.out, buffer, args.sample_rate, args.format)
+        print(f"{len(messages)} messages, {len(buffer) / args.sample_rate:.1f} s written to {args.out}",
+              file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
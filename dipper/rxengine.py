@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class SlidingToneAnalyzer:
+    # Keeps a continuous sample history and evaluates a ToneDetectorBank over a
+    # window that slides by `hop` samples, whatever block size the caller pushes.
+    # Nothing is dropped at block boundaries and the work per hop is one
+    # window-length matrix-vector product.
+
+    def __init__(self, bank, window, hop, capacity=None):
+        self.bank = bank
+        self.window = int(window)
+        self.hop = int(hop)
+        self.capacity = int(capacity or self.window + 16 * 1024)
+        if self.capacity < self.window + self.hop:
+            raise ValueError("capacity must hold at least one window plus one hop")
+        self._buf = np.zeros(self.capacity, dtype=np.float32)
+        self._start = 0   # absolute sample index of _buf[0]
+        self._fill = 0
+        self._next = 0    # absolute index of the next window start
+
+    def reset(self):
+        self._start = 0
+        self._fill = 0
+        self._next = 0
+
+    def _compact(self):
+        keep = self._next - self._start
+        if keep <= 0:
+            return
+        keep = min(keep, self._fill)
+        self._buf[:self._fill - keep] = self._buf[keep:self._fill]
+        self._fill -= keep
+        self._start += keep
+
+    def push(self, samples):
+        # Returns (window start positions, tone energies, window samples) for
+        # every window completed by these samples.
+        samples = np.asarray(samples, dtype=np.float32)
+        positions, energies, windows = [], [], []
+        while len(samples):
+            if self._fill == self.capacity:
+                self._compact()
+            n = min(self.capacity - self._fill, len(samples))
+            self._buf[self._fill:self._fill + n] = samples[:n]
+            self._fill += n
+            samples = samples[n:]
+            last = self._start + self._fill - self.window
+            if last < self._next:
+                continue
+            pos = np.arange(self._next, last + 1, self.hop)
+            view = np.lib.stride_tricks.sliding_window_view(self._buf[:self._fill], self.window)
+            win = view[pos - self._start]
+            positions.append(pos)
+            windows.append(win)
+            energies.append(self.bank.energies(win))
+            self._next = int(pos[-1]) + self.hop
+            self._compact()
+        if not positions:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, np.zeros((0, len(self.bank.freqs))), np.zeros((0, self.window), dtype=np.float32)
+        return np.concatenate(positions), np.concatenate(energies), np.concatenate(windows)
+
+
+class SymbolTimingRecovery:
+    # Symbol timing from the energy envelope: each hop's peak tone energy is
+    # folded into a histogram over the symbol period, smoothed across periods.
+    # The bin where a full window lines up with a symbol has the most energy;
+    # one symbol is emitted per period at that phase. Given a per-hop noise
+    # reference, a symbol is emitted only when its energy is `threshold`
+    # times the noise floor tracked from it, so idle noise gives no symbols.
+
+    def __init__(self, period, hop, smoothing=0.8, threshold=10.0, floor_smoothing=0.98):
+        self.period = float(period)
+        self.hop = int(hop)
+        self.bins = max(1, int(round(self.period / self.hop)))
+        self.smoothing = smoothing
+        self.threshold = threshold
+        self.floor_smoothing = floor_smoothing
+        self.hist = np.zeros(self.bins)
+        self.floor = None
+        self.last_emit = None
+
+    def reset(self):
+        self.hist[:] = 0
+        self.floor = None
+        self.last_emit = None
+
+    def phase(self):
+        return int(np.argmax(self.hist)) * self.period / self.bins
+
+    def update(self, positions, envelope, noise=None):
+        # envelope: each hop's peak tone energy; noise: optionally each hop's
+        # noise reference, such as its median tone energy
+        emit = np.zeros(len(positions), dtype=bool)
+        for i, (pos, e) in enumerate(zip(positions, envelope)):
+            b = int((pos % self.period) / self.period * self.bins) % self.bins
+            self.hist[b] = self.smoothing * self.hist[b] + (1 - self.smoothing) * e
+            if noise is not None:
+                n = noise[i]
+                self.floor = n if self.floor is None else self.floor + (1 - self.floor_smoothing) * (n - self.floor)
+                if not e > self.threshold * self.floor:
+                    continue
+            if b != int(np.argmax(self.hist)):
+                continue
+            if self.last_emit is None or pos - self.last_emit >= self.period - self.hop / 2:
+                emit[i] = True
+                self.last_emit = pos
+        return emit
@@ -0,0 +1,132 @@
+import threading
+
+import numpy as np
+
+
+class RxRingBuffer:
+    # Preallocated float32 ring between the PortAudio input callback (one
+    # producer) and the DSP workers. write() never waits: it copies the block
+    # in and then advances the write count, so the callback holds no lock a
+    # slow decoder could keep it waiting on. Each consumer reads through its
+    # own RxReader; one that falls more than a ring behind loses the oldest
+    # samples and counts them, instead of the card overflowing.
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._buf = np.zeros(self.capacity, dtype=np.float32)
+        self._written = 0            # total samples ever written; only write() moves it
+        self._data = threading.Event()
+        self._closed = False
+
+    @property
+    def written(self):
+        return self._written
+
+    def write(self, block):
+        block = np.asarray(block, dtype=np.float32)
+        if len(block) > self.capacity:
+            block = block[-self.capacity:]
+        start = self._written % self.capacity
+        first = min(len(block), self.capacity - start)
+        self._buf[start:start + first] = block[:first]
+        self._buf[:len(block) - first] = block[first:]
+        self._written += len(block)
+        self._data.set()
+
+    def reader(self):
+        # A new consumer, starting at the next sample written
+        return RxReader(self)
+
+    def close(self):
+        # Wakes and releases workers blocked in RxReader.read()
+        self._closed = True
+        self._data.set()
+
+    def clear(self):
+        self._closed = False
+        self._data.clear()
+
+
+class RxReader:
+    # One consumer's cursor into an RxRingBuffer
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.position = ring.written
+        self.overflows = 0      # times the writer lapped this reader
+        self.dropped = 0        # samples lost to that
+
+    def __len__(self):
+        return self.ring.written - self.position
+
+    def read(self, max_samples, timeout=None):
+        # Up to max_samples new samples; waits up to `timeout` s for the
+        # first one. Returns an empty array on timeout or once the ring closes.
+        ring = self.ring
+        while ring.written == self.position and not ring._closed:
+            ring._data.clear()
+            if ring.written != self.position:
+                break
+            if not ring._data.wait(timeout):
+                break
+        self._skip_lapped()
+        n = min(max_samples, ring.written - self.position)
+        start = self.position % ring.capacity
+        first = min(n, ring.capacity - start)
+        out = np.concatenate((ring._buf[start:start + first], ring._buf[:n - first]))
+        # The writer may have come round over what was just copied
+        if self._skip_lapped():
+            return self.read(max_samples, timeout)
+        self.position += n
+        return out
+
+    def _skip_lapped(self):
+        behind = self.ring.written - self.position
+        if behind <= self.ring.capacity:
+            return False
+        # Leave a block's grace so the next copy is not lapped at once
+        skip = behind - self.ring.capacity // 2
+        self.position += skip
+        self.overflows += 1
+        self.dropped += skip
+        return True
+
+
+class StreamingReceiver:
+    # Callback-mode input: PortAudio hands each block to the callback, which
+    # only copies it into the ring, so capture never waits on decoding and
+    # a long Viterbi or RS stage no longer overflows the card. DSP workers
+    # each take a reader() and pull at their own pace. overflows and
+    # underruns count the blocks PortAudio itself flagged.
+
+    def __init__(self, capacity):
+        self.ring = RxRingBuffer(capacity)
+        self.overflows = 0
+        self.underruns = 0
+        self._continue = 0
+        self._overflow_flag = 0
+        self._underflow_flag = 0
+
+    def callback(self, in_data, frame_count, time_info, status):
+        if status & self._overflow_flag:
+            self.overflows += 1
+        if status & self._underflow_flag:
+            self.underruns += 1
+        self.ring.write(np.frombuffer(in_data, dtype=np.float32))
+        return None, self._continue
+
+    def open(self, p, sample_rate, input_device_index=None, frames_per_buffer=1024):
+        import pyaudio
+        self._continue = pyaudio.paContinue
+        self._overflow_flag = pyaudio.paInputOverflow
+        self._underflow_flag = pyaudio.paInputUnderflow
+        self.ring.clear()
+        return p.open(format=pyaudio.paFloat32, channels=1, rate=sample_rate, input=True,
+                      input_device_index=input_device_index, frames_per_buffer=frames_per_buffer,
+                      stream_callback=self.callback)
+
+    def reader(self):
+        return self.ring.reader()
+
+    def close(self):
+        self.ring.close()
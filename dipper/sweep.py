@@ -0,0 +1,250 @@
+"""BER/PER against SNR for every mode over a simulated HF channel.
+
+    python -m dipper.sweep --out awgn.json
+    python -m dipper.sweep --snr=-15:5:1 --trials 200 --fading moderate --out moderate.json
+    python -m dipper.sweep --modes robust --receiver stream --offset 20 --drift 0.5
+    python -m dipper.sweep --modes robust --code k7-3/4 --snr=-12:0:1
+
+Each trial modulates a random message, passes it through dipper.channel and
+decodes it again. The "aligned" receiver cuts symbol windows at the known
+frame timing, so the figures measure modulation and FEC alone; "stream" runs
+the full ModemReceiver, acquisition included. SNR is in a 2500 Hz bandwidth.
+
+PER counts messages not received exactly. BER compares the decoded text with
+the sent text bit by bit (8 bits per character, before the packet CRC is
+checked); each missing or extra character counts as 4 bit errors, what a
+random guess would score. SER is the raw channel symbol error rate.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from .bench import git_revision
+from .channel import FADING_PRESETS, ChannelModel, transmit
+from .codec import (OFDM_MAX_BYTES, ROBUST_MAX_BYTES, decode_fec, decode_packet, decode_v4_payload, encode_ofdm_packet,
+                    encode_v4_packet, text_symbols)
+from .modem import Modem
+from .modes import MODES, ModemConfig, get_mode
+from .symbols import CONV_CODES
+from .wideband import channel_symbols
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+RX_CHUNK = 1024
+
+_modems = {}   # one Modem per worker process and sample rate
+
+
+def _modem(sample_rate):
+    if sample_rate not in _modems:
+        _modems[sample_rate] = Modem(ModemConfig(sample_rate=sample_rate))
+    return _modems[sample_rate]
+
+
+def parse_snr(spec):
+    # "-10:6:2" (start:stop:step, stop included) or "-6,-3,0"
+    if ":" in spec:
+        start, stop, step = (float(v) for v in spec.split(":"))
+        return [round(v, 3) for v in np.arange(start, stop + step / 2, step)]
+    return [float(v) for v in spec.split(",")]
+
+
+def tx_symbols(text, mode, packet_id=0):
+    mode = get_mode(mode)
+    if mode.name == "robust":
+        return encode_v4_packet(text, packet_id, mode.code)
+    if mode.name == "robust_plus":
+        return [tuple(row) for row in encode_ofdm_packet(text, packet_id, mode.code).tolist()]
+    return text_symbols(text)
+
+
+def reference_text(text, mode):
+    # What a perfect receiver shows: Normal mode does not send spaces
+    mode = get_mode(mode)
+    if mode.packetized:
+        return text
+    return decode_fec(text_symbols(text), mode)
+
+
+def bit_errors(sent, received):
+    # (errors, bits) between two strings, see the module docstring
+    received = received or ""
+    n = min(len(sent), len(received))
+    a = np.frombuffer(sent[:n].encode("latin-1", "replace"), dtype=np.uint8)
+    b = np.frombuffer(received[:n].encode("latin-1", "replace"), dtype=np.uint8)
+    errors = int(np.unpackbits(a ^ b).sum()) + 4 * abs(len(sent) - len(received))
+    return errors, 8 * len(sent)
+
+
+def _frame_offset(modem, mode):
+    # Samples from the start of a frame to its first data symbol
+    if not mode.packetized:
+        return 0
+    return len(mode.preamble) * int(modem.sample_rate * mode.preamble_duration)
+
+
+def _receive_aligned(modem, mode, samples, start, sent):
+    # (text after CRC, decoded text before CRC, received symbols)
+    count = None if mode.name == "robust_plus" else len(sent)   # Robust+ reads its length from the header
+    symbols, llrs = channel_symbols(modem, mode, samples, start + _frame_offset(modem, mode), count)
+    if symbols is None:
+        return None, None, []
+    if mode.name == "robust":
+        _, payload, _ = decode_v4_payload(symbols, llrs, mode.code)
+        return decode_packet(symbols, mode, llrs)[1], payload, symbols
+    if mode.name == "robust_plus":
+        text = decode_packet(symbols, mode, llrs)[1]
+        return text, text, symbols
+    text = decode_fec(symbols, mode)
+    return text, text, symbols
+
+
+def _receive_stream(modem, mode, samples):
+    receiver = modem.receiver(mode)
+    texts = []
+    for i in range(0, len(samples), RX_CHUNK):
+        texts.extend(e.text for e in receiver.push(samples[i:i + RX_CHUNK]) if e.kind != "preamble" and e.text)
+    text = "".join(texts) if texts else None
+    return text, text, None
+
+
+def run_trial(modem, mode, text, channel, rng, receiver="aligned"):
+    mode = get_mode(mode)
+    samples, start = transmit(modem, text, mode, channel, rng=rng)
+    expected = reference_text(text, mode)
+    if receiver == "stream":
+        received, payload, symbols = _receive_stream(modem, mode, samples)
+    else:
+        received, payload, symbols = _receive_aligned(modem, mode, samples, start, tx_symbols(text, mode))
+    errors, bits = bit_errors(expected, payload)
+    result = {"ok": received == expected, "bit_errors": errors, "bits": bits}
+    if symbols is not None:
+        sent = tx_symbols(text, mode)
+        result["symbol_errors"] = sum(a != b for a, b in zip(sent, symbols)) + len(sent) - len(symbols)
+        result["symbols"] = len(sent)
+    return result
+
+
+def run_point(mode, snr_db, trials, chars, channel, seed=0, receiver="aligned", sample_rate=44100, code=None):
+    # Counts for `trials` messages of `chars` characters at one SNR; code
+    # overrides the mode's convolutional code
+    modem = _modem(sample_rate)
+    mode = get_mode(mode)
+    if code and mode.code:
+        mode = replace(mode, code=code)
+    channel = ChannelModel(**{**asdict(channel), "snr_db": snr_db})
+    rng = np.random.default_rng(seed)
+    totals = {"trials": 0, "packet_errors": 0, "bit_errors": 0, "bits": 0, "symbol_errors": 0, "symbols": 0}
+    for _ in range(trials):
+        text = "".join(rng.choice(list(ALPHABET), chars))
+        result = run_trial(modem, mode, text, channel, rng, receiver)
+        totals["trials"] += 1
+        totals["packet_errors"] += not result["ok"]
+        for key in ("bit_errors", "bits", "symbol_errors", "symbols"):
+            totals[key] += result.get(key, 0)
+    return totals
+
+
+def _rates(mode, snr_db, totals):
+    return {"mode": mode, "snr_db": snr_db, **totals,
+            "per": totals["packet_errors"] / totals["trials"],
+            "ber": totals["bit_errors"] / totals["bits"] if totals["bits"] else None,
+            "ser": totals["symbol_errors"] / totals["symbols"] if totals["symbols"] else None}
+
+
+def sweep(modes, snrs, trials, chars, channel, workers=None, seed=0, receiver="aligned", sample_rate=44100,
+          code=None, progress=None):
+    # Every (mode, SNR) point split into chunks over a process pool
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, -(-trials // workers))
+    jobs = []
+    for m, mode in enumerate(modes):
+        for s, snr in enumerate(snrs):
+            for c, first in enumerate(range(0, trials, chunk)):
+                jobs.append((mode, snr, min(chunk, trials - first), seed + 1000003 * m + 10007 * s + c))
+    points = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(mode, snr, pool.submit(run_point, mode, snr, count, chars, channel, job_seed,
+                                           receiver, sample_rate, code))
+                   for mode, snr, count, job_seed in jobs]
+        for mode, snr, future in futures:
+            totals = future.result()
+            point = points.setdefault((mode, snr), dict.fromkeys(totals, 0))
+            for key, value in totals.items():
+                point[key] += value
+            if progress and point["trials"] == trials:
+                progress(_rates(mode, snr, point))
+    return [_rates(mode, snr, points[(mode, snr)]) for mode in modes for snr in snrs]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BER/PER against SNR over a simulated HF channel")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--snr", default="-15:10:1", help="start:stop:step in dB (stop included) or a comma list")
+    parser.add_argument("--trials", type=int, default=50, help="messages per mode and SNR")
+    parser.add_argument("--chars", type=int, default=8, help="characters per message")
+    parser.add_argument("--receiver", choices=("aligned", "stream"), default="aligned")
+    parser.add_argument("--code", choices=list(CONV_CODES), help="convolutional code for modes that use one")
+    parser.add_argument("--fading", choices=list(FADING_PRESETS), default="none")
+    parser.add_argument("--delay", type=float, help="path delay in ms, overrides the fading preset")
+    parser.add_argument("--spread", type=float, help="Doppler spread in Hz, overrides the fading preset")
+    parser.add_argument("--qsb-depth", type=float, default=0.0, help="slow fading depth in dB")
+    parser.add_argument("--qsb-period", type=float, default=10.0, help="slow fading period in seconds")
+    parser.add_argument("--offset", type=float, default=0.0, help="frequency offset in Hz")
+    parser.add_argument("--drift", type=float, default=0.0, help="frequency drift in Hz/s")
+    parser.add_argument("--impulse-rate", type=float, default=0.0, help="noise clicks per second")
+    parser.add_argument("--impulse-amplitude", type=float, default=10.0, help="click peak over signal RMS")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+    limits = {"robust": ROBUST_MAX_BYTES, "robust_plus": OFDM_MAX_BYTES}
+    for mode in args.modes:
+        if args.chars > limits.get(mode, args.chars):
+            parser.error(f"--chars {args.chars} is more than a {mode} packet carries ({limits[mode]} bytes)")
+
+    channel = ChannelModel(fading=args.fading, delay=None if args.delay is None else args.delay / 1000.0,
+                           spread=args.spread, qsb_depth_db=args.qsb_depth, qsb_period=args.qsb_period,
+                           offset_hz=args.offset, drift_hz_per_s=args.drift, impulse_rate=args.impulse_rate,
+                           impulse_amplitude=args.impulse_amplitude)
+
+    def progress(point):
+        ber = "-" if point["ber"] is None else f"{point['ber']:.4f}"
+        ser = "-" if point["ser"] is None else f"{point['ser']:.4f}"
+        print(f"{point['mode']:12s} {point['snr_db']:6.1f} dB  PER {point['per']:.3f}  BER {ber}  SER {ser}",
+              file=sys.stderr)
+
+    points = sweep(args.modes, parse_snr(args.snr), args.trials, args.chars, channel, args.workers, args.seed,
+                   args.receiver, args.sample_rate, args.code, progress)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "receiver": args.receiver,
+            "code": args.code,
+            "trials": args.trials,
+            "chars": args.chars,
+            "seed": args.seed,
+            "sample_rate": args.sample_rate,
+            "noise_bandwidth_hz": channel.bandwidth,
+            "channel": {k: v for k, v in asdict(channel).items() if k != "snr_db"},
+        },
+        "points": points,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import crcmod
+
+from .fec import ConvolutionalCode, Trellis
+
+# Adjusted to fit 300-2700 Hz (2400 Hz bandwidth)
+CHAR_SOUNDS = {
+    "A": [(300, 300, "tone")], "B": [(600, 600, "trill")], "C": [(900, 300, "slide")],
+    "D": [(1200, 1200, "tone")], "E": [(1500, 1500, "tone")], "F": [(1800, 2100, "slide")],
+    "G": [(300, 300, "trill")], "H": [(2100, 2100, "tone")], "I": [(2400, 2400, "tone")],
+    "J": [(600, 900, "slide")], "K": [(900, 900, "tone")], "L": [(1200, 1200, "trill")],
+    "M": [(1500, 1800, "slide")], "N": [(1800, 1200, "slide")], "O": [(2100, 2100, "tone")],
+    "P": [(2400, 2400, "trill")], "Q": [(2700, 2700, "tone")], "R": [(300, 300, "trill")],
+    "S": [(600, 900, "slide")], "T": [(900, 1200, "slide")], "U": [(1200, 1200, "tone")],
+    "V": [(1500, 1500, "trill")], "W": [(1800, 2100, "slide")], "X": [(2100, 2100, "trill")],
+    "Y": [(2400, 1800, "slide")], "Z": [(2700, 2700, "trill")],
+    "0": [(300, 600, "slide")], "1": [(600, 900, "slide")], "2": [(900, 1200, "slide")],
+    "3": [(1200, 1500, "slide")], "4": [(1500, 1800, "slide")], "5": [(1800, 2100, "slide")],
+    "6": [(2100, 2400, "slide")], "7": [(2400, 2700, "slide")], "8": [(2700, 2400, "slide")],
+    "9": [(300, 600, "slide")], "!": [(600, 900, "slide")], "/": [(900, 1200, "slide")],
+    "-": [(1200, 1200, "trill")], ".": [(1500, 1500, "tone")], " ": [(300, 300, "tone")],
+    "@": [(1800, 2100, "slide")]
+}
+
+WORD_SOUNDS = {
+    "CQ": [(300, 600, "slide")], "DE": [(900, 1200, "slide")],
+}
+
+SYMBOL_MAP = {**{char: i for i, char in enumerate(CHAR_SOUNDS.keys())},
+              **{word: i + len(CHAR_SOUNDS) for i, word in enumerate(WORD_SOUNDS.keys())}}
+REVERSE_MAP = {i: char_or_word for char_or_word, i in SYMBOL_MAP.items()}
+
+V4_SYMBOLS = {
+    0: "A", 1: "B", 2: "C", 3: "D", 4: "E", 5: "F", 6: "G", 7: "H",
+    8: "I", 9: "K", 10: "L", 11: "M", 12: "N", 13: "O", 14: "P", 15: "Q"
+}
+V4_REVERSE_MAP = {v: k for k, v in V4_SYMBOLS.items()}
+
+CONV_TABLE = {
+    (0, 0): [0, 0], (0, 1): [1, 1], (1, 0): [1, 0], (1, 1): [0, 1]
+}
+CONV_TRELLIS = Trellis.from_table(CONV_TABLE)
+
+# Codes a packet mode can select by name. "v4" is CONV_TABLE as generators,
+# unterminated, i.e. exactly what V4 stations send.
+CONV_CODES = {
+    "v4": ConvolutionalCode((0o3, 0o2), 2, terminate=False),
+    "k7": ConvolutionalCode((0o171, 0o133), 7),
+    "k7-2/3": ConvolutionalCode((0o171, 0o133), 7, puncture=[[1, 1], [1, 0]]),
+    "k7-3/4": ConvolutionalCode((0o171, 0o133), 7, puncture=[[1, 1, 0], [1, 0, 1]]),
+}
+
+crc16 = crcmod.mkCrcFun(0x11021, initCrc=0, xorOut=0xFFFF)
+
+# Every tone the receiver has to tell apart: symbol start and end frequencies
+DETECTOR_FREQS = sorted({f for pattern in list(CHAR_SOUNDS.values()) + list(WORD_SOUNDS.values())
+                         for start_freq, end_freq, _ in pattern for f in (start_freq, end_freq)})
+PREAMBLE_FREQS = [(300, 600), (900, 1200), (1500, 1800), (2100, 2400),
+                  (600, 900), (1200, 1500), (1800, 2100)]
@@ -0,0 +1,279 @@
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+from scipy.signal import butter, hilbert, sosfilt
+
+from .modes import NOISE_BANDWIDTH, get_mode
+
+
+def shift_frequency(samples, shift, sample_rate=44100):
+    # Move every component of a real signal by `shift` Hz (single-sideband mix)
+    samples = np.asarray(samples, dtype=np.float64)
+    if not shift or not len(samples):
+        return samples
+    n = np.arange(len(samples))
+    return np.real(hilbert(samples) * np.exp(2j * np.pi * shift * n / sample_rate))
+
+
+def preamble_chirp_rate(waveforms, mode):
+    # Slides trade time for frequency: a window late by dt still matches at
+    # offset +rate*dt. The rendered slide sweeps twice its nominal span.
+    rates = [2.0 * (end - start) / mode.preamble_duration
+             for s in mode.preamble for start, end, _ in waveforms.sounds[s][:1]]
+    return float(np.mean(rates)) if rates else 0.0
+
+
+@dataclass
+class PreambleMatch:
+    # One preamble found by PreambleCorrelator. start and end are absolute
+    # sample indices of its first sample and of the first sample after it;
+    # offset is the station's frequency offset in Hz, snr_db its SNR in a
+    # 2500 Hz bandwidth and score the normalised non-coherent correlation
+    # (1.0 for a clean preamble).
+    mode: str
+    start: int
+    end: int
+    offset: float
+    snr_db: float
+    score: float
+
+
+class PreambleCorrelator:
+    # Matched filter for the packet preambles (1357924 for Robust, 2468135
+    # for Robust+) on a sample stream. The input is mixed down around
+    # `center`, low-passed and decimated, then correlated against every
+    # preamble symbol of every mode with one FFT per block; frequency offsets
+    # are bin shifts of that spectrum, so the whole offset grid costs inverse
+    # FFTs only. Symbols are combined non-coherently for detection. The best
+    # candidate is then refined coherently over the whole preamble on a fine
+    # offset grid, and the phase of each symbol's correlation against its
+    # mean frequency and time gives the fractional delay and residual
+    # offset, which also pins the slides to one point on their time/frequency
+    # ridge. Data symbols reuse the preamble slides and can score up to ~0.3,
+    # so candidates must also reach min_snr dB coherently. By default the
+    # strongest candidate at any offset wins. With guard_hz set, candidates
+    # more than guard_hz apart, and off each other's chirp ridge, are
+    # separate stations and each one is reported; every symbol of a
+    # candidate must then reach half the threshold, since a preamble shifted
+    # by a few symbols and tones matches some symbols of itself, or of
+    # another station's.
+
+    def __init__(self, waveforms, modes=("robust", "robust_plus"), sample_rate=44100, max_offset=100.0,
+                 offset_step=10.0, threshold=0.25, min_snr=-5.0, center=1600.0, fft_size=4096, guard_hz=None):
+        self.modes = [get_mode(m) for m in modes]
+        for mode in self.modes:
+            if not mode.packetized:
+                raise ValueError(f"Mode '{mode.name}' has no preamble")
+        self.sample_rate = sample_rate
+        self.center = center
+        self.threshold = threshold
+        self.min_snr = min_snr
+        self.offset_step = offset_step
+        self.guard_hz = guard_hz
+        segment = int(sample_rate * self.modes[0].preamble_duration)
+        # Largest factor that divides a preamble symbol and keeps the complex rate above 4.5 kHz
+        self.decimation = max(d for d in range(1, 9) if segment % d == 0 and sample_rate / d >= 4500)
+        self.rate = sample_rate / self.decimation
+        self.segment = segment // self.decimation
+        self.half_band = 1400.0 + max_offset
+        self.sos = butter(8, self.half_band / (0.5 * sample_rate), output="sos")
+        self.fft_size = fft_size
+        self.templates = {}   # mode name -> (unit-norm decimated preamble, mean frequency per symbol)
+        self._spectra = {}
+        # Hz per decimated sample along each mode's time/frequency ridge
+        self._ridge = {mode.name: preamble_chirp_rate(waveforms, mode) / self.rate for mode in self.modes}
+        for mode in self.modes:
+            self._add_template(waveforms, mode)
+        self.length = max(len(t) for t, _ in self.templates.values())
+        if self.length >= fft_size:
+            raise ValueError("fft_size must be longer than the preamble")
+        bin_hz = self.rate / fft_size
+        self.shifts = np.unique(np.round(np.arange(-max_offset, max_offset + offset_step / 2, offset_step) / bin_hz))
+        self.shifts = self.shifts.astype(np.int64)
+        self.offsets = self.shifts * bin_hz
+        self._shift_index = (np.arange(fft_size)[None, :] + self.shifts[:, None]) % fft_size
+        self.search = 16                             # coherent search, decimated samples either side
+        # The slides of a preamble continue one another, so a window half
+        # over it already matches a few symbols; a candidate waits one whole
+        # preamble for a better one before it is final
+        self.hold = self.length
+        self.reset()
+
+    def _baseband(self, samples, first, zi):
+        # Real samples whose first one has absolute index `first` -> filtered complex baseband
+        n = first + np.arange(len(samples))
+        mixed = np.asarray(samples, dtype=np.float64) * np.exp(-2j * np.pi * self.center * n / self.sample_rate)
+        return sosfilt(self.sos, mixed, zi=zi)
+
+    def _add_template(self, waveforms, mode):
+        frame = waveforms.render_frame([(list(mode.preamble), mode.preamble_duration, 0)])
+        zi = np.zeros((self.sos.shape[0], 2), dtype=complex)
+        template = self._baseband(frame, 0, zi)[0][::self.decimation]
+        template /= np.linalg.norm(template)
+        count = len(mode.preamble)
+        pieces = np.zeros((count, len(template)), dtype=complex)
+        for k in range(count):
+            part = slice(k * self.segment, (k + 1) * self.segment)
+            pieces[k, part] = template[part] / np.linalg.norm(template[part])
+        spectra = np.fft.fft(pieces, self.fft_size)
+        power = np.abs(spectra) ** 2
+        freqs = np.fft.fftfreq(self.fft_size, 1.0 / self.rate)
+        self.templates[mode.name] = (template, power @ freqs / power.sum(axis=1))
+        self._spectra[mode.name] = np.conj(spectra).astype(np.complex64)
+
+    def reset(self):
+        self._zi = np.zeros((self.sos.shape[0], 2), dtype=complex)
+        self._count = 0                              # input samples seen
+        self._y = np.zeros(0, dtype=np.complex64)    # decimated baseband
+        self._y_start = 0                            # decimated index of _y[0]
+        self._next = 0                               # next lag to scan
+        self._candidates = []                        # [score, lag, shift, mode name], one per station
+        self._quiet = []                             # (lag, offset, mode name) of recent matches
+
+    def push(self, samples):
+        # Returns a PreambleMatch for every preamble these samples confirmed.
+        # A match is final one preamble length after its end.
+        samples = np.asarray(samples, dtype=np.float64)
+        filtered, self._zi = self._baseband(samples, self._count, self._zi)
+        first = -self._count % self.decimation
+        self._y = np.concatenate((self._y, filtered[first::self.decimation].astype(np.complex64)))
+        self._count += len(samples)
+        matches = []
+        max_lags = self.fft_size - self.length + 1
+        while True:
+            available = self._y_start + len(self._y) - self.length + 1 - self._next
+            if available < min(self.segment, max_lags):
+                break
+            count = min(available, max_lags)
+            matches.extend(self._scan(self._next, count))
+            self._next += count
+        keep = min([self._next] + [cand[1] for cand in self._candidates])
+        drop = keep - self.search - 1 - self._y_start
+        if drop > 0:
+            self._y = self._y[drop:]
+            self._y_start += drop
+        return matches
+
+    def flush(self):
+        # Finish a pending candidate as if silence followed, then start over
+        matches = self.push(np.zeros((self.length + 2 * self.hold) * self.decimation))
+        self.reset()
+        return matches
+
+    def find(self, samples):
+        # Every preamble in a finished recording; starts count from samples[0]
+        self.reset()
+        return self.push(samples) + self.flush()
+
+    def _scan(self, lag0, count):
+        # Non-coherent score of `count` lags from lag0 for every mode and offset
+        lo = lag0 - self._y_start
+        block = self._y[lo:lo + count + self.length - 1]
+        spectrum = np.fft.fft(block, self.fft_size)[self._shift_index]        # (offsets, fft_size)
+        # Each symbol is scored against the energy under it, so every one of
+        # them has to match: a clean preamble scores 1.0
+        power = np.concatenate(([0.0], np.cumsum(np.abs(block.astype(np.complex128)) ** 2)))
+        edges = np.arange(count)[None, :] + self.segment * np.arange(len(self.modes[0].preamble) + 1)[:, None]
+        # floor at -30 dB on the block's mean symbol energy: silence is not a match
+        floor = 1e-3 * power[-1] * self.segment / max(len(block), 1) + 1e-12
+        energy = np.diff(power[edges], axis=0) + floor                         # (symbols, count)
+        scores = []
+        for mode in self.modes:
+            corr = np.fft.ifft(spectrum[:, None, :] * self._spectra[mode.name][None], axis=-1)[..., :count]
+            per_symbol = np.abs(corr) ** 2 / energy                             # (offsets, symbols, count)
+            score = np.mean(per_symbol, axis=1)                                 # (offsets, count)
+            if self.guard_hz is not None:
+                score[np.min(per_symbol, axis=1) < self.threshold / 2] = 0.0
+            scores.append(score)
+        scores = np.array(scores)
+        best_mode = np.argmax(scores, axis=0)
+        best = np.max(scores, axis=0)
+        # Peaks over offset at each lag: the best one, or with guard_hz every
+        # one that is the best within guard_hz of itself. A ridge running out
+        # of the offset range piles up on its last offset, off the ridge, so
+        # the outermost offsets are not peaks then.
+        if self.guard_hz is None:
+            peaks = np.zeros(best.shape, dtype=bool)
+            peaks[np.argmax(best, axis=0), np.arange(count)] = True
+        else:
+            width = 2 * int(self.guard_hz / self.offset_step) + 1
+            peaks = best >= maximum_filter1d(best, width, axis=0, mode="constant")
+            peaks[[0, -1]] = False
+        matches = []
+        for i, shift in zip(*np.nonzero((peaks & (best > self.threshold)).T)):
+            lag = lag0 + int(i)
+            matches.extend(self._finish(lag))
+            self._offer(float(best[shift, i]), lag, int(shift), self.modes[best_mode[shift, i]].name)
+        matches.extend(self._finish(lag0 + count - 1))
+        return matches
+
+    def _same(self, lag, offset, other_lag, other_offset, mode):
+        # Same station: within guard_hz of the other, or within a symbol of
+        # it on its ridge, where a late window matches a higher offset
+        if self.guard_hz is None or abs(offset - other_offset) <= self.guard_hz:
+            return True
+        dt = lag - other_lag
+        return abs(dt) <= self.segment and abs(offset - other_offset - self._ridge[mode] * dt) <= self.offset_step
+
+    def _offer(self, score, lag, shift, mode):
+        offset = self.offsets[shift]
+        self._quiet = [q for q in self._quiet if lag < q[0] + self.length]
+        for quiet_lag, quiet_offset, quiet_mode in self._quiet:
+            if self._same(lag, offset, quiet_lag, quiet_offset, quiet_mode):
+                return
+        for cand in self._candidates:
+            if self._same(lag, offset, cand[1], self.offsets[cand[2]], cand[3]):
+                if score > cand[0]:
+                    cand[:] = [score, lag, shift, mode]
+                return
+        self._candidates.append([score, lag, shift, mode])
+
+    def _finish(self, lag):
+        # Refine the candidates `lag` is more than a hold past, oldest first
+        done = sorted((c for c in self._candidates if lag > c[1] + self.hold), key=lambda c: c[1])
+        if done:
+            self._candidates = [c for c in self._candidates if lag <= c[1] + self.hold]
+        matches = []
+        for score, cand_lag, shift, mode in done:
+            match = self._refine(score, cand_lag, shift, mode)
+            if match.snr_db >= self.min_snr:
+                self._quiet.append((cand_lag, self.offsets[shift], mode))
+                matches.append(match)
+        return matches
+
+    def _refine(self, score, lag, shift, mode):
+        template, freqs = self.templates[mode]
+        count = len(freqs)
+        length = len(template)
+        lo = lag - self.search - self._y_start
+        chunk = self._y[max(lo, 0):lo + length + 2 * self.search].astype(np.complex128)
+        coarse = self.shifts[shift] * self.rate / self.fft_size
+        fine = coarse + np.arange(-self.offset_step, self.offset_step + 0.25, 0.5)
+        n = np.arange(len(chunk))
+        mixed = chunk[None, :] * np.exp(-2j * np.pi * fine[:, None] * n / self.rate)
+        windows = np.lib.stride_tricks.sliding_window_view(mixed, length, axis=1)
+        parts = np.einsum("flks,ks->flk", windows.reshape(len(fine), -1, count, self.segment),
+                          np.conj(template.reshape(count, -1)))                 # (fine, lags, symbols)
+        # Fractions of a decimated sample as a phase on each symbol: slides
+        # that continue one another stay coherent at points a few samples
+        # apart along their ridge, and whole lags alone pick the wrong one
+        fractions = np.arange(-0.5, 0.5, 0.125) / self.rate
+        steer = np.exp(2j * np.pi * fractions[:, None] * freqs[None, :])      # (fractions, symbols)
+        total = np.abs(np.einsum("flk,dk->fld", parts, steer)) ** 2
+        f, t, d = np.unravel_index(np.argmax(total), total.shape)
+        # Phase of each symbol against its mean frequency (delay) and time (offset)
+        r = parts[f, t] * steer[d]
+        phase = np.angle(r * np.conj(r.sum()))
+        times = (np.arange(count) + 0.5) * self.segment / self.rate
+        design = np.stack((np.ones(count), freqs, times), axis=1) * np.abs(r)[:, None]
+        (_, slope, drift), *_ = np.linalg.lstsq(design, phase * np.abs(r), rcond=None)
+        delay = fractions[d] - slope / (2 * np.pi)
+        offset = fine[f] + drift / (2 * np.pi)
+        first = lag - self.search + max(lo, 0) - lo + t
+        start = int(round(first * self.decimation + delay * self.sample_rate))
+        # Co-phased symbols, so a fractional delay does not read as noise
+        rho = min(np.sum(np.abs(r)) ** 2 / (np.sum(np.abs(windows[f, t]) ** 2) + 1e-12), 0.9999)
+        snr = rho / (1 - rho) * 2 * self.half_band / NOISE_BANDWIDTH
+        return PreambleMatch(mode, start, start + length * self.decimation, float(offset),
+                             float(10 * np.log10(snr)), score)
@@ -0,0 +1,35 @@
+import threading
+
+import numpy as np
+
+
+class ToneDetectorBank:
+    # Sparse DFT over a fixed set of tone frequencies. The cos/sin rows for a
+    # given block length are built once, after which one matrix-vector product
+    # per chunk (or one matrix product for a stack of segments) gives the energy
+    # of every tone, instead of a full-length FFT and a fresh frequency axis.
+
+    def __init__(self, freqs, sample_rate=44100):
+        self.freqs = np.array(sorted(set(freqs)), dtype=np.float64)
+        self.sample_rate = sample_rate
+        self._matrices = {}
+        self._lock = threading.Lock()
+
+    def matrix(self, length):
+        m = self._matrices.get(length)
+        if m is None:
+            with self._lock:
+                m = self._matrices.get(length)
+                if m is None:
+                    n = np.arange(length)
+                    phase = 2 * np.pi * self.freqs[:, None] * n[None, :] / self.sample_rate
+                    m = np.ascontiguousarray(np.vstack((np.cos(phase), np.sin(phase))), dtype=np.float32)
+                    self._matrices[length] = m
+        return m
+
+    def energies(self, data):
+        # data: (length,) or (segments, length) -> (n_freqs,) or (segments, n_freqs)
+        data = np.asarray(data, dtype=np.float32)
+        proj = data @ self.matrix(data.shape[-1]).T
+        nf = len(self.freqs)
+        return proj[..., :nf] ** 2 + proj[..., nf:] ** 2
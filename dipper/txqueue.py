@@ -0,0 +1,141 @@
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+
+# Priorities, most urgent first
+TX_ACK = 0
+TX_RETRANSMIT = 1
+TX_NEW = 2
+PRIORITY_NAMES = {TX_ACK: "ack", TX_RETRANSMIT: "retransmit", TX_NEW: "new"}
+
+
+@dataclass
+class TxQueueStats:
+    # Per priority name: items waiting, items handed out, and their wait in
+    # seconds from when each became due until get() returned it
+    depth: dict
+    sent: dict
+    mean_wait: dict
+    max_wait: dict
+
+
+class _Entry:
+    __slots__ = ("item", "priority", "due", "key", "live")
+
+    def __init__(self, item, priority, due, key):
+        self.item = item
+        self.priority = priority
+        self.due = due
+        self.key = key
+        self.live = True
+
+
+class TxScheduler:
+    # Thread-safe transmit queue for one radio. Producers put() from any
+    # thread; the transmit thread blocks in get(), which wakes as soon as an
+    # item is due and returns the most urgent one, oldest first within a
+    # priority. An item may be held back `delay` s, and one put with a `key`
+    # replaces the waiting item with that key, so a pending ACK or ARQ check
+    # is scheduled once however often it is asked for.
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._ready = []         # heap of (priority, order, entry)
+        self._delayed = []       # heap of (due, order, entry)
+        self._keys = {}          # key -> waiting entry
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._depth = dict.fromkeys(PRIORITY_NAMES, 0)
+        self._sent = dict.fromkeys(PRIORITY_NAMES, 0)
+        self._wait_total = dict.fromkeys(PRIORITY_NAMES, 0.0)
+        self._wait_max = dict.fromkeys(PRIORITY_NAMES, 0.0)
+
+    def __len__(self):
+        with self._cond:
+            return sum(self._depth.values())
+
+    def put(self, item, priority=TX_NEW, delay=0.0, key=None):
+        if priority not in PRIORITY_NAMES:
+            raise ValueError(f"Unknown TX priority {priority}.")
+        with self._cond:
+            if key is not None and key in self._keys:
+                self._drop(self._keys.pop(key))
+            entry = _Entry(item, priority, self.clock() + max(delay, 0.0), key)
+            if key is not None:
+                self._keys[key] = entry
+            self._depth[priority] += 1
+            if delay > 0:
+                heapq.heappush(self._delayed, (entry.due, next(self._order), entry))
+            else:
+                heapq.heappush(self._ready, (priority, next(self._order), entry))
+            self._cond.notify()
+
+    def cancel(self, key):
+        # Withdraw the waiting item put with `key`; True if there was one
+        with self._cond:
+            entry = self._keys.pop(key, None)
+            if entry is not None:
+                self._drop(entry)
+            return entry is not None
+
+    def _drop(self, entry):
+        entry.live = False
+        self._depth[entry.priority] -= 1
+
+    def get(self, timeout=None):
+        # The next due item, or None on timeout or once closed
+        deadline = None if timeout is None else self.clock() + timeout
+        with self._cond:
+            while not self._closed:
+                now = self.clock()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, order, entry = heapq.heappop(self._delayed)
+                    if entry.live:
+                        heapq.heappush(self._ready, (entry.priority, order, entry))
+                while self._ready:
+                    _, _, entry = heapq.heappop(self._ready)
+                    if entry.live:
+                        return self._take(entry, now)
+                while self._delayed and not self._delayed[0][2].live:
+                    heapq.heappop(self._delayed)
+                wake = self._delayed[0][0] if self._delayed else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wake = deadline if wake is None else min(wake, deadline)
+                self._cond.wait(None if wake is None else wake - now)
+            return None
+
+    def _take(self, entry, now):
+        self._drop(entry)
+        if entry.key is not None and self._keys.get(entry.key) is entry:
+            del self._keys[entry.key]
+        wait = now - entry.due
+        self._sent[entry.priority] += 1
+        self._wait_total[entry.priority] += wait
+        self._wait_max[entry.priority] = max(self._wait_max[entry.priority], wait)
+        return entry.item
+
+    def stats(self):
+        with self._cond:
+            names = PRIORITY_NAMES.items()
+            return TxQueueStats({n: self._depth[p] for p, n in names}, {n: self._sent[p] for p, n in names},
+                                {n: self._wait_total[p] / self._sent[p] if self._sent[p] else 0.0 for p, n in names},
+                                {n: self._wait_max[p] for p, n in names})
+
+    def clear(self):
+        with self._cond:
+            self._ready.clear()
+            self._delayed.clear()
+            self._keys.clear()
+            self._depth = dict.fromkeys(PRIORITY_NAMES, 0)
+            self._closed = False
+
+    def close(self):
+        # Wakes and releases the thread blocked in get()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,118 @@
+import threading
+
+import numpy as np
+
+
+class TxRingBuffer:
+    # Bounded float32 ring between the frame generator (producer) and the
+    # PortAudio output callback (consumer). write() blocks while the ring is full,
+    # read_into() never blocks and pads with silence.
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._buf = np.zeros(self.capacity, dtype=np.float32)
+        self._read = 0
+        self._count = 0
+        self._active = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self.underruns = 0
+
+    def __len__(self):
+        return self._count
+
+    def finish(self):
+        with self._cond:
+            self._active = False
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._read = 0
+            self._count = 0
+            self._active = False
+            self._closed = False
+            self._cond.notify_all()
+
+    def close(self):
+        # Wakes and releases a producer blocked in write() or wait_drained()
+        with self._cond:
+            self._closed = True
+            self._active = False
+            self._cond.notify_all()
+
+    def write(self, block, timeout=None):
+        block = np.asarray(block, dtype=np.float32)
+        pos = 0
+        while pos < len(block):
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._count < self.capacity or self._closed, timeout):
+                    return pos
+                if self._closed:
+                    return pos
+                n = min(len(block) - pos, self.capacity - self._count)
+                start = (self._read + self._count) % self.capacity
+                first = min(n, self.capacity - start)
+                self._buf[start:start + first] = block[pos:pos + first]
+                self._buf[:n - first] = block[pos + first:pos + n]
+                self._count += n
+                self._active = True
+                pos += n
+        return pos
+
+    def read_into(self, out):
+        with self._cond:
+            n = min(len(out), self._count)
+            first = min(n, self.capacity - self._read)
+            out[:first] = self._buf[self._read:self._read + first]
+            out[first:n] = self._buf[:n - first]
+            out[n:] = 0
+            self._read = (self._read + n) % self.capacity
+            self._count -= n
+            if n < len(out) and self._active:
+                self.underruns += 1
+            self._cond.notify_all()
+        return n
+
+    def wait_drained(self, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: self._count == 0 or self._closed, timeout)
+
+
+class StreamingTransmitter:
+    # Callback-mode output: playback starts as soon as the first symbol block is in
+    # the ring, so keying latency no longer depends on message length and memory
+    # stays at the ring capacity however long the frame is.
+
+    def __init__(self, capacity):
+        self.ring = TxRingBuffer(capacity)
+        self._scratch = np.zeros(0, dtype=np.float32)
+        self._lock = threading.Lock()
+        self._continue = 0
+
+    def callback(self, in_data, frame_count, time_info, status):
+        if len(self._scratch) != frame_count:
+            self._scratch = np.zeros(frame_count, dtype=np.float32)
+        self.ring.read_into(self._scratch)
+        return self._scratch.tobytes(), self._continue
+
+    def open(self, p, sample_rate, output_device_index=None, frames_per_buffer=1024):
+        import pyaudio
+        self._continue = pyaudio.paContinue
+        self.ring.clear()
+        return p.open(format=pyaudio.paFloat32, channels=1, rate=sample_rate, output=True,
+                      output_device_index=output_device_index, frames_per_buffer=frames_per_buffer,
+                      stream_callback=self.callback)
+
+    def play(self, blocks):
+        # Only one frame on air at a time; returns once the ring has drained.
+        with self._lock:
+            try:
+                for block in blocks:
+                    self.ring.write(block)
+            finally:
+                self.ring.finish()
+            self.ring.wait_drained()
+
+    def close(self):
+        self.ring.close()
@@ -0,0 +1,85 @@
+import queue
+
+
+class UiBridge:
+    # The one way worker threads touch the GUI. post() and post_text() may
+    # be called from any thread and only queue; the Tk thread drains the
+    # queue every `interval` s (start() schedules that with root.after),
+    # making the calls in order and joining consecutive text for the same
+    # widget and tag into one insert. A burst of decodes then costs one
+    # repaint per frame, and decoding never waits on Tk.
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self._queue = queue.SimpleQueue()
+        self._after = None
+        self.posted = 0
+        self.batches = 0
+        self.max_batch = 0
+
+    def post(self, fn, *args, **kwargs):
+        # Call fn(*args, **kwargs) on the Tk thread
+        self._queue.put((fn, args, kwargs))
+        self.posted += 1
+
+    def post_text(self, widget, text, tag=""):
+        # Append text to a Text widget and scroll it to the end
+        self._queue.put((None, (widget, text, tag), None))
+        self.posted += 1
+
+    def start(self, after):
+        # Begin draining on the Tk thread; `after` is root.after
+        self._after = after
+        self._tick()
+
+    def stop(self):
+        self._after = None
+
+    def _tick(self):
+        try:
+            self.drain()
+        finally:
+            if self._after is not None:
+                self._after(int(self.interval * 1000), self._tick)
+
+    def drain(self):
+        # Apply what was queued when called (Tk thread only); returns how many
+        n = self._queue.qsize()
+        text = None          # [widget, tag, pieces] being joined
+        scrolled = []
+        for _ in range(n):
+            fn, args, kwargs = self._queue.get_nowait()
+            if fn is None:
+                widget, piece, tag = args
+                if text is not None and text[0] is widget and text[1] == tag:
+                    text[2].append(piece)
+                    continue
+                self._insert(text, scrolled)
+                text = [widget, tag, [piece]]
+                continue
+            self._insert(text, scrolled)
+            text = None
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"GUI update error: {e}")
+        self._insert(text, scrolled)
+        for widget in scrolled:
+            widget.see("end")
+        if n:
+            self.batches += 1
+            self.max_batch = max(self.max_batch, n)
+        return n
+
+    @staticmethod
+    def _insert(text, scrolled):
+        if text is None:
+            return
+        widget, tag, pieces = text
+        try:
+            widget.insert("end", "".join(pieces), tag)
+        except Exception as e:
+            print(f"GUI update error: {e}")
+            return
+        if widget not in scrolled:
+            scrolled.append(widget)
@@ -0,0 +1,154 @@
+import threading
+from itertools import groupby
+
+import numpy as np
+
+
+def render_pattern(pattern, duration, sample_rate):
+    # Same synthesis as DipperModeApp.generate_sound, one segment per (start, end, type)
+    n = int(sample_rate * duration)
+    if not pattern:
+        return np.zeros(n, dtype=np.float32)
+    t = np.linspace(0, duration, n, False)
+    segments = []
+    for start_freq, end_freq, sound_type in pattern:
+        if sound_type == "tone":
+            signal = np.sin(2 * np.pi * start_freq * t)
+        elif sound_type == "slide":
+            freqs = np.linspace(start_freq, end_freq, n)
+            signal = np.sin(2 * np.pi * freqs * t)
+        elif sound_type == "trill":
+            signal = np.sin(2 * np.pi * start_freq * t) * np.sin(2 * np.pi * 20 * t)
+        else:
+            raise ValueError(f"Unknown sound type '{sound_type}'")
+        segments.append(signal)
+    audio = np.concatenate(segments)
+    return audio / np.max(np.abs(audio))
+
+
+class WaveformBank:
+    # Every pattern is rendered once per (duration, sample rate) into one contiguous
+    # float32 array; frames are then assembled by index gather into a single buffer.
+    # The key None is always present and renders as silence.
+
+    def __init__(self, sounds, sample_rate=44100):
+        self.sounds = {None: [], **sounds}
+        self.sample_rate = sample_rate
+        self.keys = list(self.sounds)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def table(self, duration):
+        key = (duration, self.sample_rate)
+        table = self._tables.get(key)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(key)
+                if table is None:
+                    rendered = [render_pattern(self.sounds[k], duration, self.sample_rate) for k in self.keys]
+                    lengths = np.array([len(r) for r in rendered], dtype=np.int64)
+                    offsets = np.zeros(len(rendered), dtype=np.int64)
+                    np.cumsum(lengths[:-1], out=offsets[1:])
+                    samples = np.ascontiguousarray(np.concatenate(rendered), dtype=np.float32)
+                    table = (samples, offsets, lengths)
+                    self._tables[key] = table
+        return table
+
+    def waveform(self, key, duration):
+        samples, offsets, lengths = self.table(duration)
+        i = self.index[key]
+        return samples[offsets[i]:offsets[i] + lengths[i]]
+
+    def _plan(self, segment):
+        # A segment is (keys, duration, gap_duration) or a block of samples
+        # rendered elsewhere (Robust+ OFDM symbols), placed as it is
+        if isinstance(segment, np.ndarray):
+            return segment
+        return self._segment_plan(*segment)
+
+    def _segment_plan(self, keys, duration, gap_duration):
+        samples, offsets, lengths = self.table(duration)
+        idx = np.fromiter((self.index[k] for k in keys), dtype=np.int64, count=len(keys))
+        gap = int(self.sample_rate * gap_duration)
+        return samples, offsets[idx], lengths[idx], gap
+
+    def frame_length(self, segments):
+        return sum(self._plan_length(self._plan(segment)) for segment in segments)
+
+    @staticmethod
+    def _place(out, pos, plan):
+        # Every symbol in a table has the same length, so a segment is a
+        # (symbols, length + gap) block of out and one row gather fills it.
+        if isinstance(plan, np.ndarray):
+            out[pos:pos + len(plan)] = plan
+            return pos + len(plan)
+        samples, src_offsets, lengths, gap = plan
+        if not len(lengths):
+            return pos
+        length = int(lengths[0])
+        stride = length + gap
+        rows = samples.reshape(-1, length)
+        block = out[pos:pos + stride * len(lengths)].reshape(len(lengths), stride)
+        block[:, :length] = rows[src_offsets // length]
+        return pos + stride * len(lengths)
+
+    @staticmethod
+    def _plan_length(plan):
+        if isinstance(plan, np.ndarray):
+            return len(plan)
+        _, _, lengths, gap = plan
+        return int(lengths.sum()) + gap * len(lengths)
+
+    def render_frame(self, segments, out=None):
+        # segments: iterable of (keys, duration, gap_duration), or sample arrays;
+        # each symbol is followed by gap_duration of silence, exactly like the
+        # old concatenate loops.
+        plans = [self._plan(segment) for segment in segments]
+        total = sum(self._plan_length(plan) for plan in plans)
+        if out is None:
+            out = np.zeros(total, dtype=np.float32)
+        else:
+            out = out[:total]
+            out[:] = 0
+        pos = 0
+        for plan in plans:
+            pos = self._place(out, pos, plan)
+        return out
+
+    def render_frames(self, frames, spacing=0.0):
+        # Many frames (each a list of segments) into one buffer. Frame i is
+        # buffer[starts[i]:starts[i + 1]], followed by `spacing` seconds of silence.
+        space = int(self.sample_rate * spacing)
+        plans = [[self._plan(segment) for segment in segments] for segments in frames]
+        sizes = [sum(self._plan_length(plan) for plan in frame) + space for frame in plans]
+        starts = np.zeros(len(plans) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=starts[1:])
+        out = np.zeros(int(starts[-1]), dtype=np.float32)
+        for start, frame in zip(starts, plans):
+            pos = int(start)
+            for plan in frame:
+                pos = self._place(out, pos, plan)
+        return out, starts
+
+    def iter_frame(self, segments):
+        # Streaming counterpart of render_frame: yields one symbol (then its gap)
+        # at a time, so memory stays at one symbol whatever the frame length.
+        silence = np.zeros(0, dtype=np.float32)
+        for segment in segments:
+            if isinstance(segment, np.ndarray):
+                yield segment
+                continue
+            samples, src_offsets, lengths, gap = self._segment_plan(*segment)
+            if len(silence) < gap:
+                silence = np.zeros(gap, dtype=np.float32)
+            for offset, length in zip(src_offsets, lengths):
+                yield samples[offset:offset + length]
+                if gap:
+                    yield silence[:gap]
+
+    @staticmethod
+    def symbol_segments(symbols, gap_duration):
+        # symbols: sequence of (key, duration) pairs, e.g. Robust+ (freq, duration)
+        return [([key for key, _ in run], duration, gap_duration)
+                for duration, run in ((d, list(g)) for d, g in groupby(symbols, key=lambda s: s[1]))]
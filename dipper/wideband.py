@@ -0,0 +1,183 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.signal import hilbert
+
+from .codec import decode_packet, find_v4_packet
+from .modem import RxEvent
+from .modes import get_mode
+from .sync import PreambleCorrelator, preamble_chirp_rate, shift_frequency
+
+
+def channel_symbols(modem, mode, samples, start=0, count=None, offset=0.0):
+    # Functional form of Modem.channel_symbols
+    return modem.channel_symbols(mode, samples, start, count, offset)
+
+
+def align_ridge(modem, mode, samples, start, offset, span=48, step=8, symbols=24):
+    # The Robust preamble is two chirps of one rate, so it correlates almost
+    # as well a few samples and Hz along its ridge as on the true point, and
+    # a station well off centre is often timed there. The data symbols are
+    # not: slide the first ones along the ridge by up to `span` samples and
+    # return the (start, offset) where they stand out most on one template.
+    sr = modem.sample_rate
+    symbol_samples = int(sr * mode.symbol_duration)
+    period = symbol_samples + int(sr * mode.gap_duration)
+    count = min(symbols, (len(samples) - start - span - symbol_samples) // period + 1)
+    if count < 1 or start < span:
+        return start, offset
+    analytic = hilbert(samples)
+    rate = preamble_chirp_rate(modem.waveforms, mode) / sr
+    best = (-1.0, start, offset)
+    for dt in range(-span, span + 1, step):
+        index = start + dt + period * np.arange(count)[:, None] + np.arange(symbol_samples)
+        off = offset + rate * dt
+        energies = modem.v4_demod.energies(np.real(analytic[index] * np.exp(-2j * np.pi * off * index / sr)))
+        sharpness = np.mean(energies.max(axis=1) / (energies.sum(axis=1) + 1e-12))
+        if sharpness > best[0]:
+            best = (sharpness, start + dt, off)
+    return best[1], best[2]
+
+
+def decode_channel(modem, mode, samples, offset=0.0, start=0):
+    # Decode one packet whose first symbol begins at samples[start], sent with
+    # its tones moved by `offset` Hz; a Robust packet may be followed by
+    # anything up to the end of the samples. Timing comes from the preamble, so each
+    # symbol window is cut directly instead of going through timing recovery;
+    # Robust timing is first settled along the preamble ridge (align_ridge).
+    # Returns (packet_id, text).
+    mode = get_mode(mode)
+    samples = np.asarray(samples, dtype=np.float64)
+    if mode.name == "robust":
+        start, offset = align_ridge(modem, mode, samples, start, offset)
+    symbols, llrs = channel_symbols(modem, mode, samples, start, offset=offset)
+    if symbols is None:
+        return None, None
+    if mode.name == "robust":
+        return find_v4_packet(symbols, llrs, mode.code)[:2]
+    return decode_packet(symbols, mode, llrs)
+
+
+class WidebandDecoder:
+    # Skimmer for one packet mode across the passband: a PreambleCorrelator
+    # spanning +-max_offset Hz finds every preamble at any time and offset,
+    # keeping stations more than guard_hz apart separate, and every packet
+    # found is handed with its offset to a worker pool for decoding, so
+    # stations at different offsets are decoded concurrently instead of the
+    # strongest peak winning.
+
+    def __init__(self, modem, mode, max_offset=500.0, workers=4, threshold=0.1, guard_hz=100.0, executor=None):
+        self.modem = modem
+        self.mode = get_mode(mode)
+        self.correlator = PreambleCorrelator(modem.waveforms, (self.mode.name,), modem.sample_rate, max_offset,
+                                             threshold=threshold, guard_hz=guard_hz)
+        if self.mode.name == "robust":
+            modem.v4_demod  # build the templates before worker threads share them
+        self.margin = int(modem.sample_rate * self.mode.preamble_duration)
+        self.packet_span = modem.packet_span(self.mode)
+        # A match is reported up to a hold and a scan block after its preamble ends
+        c = self.correlator
+        self.history_span = (2 * c.length + c.hold + c.fft_size) * c.decimation + self.margin
+        self._history = np.zeros(0, dtype=np.float32)
+        self._history_start = 0
+        self._pending = []    # PreambleMatch of each packet still waiting for its data
+        self._futures = deque()
+        self._executor = executor or ThreadPoolExecutor(max_workers=workers)
+        self._own_executor = executor is None
+
+    def _trim(self):
+        # Keep history_span samples, and always the preamble of a packet still waiting for data
+        excess = len(self._history) - self.history_span
+        for match in self._pending:
+            excess = min(excess, match.start - self.margin - self._history_start)
+        if excess > 0:
+            self._history = self._history[excess:]
+            self._history_start += excess
+
+    def _bounds(self, match, span):
+        # History slice from a margin before the preamble to a margin after `span`
+        lo = max(match.start - self.margin, self._history_start) - self._history_start
+        return lo, match.end + span + self.margin - self._history_start
+
+    def _span(self, match):
+        # Samples after the preamble that the packet needs, or None while
+        # unknown. Robust+ packets vary in length, so their header is read
+        # first; an unreadable one leaves just the header.
+        if self.mode.name != "robust_plus":
+            return self.packet_span
+        header_span = self.modem.ofdm.frame_length(1)
+        lo, hi = self._bounds(match, header_span)
+        if hi > len(self._history):
+            return None
+        chunk = shift_frequency(self._history[lo:hi], -match.offset, self.modem.sample_rate)
+        header = self.modem.ofdm_header(chunk, match.end - self._history_start - lo)
+        if header is None:
+            return header_span
+        return self.modem.packet_span(self.mode, header[1])
+
+    def _submit_ready(self, final=False):
+        # Decode the packets all of whose audio is in; with final, every
+        # pending one with what audio there is
+        waiting = []
+        for match in self._pending:
+            span = self._span(match)
+            lo, hi = self._bounds(match, span or 0)
+            if not final and (span is None or hi > len(self._history)):
+                waiting.append(match)
+                continue
+            if final:
+                hi = len(self._history) if span is None else min(hi, len(self._history))
+            chunk = self._history[lo:hi].copy()
+            future = self._executor.submit(decode_channel, self.modem, self.mode, chunk, match.offset,
+                                           match.end - self._history_start - lo)
+            self._futures.append((future, match))
+        self._pending = waiting
+
+    def _collect(self, wait=False):
+        events = []
+        while self._futures and (wait or self._futures[0][0].done()):
+            future, match = self._futures.popleft()
+            packet_id, text = future.result()
+            events.append(RxEvent("packet", self.mode.name, text=text, packet_id=packet_id, position=match.end,
+                                  offset=match.offset, snr=match.snr_db))
+        return events
+
+    def _found(self, matches):
+        events = []
+        for match in matches:
+            self._pending.append(match)
+            events.append(RxEvent("preamble", self.mode.name, position=match.end, offset=match.offset,
+                                  snr=match.snr_db))
+        return events
+
+    def push(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        self._history = np.concatenate((self._history, samples))
+        events = self._found(self.correlator.push(samples))
+        self._submit_ready()
+        self._trim()
+        return events + self._collect()
+
+    def flush(self):
+        # End of stream: finish the preambles still being confirmed and
+        # decode every packet found with whatever audio followed it, then
+        # start over
+        events = self._found(self.correlator.flush())
+        self._submit_ready(final=True)
+        events += self._collect(wait=True)
+        self.reset()
+        return events
+
+    def reset(self):
+        self._pending = []
+        self._collect(wait=True)
+        self.correlator.reset()
+        self._history = np.zeros(0, dtype=np.float32)
+        self._history_start = 0
+
+    def close(self):
+        events = self.flush()
+        if self._own_executor:
+            self._executor.shutdown()
+        return events
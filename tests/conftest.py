@@ -0,0 +1,63 @@
+import pytest
+import serial
+
+from dipper.civ import CivFrame, CivParser
+
+RIG = 0x94
+
+
+def frame_bytes(to, source, command, data=b""):
+    return CivFrame(to, source, command, bytes(data)).to_bytes()
+
+
+class FakeRig:
+    # Stands in for serial.Serial: echoes what is written, as the CI-V bus
+    # does, and queues the rig's answers from respond(frame)
+    def __init__(self, respond, fail_writes=0):
+        self.respond = respond
+        self.fail_writes = fail_writes
+        self.is_open = True
+        self.written = []
+        self._parser = CivParser()
+        self._out = bytearray()
+
+    def __call__(self, **kwargs):
+        # used as serial.Serial: every open hands out this one rig
+        self.is_open = True
+        return self
+
+    @property
+    def in_waiting(self):
+        return len(self._out)
+
+    def write(self, data):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise serial.SerialException("device reports readiness to read but returned no data")
+        self.written.append(bytes(data))
+        self._out.extend(data)
+        for frame in self._parser.feed(data):
+            for reply in self.respond(frame):
+                self._out.extend(reply)
+
+    def send(self, data):
+        # Bytes the rig puts on the bus by itself, between exchanges
+        self._out.extend(data)
+
+    def read(self, size):
+        data = bytes(self._out[:size])
+        del self._out[:size]
+        return data
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def rig(monkeypatch):
+    # rig(respond) patches in a FakeRig for serial.Serial and returns it
+    def make(respond, **kwargs):
+        fake = FakeRig(respond, **kwargs)
+        monkeypatch.setattr(serial, "Serial", fake)
+        return fake
+    return make
@@ -0,0 +1,147 @@
+import random
+
+import pytest
+
+from dipper.arq import MAX_WINDOW, ArqFrame, ArqReceiver, ArqSender, fragment
+
+
+def on_air(frame):
+    # What the far end decodes from a frame
+    return ArqFrame.parse(frame.packet_id, frame.text)
+
+
+def run_link(sender, receiver, rng, loss=0.0, ack_loss=0.0, duplicate=0.0, step=3.0, limit=50000):
+    clock = sender.clock
+    received = []
+    while not sender.idle and clock.now < limit:
+        frames = sender.next_over()
+        if not frames:
+            clock.now += 1
+            continue
+        rng.shuffle(frames)
+        for frame in frames:
+            if rng.random() >= loss:
+                received += receiver.on_frame(on_air(frame))
+            if rng.random() < duplicate:
+                received += receiver.on_frame(on_air(frame))
+        clock.now += step
+        ack = receiver.ack()
+        if ack is not None and rng.random() >= ack_loss:
+            sender.on_ack(ArqFrame.parse(None, ack.text))
+    return received
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_fragment_keeps_characters_whole():
+    pieces = fragment("abécdé", 3)
+    assert "".join(pieces) == "abécdé"
+    assert all(len(piece.encode("utf-8")) <= 3 for piece in pieces)
+
+
+@pytest.mark.parametrize("frame", [
+    ArqFrame("data", 5, "hello", first=True, last=False, base=3),
+    ArqFrame("data", 15, "", first=False, last=True, base=12),
+    ArqFrame("ack", 9, bitmap=0x5A),
+])
+def test_frame_round_trip(frame):
+    assert on_air(frame) == frame
+
+
+def test_plain_packet_is_not_a_frame():
+    assert ArqFrame.parse(3, "CQ CQ de TEST") is None
+    assert ArqFrame.parse(None, "") is None
+
+
+def test_resent_frames_after_base_moves_deliver_once():
+    # Both halves arrive, the ACK is lost and the sender resends them with a
+    # newer base: the receiver must not run on past that base and deliver
+    # the message a second time.
+    receiver = ArqReceiver()
+    receiver.on_frame(ArqFrame("data", 0, "A", True, True, base=0))
+    assert receiver.on_frame(ArqFrame("data", 1, "B1", True, False, base=0)) == []
+    assert receiver.on_frame(ArqFrame("data", 2, "B2", False, True, base=0)) == ["B1B2"]
+    assert receiver.on_frame(ArqFrame("data", 1, "B1", True, False, base=1)) == []
+    assert receiver.on_frame(ArqFrame("data", 2, "B2", False, True, base=1)) == []
+    assert receiver.base == 3
+    assert receiver.duplicates == 2
+
+
+def test_base_jump_onto_buffered_frame_stops_there():
+    # The lost seq 0 frame is given up; seq 1 and 2 are already buffered
+    receiver = ArqReceiver()
+    assert receiver.on_frame(ArqFrame("data", 1, "B1", True, False, base=0)) == []
+    assert receiver.on_frame(ArqFrame("data", 2, "B2", False, True, base=0)) == []
+    assert receiver.on_frame(ArqFrame("data", 1, "B1", True, False, base=1)) == ["B1B2"]
+    assert receiver.base == 3
+    assert receiver.on_frame(ArqFrame("data", 2, "B2", False, True, base=1)) == []
+
+
+def test_gap_given_up_drops_only_that_message():
+    receiver = ArqReceiver()
+    receiver.on_frame(ArqFrame("data", 0, "A1", True, False, base=0))
+    # seq 1, the end of A, never comes; B starts at seq 2 once A is given up
+    assert receiver.on_frame(ArqFrame("data", 2, "B", True, True, base=2)) == ["B"]
+    assert receiver.messages_dropped == 1
+
+
+def test_ack_reports_held_frames():
+    receiver = ArqReceiver()
+    receiver.on_frame(ArqFrame("data", 0, "A", True, True, base=0))
+    receiver.on_frame(ArqFrame("data", 2, "C", True, True, base=0))
+    ack = receiver.ack()
+    assert (ack.seq, ack.bitmap) == (1, 0b1)
+
+
+def test_sender_window_and_ack():
+    clock = FakeClock()
+    sender = ArqSender(window=3, fragment_size=4, clock=clock)
+    sender.send("0123456789abcdef")
+    frames = sender.next_over()
+    assert [f.seq for f in frames] == [0, 1, 2]
+    results = sender.on_ack(ArqFrame("ack", 1, bitmap=0b1))   # holds 0 and 2
+    assert [(f.seq, ok) for f, ok in results] == [(0, True), (1, False), (2, True)]
+    assert [f.seq for f in sender.next_over()] == [1, 3]
+
+
+def test_sender_rejects_oversized_window():
+    with pytest.raises(ValueError):
+        ArqSender(window=MAX_WINDOW + 1)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_lossy_link_delivers_each_message_once_in_order(seed):
+    # Enough traffic to wrap the sequence space many times
+    rng = random.Random(seed)
+    clock = FakeClock()
+    sender = ArqSender(window=4, fragment_size=10, timeout=10, max_tries=50, clock=clock)
+    receiver = ArqReceiver()
+    messages = [f"message {i} " + "x" * rng.randint(0, 40) for i in range(30)]
+    for message in messages:
+        sender.send(message)
+    loss = rng.choice([0.0, 0.1, 0.3, 0.5])
+    received = run_link(sender, receiver, rng, loss, loss / 2, duplicate=0.1)
+    assert received == messages
+    assert sender.messages_delivered == len(messages)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_give_up_never_duplicates_or_reorders(seed):
+    rng = random.Random(seed)
+    clock = FakeClock()
+    sender = ArqSender(window=rng.choice([4, 8]), fragment_size=8, timeout=5, max_tries=2, clock=clock)
+    receiver = ArqReceiver()
+    messages = [f"m{i} " + "y" * rng.randint(0, 30) for i in range(40)]
+    for message in messages:
+        sender.send(message)
+    received = run_link(sender, receiver, rng, loss=0.55, ack_loss=0.3, duplicate=0.1, step=6.0, limit=1e6)
+    assert sender.idle
+    assert len(received) == len(set(received))
+    assert received == [m for m in messages if m in received]
+    assert sender.messages_delivered + sender.messages_failed == len(messages)
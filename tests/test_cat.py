@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+from conftest import RIG, frame_bytes
+
+from dipper.cat import CatPoller, CatState, bcd_to_int, s_units
+from dipper.civ import CONTROLLER, CivError, CivFrame, CivSession
+
+FREQ_14078 = b"\x00\x80\x07\x14\x00"     # 14.078.000 Hz, least significant byte first
+
+
+class FakeSession:
+    # CivSession.pipeline answering from a list of canned reply lists
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.requests = []
+        self.on_unsolicited = None
+
+    def pipeline(self, requests, timeout=None):
+        self.requests.append(requests)
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def reply(command, data):
+    return CivFrame(CONTROLLER, RIG, command, data)
+
+
+@pytest.mark.parametrize("data, little_endian, value", [
+    (FREQ_14078, True, 14_078_000),
+    (b"\x00\x00\x50\x70\x04", True, 470_500_000),
+    (b"\x01\x20", False, 120),
+    (b"\x02\x41", False, 241),
+    (b"", True, 0),
+])
+def test_bcd_to_int(data, little_endian, value):
+    assert bcd_to_int(data, little_endian) == value
+
+
+@pytest.mark.parametrize("level, text", [(0, "S0"), (40, "S3"), (120, "S9"), (181, "S9+30"), (241, "S9+60"),
+                                         (255, "S9+60")])
+def test_s_units(level, text):
+    assert s_units(level) == text
+
+
+def test_dial():
+    assert CatState().dial == ""
+    assert CatState(frequency_hz=14_078_000).dial == "14.078.000"
+    assert CatState(frequency_hz=7_074_500, mode="USB").dial == "7.074.500 USB"
+
+
+def test_poll_reads_frequency_mode_and_meter():
+    session = FakeSession([reply(0x03, FREQ_14078), reply(0x04, b"\x01\x02"), reply(0x15, b"\x02\x01\x20")])
+    updates = []
+    poller = CatPoller(session, on_update=updates.append, clock=lambda: 50.0)
+    state = poller.poll()
+    assert (state.frequency_hz, state.mode, state.filter, state.s_meter) == (14_078_000, "USB", 2, 120)
+    assert (state.frequency_time, state.mode_time, state.s_meter_time) == (50.0, 50.0, 50.0)
+    assert state.error is None
+    assert updates == [state]
+    assert session.requests == [[(0x03, b""), (0x04, b""), (0x15, b"\x02")]]
+
+
+def test_poll_keeps_last_values_for_unanswered_reads():
+    session = FakeSession([reply(0x03, FREQ_14078), reply(0x04, b"\x22"), reply(0x15, b"\x02\x01\x20")],
+                          [None, reply(0x04, b"\x7f"), None])
+    times = iter([1.0, 2.0])
+    poller = CatPoller(session, clock=lambda: next(times))
+    poller.poll()
+    state = poller.poll()
+    assert (state.frequency_hz, state.frequency_time) == (14_078_000, 1.0)
+    assert (state.mode, state.filter, state.mode_time) == ("7F", None, 2.0)
+    assert (state.s_meter, state.s_meter_time) == (120, 1.0)
+    assert poller.polls == 2
+
+
+def test_poll_error_is_published():
+    session = FakeSession([reply(0x03, FREQ_14078), None, None], CivError("No answer from rig 94 to command 03."))
+    poller = CatPoller(session, clock=lambda: 0.0)
+    poller.poll()
+    state = poller.poll()
+    assert state.error == "No answer from rig 94 to command 03."
+    assert state.frequency_hz == 14_078_000
+    assert poller.polls == 1
+
+
+def test_transceive_broadcasts_update_state():
+    session = FakeSession([None, None, None])
+    updates = []
+    poller = CatPoller(session, on_update=updates.append, clock=lambda: 7.0)
+    session.on_unsolicited(CivFrame(0x00, RIG, 0x00, b"\x00\x50\x07\x14\x00"))
+    session.on_unsolicited(CivFrame(0x00, RIG, 0x01, b"\x00\x01"))
+    session.on_unsolicited(CivFrame(0x00, RIG, 0x1C, b"\x00"))
+    assert [u.dial for u in updates] == ["14.075.000", "14.075.000 LSB"]
+    assert poller.state.frequency_time == 7.0
+
+
+def test_broadcast_between_polls_reaches_the_poller(rig):
+    dial = {"freq": FREQ_14078, "mode": b"\x01\x02"}
+
+    def respond(frame):
+        answers = {0x03: dial["freq"], 0x04: dial["mode"], 0x15: b"\x02\x01\x20"}
+        return [frame_bytes(CONTROLLER, RIG, frame.command, answers[frame.command])]
+    fake = rig(respond)
+    updates = []
+    poller = CatPoller(CivSession("COM1", 9600, RIG, timeout=0.2), on_update=updates.append)
+    poller.poll()
+    # The operator turns the dial to 14.075 MHz, LSB between polls
+    dial.update(freq=b"\x00\x50\x07\x14\x00", mode=b"\x00\x01")
+    fake.send(frame_bytes(0x00, RIG, 0x00, dial["freq"]) + frame_bytes(0x00, RIG, 0x01, dial["mode"]))
+    poller.poll()
+    assert [u.dial for u in updates] == ["14.078.000 USB", "14.075.000 USB", "14.075.000 LSB", "14.075.000 LSB"]
+
+
+def test_background_polling_pauses_and_stops():
+    polled = threading.Event()
+
+    class Session(FakeSession):
+        def pipeline(self, requests, timeout=None):
+            polled.set()
+            return super().pipeline(requests, timeout)
+
+    poller = CatPoller(Session([reply(0x03, FREQ_14078), None, None]), interval=0.01)
+    poller.pause()
+    poller.start()
+    assert not polled.wait(0.1)
+    poller.resume()
+    assert polled.wait(2.0)
+    poller.stop()
+    assert poller.state.frequency_hz == 14_078_000
@@ -0,0 +1,123 @@
+import pytest
+from conftest import RIG, frame_bytes
+
+from dipper.civ import ACK, CONTROLLER, NAK, CivError, CivFrame, CivParser, CivSession
+
+
+def answer_ack(frame):
+    return [frame_bytes(CONTROLLER, RIG, ACK)]
+
+
+def test_frame_round_trip():
+    frame = CivFrame(RIG, CONTROLLER, 0x1C, b"\x00\x01")
+    assert frame.to_bytes() == bytes.fromhex("FEFE94E01C0001FD")
+    assert CivParser().feed(frame.to_bytes()) == [frame]
+
+
+def test_parser_reassembles_split_frames():
+    parser = CivParser()
+    data = b"\x00\x13" + frame_bytes(CONTROLLER, RIG, 0x03, b"\x00\x80\x07\x14\x00") + frame_bytes(CONTROLLER, RIG, ACK)
+    frames = []
+    for i in range(len(data)):
+        frames += parser.feed(data[i:i + 1])
+    assert frames == [CivFrame(CONTROLLER, RIG, 0x03, b"\x00\x80\x07\x14\x00"), CivFrame(CONTROLLER, RIG, ACK)]
+    assert parser.dropped == 0
+
+
+def test_parser_accepts_extra_preamble_bytes():
+    assert CivParser().feed(b"\xfe\xfe\xfe\xe0\x94\xfb\xfd") == [CivFrame(CONTROLLER, RIG, ACK)]
+
+
+def test_parser_drops_collisions_and_cut_frames():
+    parser = CivParser()
+    collided = b"\xfe\xfe\xe0\x94\xfc\xfd"
+    cut = b"\xfe\xfe\xe0\x94\x03\x00"
+    good = frame_bytes(CONTROLLER, RIG, NAK)
+    assert parser.feed(collided + cut + good) == [CivFrame(CONTROLLER, RIG, NAK)]
+    assert parser.dropped == 2
+
+
+def test_request_skips_echo_and_passes_on_broadcasts(rig):
+    def respond(frame):
+        broadcast = frame_bytes(0x00, RIG, 0x00, b"\x00\x50\x07\x14\x00")
+        return [broadcast, frame_bytes(CONTROLLER, RIG, 0x03, b"\x00\x80\x07\x14\x00")]
+    rig(respond)
+    heard = []
+    session = CivSession("COM1", 9600, RIG, timeout=0.2, on_unsolicited=heard.append)
+    reply = session.request(0x03)
+    assert reply == CivFrame(CONTROLLER, RIG, 0x03, b"\x00\x80\x07\x14\x00")
+    assert heard == [CivFrame(0x00, RIG, 0x00, b"\x00\x50\x07\x14\x00")]
+
+
+def test_port_is_kept_open_between_requests(rig):
+    fake = rig(answer_ack)
+    session = CivSession("COM1", 9600, RIG, timeout=0.2)
+    session.ptt(True)
+    session.ptt(False)
+    assert session.is_open
+    assert fake.written == [frame_bytes(RIG, CONTROLLER, 0x1C, b"\x00\x01"),
+                            frame_bytes(RIG, CONTROLLER, 0x1C, b"\x00\x00")]
+    stats = session.ptt_stats()
+    assert (stats.reconnects, stats.errors) == (0, 0)
+    assert 0 <= stats.keyup_last <= stats.keyup_max
+
+
+def test_nak_raises(rig):
+    rig(lambda frame: [frame_bytes(CONTROLLER, RIG, NAK)])
+    session = CivSession("COM1", 9600, RIG, timeout=0.2)
+    with pytest.raises(CivError, match="refused"):
+        session.request(0x1C, b"\x00\x01")
+    assert session.errors == 1
+
+
+def test_silent_rig_raises_after_reconnecting(rig):
+    rig(lambda frame: [])
+    session = CivSession("COM1", 9600, RIG, timeout=0.05, retries=1)
+    with pytest.raises(CivError, match="No answer"):
+        session.request(0x03)
+    assert (session.reconnects, session.errors) == (1, 1)
+
+
+def test_port_error_reconnects(rig):
+    rig(answer_ack, fail_writes=1)
+    session = CivSession("COM1", 9600, RIG, timeout=0.2, retries=1)
+    assert session.request(0x1C, b"\x00\x00").command == ACK
+    assert session.reconnects == 1
+    assert session.errors == 0
+
+
+def test_pipeline_matches_replies_to_requests(rig):
+    def respond(frame):
+        if frame.command == 0x03:
+            return [frame_bytes(CONTROLLER, RIG, 0x03, b"\x00\x80\x07\x14\x00")]
+        if frame.command == 0x15:
+            return [frame_bytes(CONTROLLER, RIG, NAK)]
+        return [frame_bytes(CONTROLLER, RIG, 0x04, b"\x01\x02")]
+    rig(respond)
+    session = CivSession("COM1", 9600, RIG, timeout=0.2)
+    freq, mode, meter = session.pipeline([(0x03, b""), (0x04, b""), (0x15, b"\x02")])
+    assert freq.data == b"\x00\x80\x07\x14\x00"
+    assert mode.data == b"\x01\x02"
+    assert meter is None
+
+
+def test_broadcasts_between_exchanges_are_passed_on(rig):
+    fake = rig(answer_ack)
+    heard = []
+    session = CivSession("COM1", 9600, RIG, timeout=0.2, on_unsolicited=heard.append)
+    session.ptt(True)
+    # The dial moves while nothing is being asked, and a late FB turns up
+    fake.send(frame_bytes(0x00, RIG, 0x00, b"\x00\x50\x07\x14\x00") + frame_bytes(CONTROLLER, RIG, ACK))
+    assert heard == []
+    session.ptt(False)
+    assert heard == [CivFrame(0x00, RIG, 0x00, b"\x00\x50\x07\x14\x00")]
+
+
+def test_stale_answer_is_not_taken_for_the_next_reply(rig):
+    fake = rig(lambda frame: [frame_bytes(CONTROLLER, RIG, NAK)])
+    session = CivSession("COM1", 9600, RIG, timeout=0.2)
+    with pytest.raises(CivError):
+        session.request(0x1C, b"\x00\x01")
+    fake.send(frame_bytes(CONTROLLER, RIG, ACK))
+    with pytest.raises(CivError, match="refused"):
+        session.request(0x1C, b"\x00\x01")
@@ -0,0 +1,29 @@
+import pytest
+
+from dipper.codec import (OFDM_MAX_BYTES, ROBUST_MAX_BYTES, decode_v4_packet, encode_ofdm_packet, encode_v4_packet,
+                          find_v4_packet)
+
+
+def test_longest_robust_packet_round_trips():
+    text = "X" * ROBUST_MAX_BYTES
+    symbols = encode_v4_packet(text, 5)
+    assert find_v4_packet(symbols) == (5, text, len(symbols))
+
+
+def test_robust_packet_too_long():
+    with pytest.raises(ValueError, match="at most 32 bytes"):
+        encode_v4_packet("X" * (ROBUST_MAX_BYTES + 1), 0)
+    with pytest.raises(ValueError):
+        encode_v4_packet("é" * (ROBUST_MAX_BYTES // 2 + 1), 0)   # counted in UTF-8 bytes
+
+
+def test_robust_plus_packet_too_long():
+    with pytest.raises(ValueError):
+        encode_ofdm_packet("X" * (OFDM_MAX_BYTES + 1), 0)
+
+
+def test_crc_symbols_that_sound_alike_still_match():
+    # 'H' and 'O' are the same tone, so a receiver hears every 'O' as 'H'
+    for text in ("TEST ONE", "HELLO"):
+        heard = ["H" if s == "O" else s for s in encode_v4_packet(text, 1)]
+        assert decode_v4_packet(heard) == (1, text)
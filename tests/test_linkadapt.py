@@ -0,0 +1,100 @@
+import math
+
+import pytest
+
+from dipper.linkadapt import RATES, LinkAdapter, receive_codes
+from dipper.modem import Modem
+
+
+@pytest.fixture(scope="module")
+def modem():
+    return Modem()
+
+
+def drop_to(adapter, peer, index):
+    # NACK at the current rate until the adapter has fallen to rates[index]
+    while adapter.select(peer) is not RATES[index]:
+        adapter.report_ack(peer, adapter.select(peer), False)
+
+
+def test_faster_rates_move_more_bits(modem):
+    adapter = LinkAdapter(modem)
+    bit_rates = [adapter.bit_rates[r.name] for r in RATES]
+    assert bit_rates == sorted(bit_rates)
+
+
+def test_low_snr_selects_slowest_rate(modem):
+    adapter = LinkAdapter(modem)
+    adapter.report_snr("P", -9.0)
+    assert adapter.select("P") is RATES[0]
+
+
+def test_report_snr_ignores_missing_values(modem):
+    adapter = LinkAdapter(modem)
+    adapter.report_snr("P", 12.0)
+    adapter.report_snr("P", None)
+    adapter.report_snr("P", math.nan)
+    assert adapter.status("P").snr_db == 12.0
+
+
+def test_nacks_in_a_row_drop_one_rate(modem):
+    adapter = LinkAdapter(modem, drop_after=2)
+    adapter.report_snr("P", 30.0)
+    top = adapter.select("P")
+    adapter.report_ack("P", top, False)
+    adapter.report_ack("P", top, False)
+    assert adapter.select("P") is RATES[RATES.index(top) - 1]
+
+
+def test_backoff_keeps_growing_across_rate_drops(modem):
+    adapter = LinkAdapter(modem, drop_after=2, backoff=0.5, max_backoff=8.0)
+    adapter.report_snr("P", 30.0)
+    delays = []
+    for _ in range(6):
+        adapter.report_ack("P", adapter.select("P"), False)
+        delays.append(adapter.retry_delay("P"))
+    assert delays == [0.5, 1.0, 2.0, 4.0, 8.0, 8.0]
+    assert adapter.status("P").failures == 6
+    adapter.report_ack("P", adapter.select("P"), True)
+    assert adapter.retry_delay("P") == 0.0
+
+
+def test_dropped_rate_is_held_until_acks_return(modem):
+    adapter = LinkAdapter(modem, drop_after=2, recover_after=3)
+    adapter.report_snr("P", 30.0)
+    drop_to(adapter, "P", 2)
+    assert adapter.status("P").ceiling == RATES[2].name
+    # The SNR still says the faster rates work, but they just failed
+    for _ in range(2):
+        adapter.report_ack("P", adapter.select("P"), True)
+        assert adapter.select("P") is RATES[2]
+    adapter.report_ack("P", adapter.select("P"), True)
+    assert adapter.status("P").ceiling == RATES[3].name
+    for _ in range(3):
+        adapter.report_ack("P", adapter.select("P"), True)
+    assert adapter.status("P").ceiling is None
+
+
+def test_nack_restarts_the_hold(modem):
+    adapter = LinkAdapter(modem, drop_after=2, recover_after=3)
+    adapter.report_snr("P", 30.0)
+    drop_to(adapter, "P", 2)
+    for ok in (True, True, False, True, True):
+        adapter.report_ack("P", RATES[2], ok)
+    assert adapter.status("P").ceiling == RATES[2].name
+    adapter.report_ack("P", RATES[2], True)
+    assert adapter.status("P").ceiling == RATES[3].name
+
+
+def test_reset_forgets_peer(modem):
+    adapter = LinkAdapter(modem)
+    adapter.report_snr("P", 30.0)
+    drop_to(adapter, "P", 1)
+    adapter.reset("P")
+    status = adapter.status("P")
+    assert (status.snr_db, status.failures, status.ceiling) == (None, 0, None)
+
+
+def test_receive_codes_follow_the_ladder():
+    assert receive_codes("robust") == ["v4", "k7", "k7-3/4"]
+    assert receive_codes("robust_plus") == ["k7", "k7-2/3", "k7-3/4"]
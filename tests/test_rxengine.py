@@ -0,0 +1,48 @@
+import numpy as np
+from scipy.signal import butter, sosfilt
+
+from dipper.modem import Modem, ModemReceiver
+from dipper.rxengine import SymbolTimingRecovery
+
+PERIOD = 100
+HOP = 20
+
+
+def hops(count):
+    return np.arange(count) * HOP
+
+
+def test_symbols_follow_the_energy_peaks():
+    positions = hops(50)
+    envelope = np.where(positions % PERIOD == 40, 100.0, 5.0)
+    emit = SymbolTimingRecovery(PERIOD, HOP).update(positions, envelope, np.ones(len(positions)))
+    assert set(positions[emit] % PERIOD) == {40}
+    assert emit.sum() >= 8
+
+
+def test_nothing_emitted_below_the_noise_floor():
+    rng = np.random.default_rng(0)
+    positions = hops(500)
+    noise = rng.exponential(1.0, len(positions))
+    envelope = rng.uniform(2.0, 6.0, len(positions))
+    timing = SymbolTimingRecovery(PERIOD, HOP, threshold=10.0)
+    assert not timing.update(positions, envelope, noise).any()
+    # and a symbol well above it still gets through
+    burst = np.where(positions % PERIOD == 0, 50.0, 1.0)
+    assert timing.update(positions + positions[-1] + HOP, burst, np.ones(len(positions))).any()
+
+
+def test_silence_emits_nothing():
+    positions = hops(50)
+    zeros = np.zeros(len(positions))
+    assert not SymbolTimingRecovery(PERIOD, HOP).update(positions, zeros, zeros).any()
+
+
+def test_normal_mode_ignores_silence_and_noise():
+    modem = Modem()
+    receiver = ModemReceiver(modem, "normal")
+    assert receiver.push(np.zeros(44100 * 3, dtype=np.float32)) == []
+    band = butter(4, [300, 2700], btype="band", fs=44100, output="sos")
+    noise = sosfilt(band, np.random.default_rng(1).normal(0, 0.1, 44100 * 5)).astype(np.float32)
+    text = "".join(event.text for event in ModemReceiver(modem, "normal").push(noise))
+    assert len(text) <= 3
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from dipper.txqueue import TX_ACK, TX_NEW, TX_RETRANSMIT, TxScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def drain(queue):
+    items = []
+    while True:
+        item = queue.get(timeout=0)
+        if item is None:
+            return items
+        items.append(item)
+
+
+def test_most_urgent_first_then_oldest():
+    queue = TxScheduler(clock=FakeClock())
+    queue.put("new 1", TX_NEW)
+    queue.put("retransmit", TX_RETRANSMIT)
+    queue.put("new 2", TX_NEW)
+    queue.put("ack", TX_ACK)
+    assert len(queue) == 4
+    assert drain(queue) == ["ack", "retransmit", "new 1", "new 2"]
+    assert len(queue) == 0
+
+
+def test_delayed_item_waits_until_due():
+    clock = FakeClock()
+    queue = TxScheduler(clock=clock)
+    queue.put("check", TX_RETRANSMIT, delay=5.0)
+    queue.put("new", TX_NEW)
+    assert drain(queue) == ["new"]
+    clock.now += 4.9
+    assert queue.get(timeout=0) is None
+    clock.now += 0.6
+    assert queue.get(timeout=0) == "check"
+    stats = queue.stats()
+    assert stats.max_wait["retransmit"] == pytest.approx(0.5)
+    assert stats.sent == {"ack": 0, "retransmit": 1, "new": 1}
+
+
+def test_due_item_outranks_older_less_urgent_one():
+    clock = FakeClock()
+    queue = TxScheduler(clock=clock)
+    queue.put("new", TX_NEW)
+    queue.put("ack", TX_ACK, delay=1.0)
+    clock.now += 1.0
+    assert drain(queue) == ["ack", "new"]
+
+
+def test_key_replaces_waiting_item():
+    clock = FakeClock()
+    queue = TxScheduler(clock=clock)
+    queue.put("ack 1", TX_ACK, delay=2.0, key="ack")
+    queue.put("ack 2", TX_ACK, key="ack")
+    assert len(queue) == 1
+    clock.now += 2.0
+    assert drain(queue) == ["ack 2"]
+    # Once sent, the key is free again
+    queue.put("ack 3", TX_ACK, key="ack")
+    assert drain(queue) == ["ack 3"]
+
+
+def test_cancel():
+    queue = TxScheduler(clock=FakeClock())
+    queue.put("check", TX_RETRANSMIT, delay=1.0, key="arq")
+    assert queue.cancel("arq")
+    assert not queue.cancel("arq")
+    assert len(queue) == 0
+    assert queue.stats().depth["retransmit"] == 0
+
+
+def test_unknown_priority():
+    with pytest.raises(ValueError):
+        TxScheduler().put("x", priority=7)
+
+
+def test_clear_empties_and_reopens():
+    queue = TxScheduler(clock=FakeClock())
+    queue.put("a")
+    queue.put("b", delay=1.0, key="b")
+    queue.close()
+    queue.clear()
+    assert len(queue) == 0
+    queue.put("c", key="b")
+    assert drain(queue) == ["c"]
+
+
+def test_put_wakes_blocked_get():
+    queue = TxScheduler()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(queue.get(timeout=5.0)))
+    thread.start()
+    queue.put("ack", TX_ACK)
+    thread.join(5.0)
+    assert result == ["ack"]
+
+
+def test_close_releases_blocked_get():
+    queue = TxScheduler()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(queue.get()))
+    thread.start()
+    queue.close()
+    thread.join(5.0)
+    assert not thread.is_alive()
+    assert result == [None]